@@ -5,6 +5,7 @@ import torch.nn.functional as F
 import math
 import networkx as nx
 import os
+from methods.graph_csr import GraphCSR
 
 
 class Maxcut:
@@ -18,29 +19,11 @@ class Maxcut:
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 
     def get_data_list(self,filename):
-        with open(filename, 'r') as file:
-            lines = []
-            line = file.readline()  # 读取第一行
-            while line is not None and line != '':
-                if '//' not in line:
-                    lines.append(line)
-                line = file.readline()  # 读取下一行
-            # lines = file.readlines()
-            lines = [[int(i1) for i1 in i0.split()] for i0 in lines]
-        num_nodes, num_edges = lines[0]
-        g = nx.Graph()
-        nodes = list(range(num_nodes))
-        g.add_nodes_from(nodes)
-        for item in lines[1:]:
-            g.add_edge(item[0] - 1, item[1] - 1, weight=item[2])
-        edge_from = torch.zeros((self.num_instances,num_edges,), dtype=torch.int32, device=torch.device('cuda' if torch.cuda.is_available() else 'cpu'))
-        edge_to = torch.zeros((self.num_instances,num_edges,), dtype=torch.int32, device=torch.device('cuda' if torch.cuda.is_available() else 'cpu'))
-        edge_weight = torch.zeros((self.num_instances,num_edges,), dtype=torch.int32, device=torch.device('cuda' if torch.cuda.is_available() else 'cpu'))
-        for i, e in enumerate(g.edges(data=True)):
-            x, y = e[0], e[1]
-            edge_from[0][i] = x
-            edge_to[0][i] = y
-            edge_weight[0][i] = e[2]['weight']
+        graph = GraphCSR.from_txt(filename)
+        edge_from, edge_to, edge_weight = graph.edge_tensors()
+        edge_from = edge_from[None, :].to(self.device)
+        edge_to = edge_to[None, :].to(self.device)
+        edge_weight = edge_weight[None, :].to(torch.int32).to(self.device)
 
         tensor_dict = {
                             'edge_from': edge_from,
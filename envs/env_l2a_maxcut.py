@@ -1,5 +1,11 @@
+import hashlib
+import mmap
+import numpy as np
 import torch as th
+from collections import OrderedDict
+from typing import Union
 from methods.config import  GraphList
+from methods.graph_csr import GraphCSR
 from methods.L2A.maxcut_simulator import SimulatorMaxcut
 from methods.L2A.maxcut_local_search import SolverLocalSearch
 
@@ -51,23 +57,133 @@ def metropolis_hastings_sampling(probs: TEN, start_xs: TEN, num_repeats: int, nu
     return xs
 
 
+def hash_graph(graph_list: Union[GraphList, GraphCSR], device=th.device('cpu')) -> str:
+    """图的标识：边列表（节点、节点、权重）的哈希值加上 device。空的 graph_list 表示 SimulatorMaxcut 的默认图"""
+    hasher = hashlib.sha1()
+    if isinstance(graph_list, GraphCSR):
+        hasher.update(np.int64(graph_list.num_nodes).tobytes())
+        for ary in (graph_list.edge_n0s, graph_list.edge_n1s, graph_list.edge_weights):
+            hasher.update(np.ascontiguousarray(ary, dtype=np.float64).tobytes())
+    elif graph_list:
+        hasher.update(np.asarray(graph_list, dtype=np.float64).tobytes())
+    else:
+        hasher.update(b'max_cut')
+    return f"{hasher.hexdigest()}_{device}"
+
+
+def is_memmap_array(ary: np.ndarray) -> bool:
+    """ary 或者它的 base 是 np.memmap（例如 mode='c' 读取的 GraphCSR 缓存），由文件映射，不是常驻内存"""
+    while isinstance(ary, np.ndarray):
+        if isinstance(ary, np.memmap):
+            return True
+        ary = ary.base
+    return isinstance(ary, mmap.mmap)
+
+
+def calc_tensor_bytes(obj, data_ptrs: set) -> int:
+    """
+    张量（包括稀疏张量、张量的 list、GraphCSR 的数组）占用的内存，共享同一块存储的 view 只计算一次。
+    numpy 数组与 th.from_numpy 得到的张量共享内存，用同一个 data_ptrs 去重；memmap 的数组不计算
+    """
+    if isinstance(obj, (list, tuple)):
+        return sum(calc_tensor_bytes(item, data_ptrs) for item in obj)
+    if isinstance(obj, GraphCSR):
+        return sum(calc_tensor_bytes(item, data_ptrs) for item in vars(obj).values())
+    if isinstance(obj, np.ndarray):
+        data_ptr = obj.__array_interface__['data'][0]
+        if data_ptr in data_ptrs:
+            return 0
+        data_ptrs.add(data_ptr)
+        return 0 if is_memmap_array(obj) else obj.nbytes
+    if not isinstance(obj, TEN):
+        return 0
+    if obj.is_sparse:
+        return calc_tensor_bytes(obj._indices(), data_ptrs) + calc_tensor_bytes(obj._values(), data_ptrs)
+    storage = obj.untyped_storage()
+    if storage.data_ptr() in data_ptrs:
+        return 0
+    data_ptrs.add(storage.data_ptr())
+    return storage.nbytes()
+
+
+class SimulatorCache:
+    """
+    按图缓存建立好的 SimulatorMaxcut，重复 reset 同一个图时不需要重新建立邻接索引和张量。
+    - key: hash_graph(graph_list, device)
+    - LRU：超过 max_size 个模拟器，或者占用的内存超过 max_bytes 时，淘汰最久没有使用的模拟器
+    - memory_bytes 每次重新统计，包括之后才建立的 adjacency_bool
+    """
+
+    def __init__(self, max_size: int = 8, max_bytes: int = 2 ** 30):
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.simulators = OrderedDict()
+        self.num_hits = 0
+        self.num_misses = 0
+
+    def get(self, graph_list: Union[GraphList, GraphCSR] = (), device=th.device('cpu')) -> SimulatorMaxcut:
+        key = hash_graph(graph_list, device)
+        if key in self.simulators:
+            self.simulators.move_to_end(key)
+            self.num_hits += 1
+            return self.simulators[key]
+        self.num_misses += 1
+        simulator = SimulatorMaxcut(graph_list=graph_list, device=device)
+        self.simulators[key] = simulator
+        self.shrink(keep_key=key)
+        return simulator
+
+    def shrink(self, keep_key: str = None):
+        """淘汰最久没有使用的模拟器，直到数量和内存都不超过上限。keep_key 是刚刚使用的模拟器，不淘汰"""
+        while len(self.simulators) > self.max_size or (len(self.simulators) > 1 and self.memory_bytes > self.max_bytes):
+            key = next(iter(self.simulators))
+            if key == keep_key:
+                break
+            self.evict(key)
+
+    def evict(self, key: str):
+        self.simulators.pop(key, None)
+
+    def clear(self):
+        self.simulators.clear()
+
+    @staticmethod
+    def calc_simulator_bytes(simulator: SimulatorMaxcut) -> int:
+        data_ptrs = set()
+        # 先统计 numpy 数组，所以与 memmap 共享内存的张量也不计算
+        values = sorted(vars(simulator).values(), key=lambda value: not isinstance(value, (GraphCSR, np.ndarray)))
+        return sum(calc_tensor_bytes(value, data_ptrs) for value in values)
+
+    @property
+    def memory_bytes(self) -> int:
+        return sum(self.calc_simulator_bytes(simulator) for simulator in self.simulators.values())
+
+    def __len__(self):
+        return len(self.simulators)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.simulators
+
+
 class MCMC_Maxcut:
     def __init__(self, num_nodes: int, num_sims: int, num_repeats: int, num_searches: int,
-                 graph_list: GraphList = (), device=th.device('cpu')):
+                 graph_list: GraphList = (), device=th.device('cpu'), simulator_cache: SimulatorCache = None):
         self.num_nodes = num_nodes
         self.num_sims = num_sims
         self.num_repeats = num_repeats
         self.num_searches = num_searches
         self.device = device
         self.sim_ids = th.arange(num_sims, device=device)
+        self.simulator_cache = SimulatorCache() if simulator_cache is None else simulator_cache
 
         # build in reset
-        self.simulator = SimulatorMaxcut(graph_list=graph_list, device=self.device)  # 初始值
+        self.simulator = self.simulator_cache.get(graph_list=graph_list, device=self.device)  # 初始值
         self.searcher = SolverLocalSearch(simulator=self.simulator, num_nodes=self.num_nodes)
 
     # 如果end to end, graph_list为空元组。如果distribution, 抽样赋值
+    # 同一个图的模拟器从 simulator_cache 中取出，reset 只重新生成随机的解
     def reset(self, graph_list: GraphList = ()):
-        self.simulator = SimulatorMaxcut(graph_list=graph_list, device=self.device)
+        self.simulator = self.simulator_cache.get(graph_list=graph_list, device=self.device)
         self.searcher = SolverLocalSearch(simulator=self.simulator, num_nodes=self.num_nodes)
         self.searcher.reset(xs=self.simulator.generate_xs_randomly(num_sims=self.num_sims))
 
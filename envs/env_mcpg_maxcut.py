@@ -42,8 +42,10 @@ def metro_sampling(probs, start_status, max_transfer_time, device=None):
     return samples.float().to(device)
 
 def obj(xs_sample, total_mcmc_num, repeat_times, data, device):
+    # sum of w_ij * s_i * s_j over the edges, where s = 2 * x - 1. The weights are 1 without data.edge_weight
     n0s_tensor = data.edge_index[0]
     n1s_tensor = data.edge_index[1]
+    edge_weight = getattr(data, 'edge_weight', None)
     xs_loc_sample = xs_sample.clone()
     expected_cut = th.empty(total_mcmc_num * repeat_times, dtype=th.float32, device=device)
     for j in range(repeat_times):
@@ -52,7 +54,10 @@ def obj(xs_sample, total_mcmc_num, repeat_times, data, device):
 
         nlr_probs = 2 * xs_loc_sample[n0s_tensor.type(th.long), j0:j1] - 1
         nlc_probs = 2 * xs_loc_sample[n1s_tensor.type(th.long), j0:j1] - 1
-        expected_cut[j0:j1] = (nlr_probs * nlc_probs).sum(dim=0)
+        if edge_weight is None:
+            expected_cut[j0:j1] = (nlr_probs * nlc_probs).sum(dim=0)
+        else:
+            expected_cut[j0:j1] = edge_weight @ (nlr_probs * nlc_probs)
     return expected_cut
 
 def pick_good_xs(data, xs_sample,
@@ -62,7 +67,8 @@ def pick_good_xs(data, xs_sample,
     k = 1 / 4
 
     # num_nodes = data.num_nodes
-    num_edges = data.num_edges
+    edge_weight = getattr(data, 'edge_weight', None)
+    sum_weights = data.num_edges if edge_weight is None else edge_weight.sum()
 
     xs_loc_sample = xs_sample.clone()
     xs_loc_sample *= 2  # map (0, 1) to (-0.5, 1.5)
@@ -73,7 +79,7 @@ def pick_good_xs(data, xs_sample,
         for node0_id in data.sorted_degree_nodes:
             node1_ids = data.neighbors[node0_id]
 
-            node_rand_v = (xs_loc_sample[node1_ids].sum(dim=0) +
+            node_rand_v = ((data.neighbor_edges[node0_id] @ xs_loc_sample[node1_ids]).squeeze(0) +
                            th.rand(total_mcmc_num * repeat_times, device=device) * k)
             xs_loc_sample[node0_id] = node_rand_v.lt((data.weighted_degree[node0_id] + k) / 2).long()
 
@@ -91,7 +97,7 @@ def pick_good_xs(data, xs_sample,
     index = th.argmin(expected_cut_reshape, dim=0)
     index = th.arange(total_mcmc_num, device=device) + index * total_mcmc_num
     max_cut = expected_cut[index]
-    vs_good = (num_edges - max_cut) / 2
+    vs_good = (sum_weights - max_cut) / 2
 
     xs_good = xs_loc_sample[:, index]
     value = expected_cut.float()
@@ -9,11 +9,14 @@ TEN = th.Tensor
 
 
 class SolverLocalSearch:
-    def __init__(self, simulator: SimulatorTensorNetContract, num_bits: int):
+    def __init__(self, simulator: SimulatorTensorNetContract, num_bits: int, checkpoint_stride: int = 0):
         # the num_nodes of SolverLocalSearch is not the num_nodes of TensorNetworkEnv
         self.simulator = simulator
         self.num_bits = num_bits
         self.if_maximize = False
+        # checkpoint_stride > 0: 每隔 checkpoint_stride 条边保存收缩的状态，random_search 从第一个改动之前的检查点继续模拟
+        # 检查点占用的内存是 ceil(num_edges / checkpoint_stride) * num_sims * num_nodes ** 2 * 5 bytes
+        self.checkpoint_stride = checkpoint_stride
 
         self.num_sims = 0
         self.good_xs = th.tensor([])  # solution x
@@ -56,6 +59,12 @@ class SolverLocalSearch:
         prev_fs = sim.matching_sorts(prev_es).float() / sim.num_edges
         prev_vs = self.good_vs.clone()
         sim_ids = th.arange(num_sims, device=device)[:, None]
+
+        prev_es = prev_fs.argsort(dim=1)
+        stride = self.checkpoint_stride
+        if stride > 0:
+            prev_pow_counts, prev_checkpoints = sim.get_pow_counts_incrementally(edge_sorts=prev_es,
+                                                                                 checkpoint_stride=stride)
         for _ in range(num_iters):
             '''change randomly'''
             change_mask = th.randint(num_edges, size=(num_sims, num_spin), device=device)
@@ -63,7 +72,26 @@ class SolverLocalSearch:
 
             fs = prev_fs.clone()
             fs[[sim_ids, change_mask]] = fs[[sim_ids, change_mask]] + change_rand
-            vs = sim.get_log10_multiple_times(edge_sorts=fs.argsort(dim=1), if_acc=if_acc)
+            es = fs.argsort(dim=1)
+            if stride > 0:
+                pow_counts, checkpoints = sim.get_pow_counts_incrementally(
+                    edge_sorts=es, checkpoint_stride=stride,
+                    prev_edge_sorts=prev_es, prev_pow_counts=prev_pow_counts, prev_checkpoints=prev_checkpoints)
+                # 与父代的值 prev_vs 在误差以内的环境，两者都精确计算，比较的结果与原来的计算方法相同
+                vs = sim.convert_pow_counts_to_log10(pow_counts, if_acc=if_acc, best_v=prev_vs.min().item(),
+                                                     ref_vs=prev_vs, ref_pow_counts=prev_pow_counts)
+
+                good_is = vs.ge(prev_vs) if if_maximize else vs.le(prev_vs)
+                prev_es[good_is] = es[good_is]
+                prev_pow_counts[good_is] = pow_counts[good_is]
+                prev_checkpoints = sim.merge_checkpoints(good_is, prev_checkpoints, checkpoints)
+            else:
+                pow_counts = sim.get_pow_counts(edge_sorts=es)
+                vs = sim.convert_pow_counts_to_log10(pow_counts, if_acc=if_acc, best_v=prev_vs.min().item(),
+                                                     ref_vs=prev_vs, ref_edge_sorts=prev_es)
+
+                good_is = vs.ge(prev_vs) if if_maximize else vs.le(prev_vs)
+                prev_es[good_is] = es[good_is]
 
             update_xs_by_vs(prev_fs, prev_vs, fs, vs, if_maximize=if_maximize)
 
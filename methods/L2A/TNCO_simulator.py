@@ -1,6 +1,9 @@
 import sys
 import math
+import hashlib
+import numpy as np
 import torch as th
+from collections import OrderedDict
 
 TEN = th.Tensor
 
@@ -623,6 +626,20 @@ def get_edges_ary(nodes_ary: TEN) -> TEN:
     return edges_ary
 
 
+def get_edge_node2s(edges_ary: TEN) -> TEN:
+    """
+    每条边两端的节点 edge_node2s[edge_i] == (node_i0, node_i1)，node_i0 < node_i1，
+    与 th.where(th.eq(edges_ary, edge_i))[0] 相同，查表代替每次扫描整个 edges_ary
+    """
+    num_nodes, max_degree = edges_ary.shape
+    node_ids = th.arange(num_nodes, device=edges_ary.device).repeat_interleave(max_degree)
+    edge_ids = edges_ary.reshape(-1).long()
+    valid_ids = edge_ids.ge(0)
+    node_ids, edge_ids = node_ids[valid_ids], edge_ids[valid_ids]
+    sort_ids = th.argsort(edge_ids * num_nodes + node_ids)
+    return node_ids[sort_ids].reshape(-1, 2)
+
+
 def get_node_dims_arys(nodes_ary: TEN) -> list:
     num_nodes = nodes_ary.shape[0]
 
@@ -646,8 +663,56 @@ def get_node_bool_arys(nodes_ary: TEN) -> list:
     return arys
 
 
+class OrderCostCache:
+    """
+    收缩顺序的 log10 乘法次数的缓存。MH采样和局部搜索经常重复生成相同的收缩顺序，策略收敛后更多。
+    - key: 收缩顺序 edge_sort 的哈希值（blake2b 128位）和 if_acc
+    - cost: [只由这个收缩顺序决定的值, 精确值或者None]。if_acc=False 时，前者是 get_multiple_times_log_sum_exp 的值，
+      后者是 get_multiple_times_accurately 的值，在这个收缩顺序第一次接近一批中最好的值时才计算。
+      if_acc=True 时，前者是 get_multiple_times_vectorized 的值
+    - LRU：超过 max_size 个时，淘汰最久没有使用的
+    """
+
+    def __init__(self, max_size: int = 2 ** 14):
+        self.max_size = max_size
+        self.costs = OrderedDict()
+        self.num_hits = 0
+        self.num_misses = 0
+
+    @staticmethod
+    def hash_edge_sorts(edge_sorts: TEN, if_acc: bool = False) -> list:
+        edge_sorts = edge_sorts.cpu().numpy().astype(np.int32)
+        return [(hashlib.blake2b(edge_sort.tobytes(), digest_size=16).digest(), if_acc) for edge_sort in edge_sorts]
+
+    def get(self, key):
+        cost = self.costs.get(key)
+        if cost is None:
+            self.num_misses += 1
+        else:
+            self.costs.move_to_end(key)
+            self.num_hits += 1
+        return cost
+
+    def put(self, key, cost: list):
+        self.costs[key] = cost
+        self.costs.move_to_end(key)
+        while len(self.costs) > self.max_size:
+            self.costs.popitem(last=False)
+
+    def clear(self):
+        self.costs.clear()
+
+    @property
+    def hit_rate(self) -> float:
+        return self.num_hits / max(self.num_hits + self.num_misses, 1)
+
+    def __len__(self):
+        return len(self.costs)
+
+
 class SimulatorTensorNetContract:
-    def __init__(self, nodes_list: list, ban_edges: int, device: th.device, if_vec: bool = True):
+    def __init__(self, nodes_list: list, ban_edges: int, device: th.device, if_vec: bool = True,
+                 if_batch: bool = True, cost_cache_size: int = 2 ** 14):
         self.device = device
 
         '''build node_arys and edges_ary'''
@@ -661,6 +726,7 @@ class SimulatorTensorNetContract:
 
         self.nodes_ary = nodes_ary
         self.edges_ary = edges_ary.to(device)
+        self.edge_node2s = get_edge_node2s(edges_ary).to(device)
         self.num_nodes = num_nodes
         self.num_edges = num_edges
         self.ban_edges = ban_edges
@@ -679,6 +745,8 @@ class SimulatorTensorNetContract:
         self.bool_tens = th.stack([self.bool_ten.clone() for _ in range(default_num_envs)])
 
         self.update_pow_counts = self.update_pow_vectorized if if_vec else self.update_pow_vanilla
+        self.if_batch = if_batch  # 使用 get_pow_counts_batched，不使用 update_pow_counts
+        self.cost_cache = OrderCostCache(max_size=cost_cache_size) if cost_cache_size > 0 else None
 
         '''build for binary search'''
         num_bases = math.ceil(math.log2(num_edges))
@@ -686,26 +754,38 @@ class SimulatorTensorNetContract:
         self.num_bases = num_bases
         self.base_numbers = th.tensor([2 ** i for i in range(num_bases - 1, -1, -1)], device=device)[None, None, :]
 
-    def get_log10_multiple_times(self, edge_sorts: TEN, if_acc: bool = False) -> TEN:
+    def get_log10_multiple_times(self, edge_sorts: TEN, if_acc: bool = False, best_v: float = None,
+                                 ref_vs: TEN = None) -> TEN:
         # edge_argsort = th.rand(self.num_edges).argsort()
+        pow_counts = self.get_pow_counts(edge_sorts=edge_sorts)
+        return self.convert_pow_counts_to_log10(pow_counts, if_acc=if_acc, best_v=best_v, ref_vs=ref_vs)
+
+    def get_pow_counts(self, edge_sorts: TEN) -> TEN:
         device = self.device
         edges_ary: TEN = self.edges_ary
         num_envs, run_edges = edge_sorts.shape
 
-        if not (self.dims_tens.shape[0] == self.bool_tens.shape[0] == num_envs):
-            self.dims_tens = th.stack([self.dims_ten.clone() for _ in range(num_envs)])
-            self.bool_tens = th.stack([self.bool_ten.clone() for _ in range(num_envs)])
-        dims_tens = self.dims_tens.clone()
-        bool_tens = self.bool_tens.clone()
-
-        pow_counts = th.zeros((num_envs, run_edges), dtype=th.float64, device=device)
-        for i in range(run_edges):
-            edge_is = edge_sorts[:, i]
-            self.update_pow_counts(i, edge_is, edges_ary, dims_tens, bool_tens, pow_counts)
-
+        if self.if_batch:
+            pow_counts = self.get_pow_counts_batched(edge_sorts=edge_sorts)
+        else:
+            if not (self.dims_tens.shape[0] == self.bool_tens.shape[0] == num_envs):
+                self.dims_tens = th.stack([self.dims_ten.clone() for _ in range(num_envs)])
+                self.bool_tens = th.stack([self.bool_ten.clone() for _ in range(num_envs)])
+            dims_tens = self.dims_tens.clone()
+            bool_tens = self.bool_tens.clone()
+
+            pow_counts = th.zeros((num_envs, run_edges), dtype=th.float64, device=device)
+            for i in range(run_edges):
+                edge_is = edge_sorts[:, i]
+                self.update_pow_counts(i, edge_is, edges_ary, dims_tens, bool_tens, pow_counts)
+        return pow_counts
+
+    def convert_pow_counts_to_log10(self, pow_counts: TEN, if_acc: bool = False, best_v: float = None,
+                                    ref_vs: TEN = None, ref_pow_counts: TEN = None, ref_edge_sorts: TEN = None) -> TEN:
         # pow_counts += 1  # todo WARMING (Maybe opt_einsum is wrong)
         result = self.get_multiple_times_vectorized(pow_counts) if if_acc \
-            else self.get_multiple_times_accurately(pow_counts)
+            else self.get_multiple_times_stable(pow_counts, best_v=best_v, ref_vs=ref_vs,
+                                                ref_pow_times=ref_pow_counts, ref_edge_sorts=ref_edge_sorts)
         return result.detach()
 
     @staticmethod
@@ -781,6 +861,126 @@ class SimulatorTensorNetContract:
             dims_tens[j, ct_bool] = ct_dims[None, :]
             bool_tens[j, ct_bool] = ct_bool[None, :]
 
+    def get_pow_counts_batched(self, edge_sorts: TEN) -> TEN:
+        """
+        与逐条边调用 update_pow_counts 得到的 pow_counts 相同，但所有并行环境的每一步只有几个张量运算，没有逐个环境的Python循环。
+        update_pow_counts 把收缩后的张量的信息刷新到它包含的所有节点的行里，每一步是 O(num_nodes ** 2)。
+        这里用 group_ids[env_i, node_i] 记录节点所在的（收缩后的）张量的代表节点，只读写代表节点的一行：
+        - 收缩 edge_i 的两个节点，就是合并它们所在的张量 group_i0, group_i1，不同时 if_diff
+        - 合并后的信息只写到 group_i0 的一行，group_i1 的节点的 group_ids 改为 group_i0
+        每一步是 O(num_nodes)，并且边两端的节点从 self.edge_node2s 查表得到，不需要扫描 edges_ary
+        """
+        num_envs, run_edges = edge_sorts.shape
+        device = self.device
+        env_is = th.arange(num_envs, device=device)
+
+        dims_tens = self.dims_ten.repeat(num_envs, 1, 1)
+        bool_tens = self.bool_ten.repeat(num_envs, 1, 1)
+        group_ids = th.arange(self.num_nodes, device=device).repeat(num_envs, 1)
+        node2s = self.edge_node2s[edge_sorts]  # node2s.shape == (num_envs, run_edges, 2)
+
+        pow_counts = th.zeros((num_envs, run_edges), dtype=th.float64, device=device)
+        for i in range(run_edges):
+            pow_counts[:, i] = self.contract_edges_batched(env_is, node2s[:, i], dims_tens, bool_tens, group_ids)
+        return pow_counts
+
+    @staticmethod
+    def contract_edges_batched(env_is: TEN, node2s: TEN, dims_tens: TEN, bool_tens: TEN, group_ids: TEN) -> TEN:
+        """get_pow_counts_batched 的一步：环境 env_is 各自收缩一条边，边两端的节点是 node2s，原地更新状态，返回 pow_count"""
+        '''find two tensors of an edge_i'''
+        group_i0s = group_ids[env_is, node2s[:, 0]]
+        group_i1s = group_ids[env_is, node2s[:, 1]]
+        if_diffs = group_i0s.ne(group_i1s)
+
+        '''calculate the multiple and avoid repeat'''
+        dims_i0s = dims_tens[env_is, group_i0s]
+        ct_dimss = dims_i0s + dims_tens[env_is, group_i1s] * if_diffs.unsqueeze(1)
+        ct_bools = bool_tens[env_is, group_i0s] | bool_tens[env_is, group_i1s]
+
+        pow_count = ct_dimss.sum(dim=1) - (ct_dimss * ct_bools).sum(dim=1) * 0.5
+
+        '''adjust the row of group_i0 and the group_ids of the merged nodes'''
+        ct_dimss.masked_fill_(ct_bools, 0)  # 把收缩掉的边的乘法数量赋值为2**0，接下来不再参与乘法次数的计算
+        dims_tens[env_is, group_i0s] = th.where(if_diffs.unsqueeze(1), ct_dimss, dims_i0s)
+        bool_tens[env_is, group_i0s] = ct_bools  # 两个节点已经在同一个张量里时，ct_bools 就是原来的一行
+        group_ids[env_is] = th.where(ct_bools, group_i0s.unsqueeze(1), group_ids[env_is])
+        return pow_count * if_diffs
+
+    def get_pow_counts_incrementally(self, edge_sorts: TEN, checkpoint_stride: int,
+                                     prev_edge_sorts: TEN = None, prev_pow_counts: TEN = None,
+                                     prev_checkpoints: list = None) -> (TEN, list):
+        """
+        与 get_pow_counts_batched 的结果相同，并且保存检查点 checkpoints，用于局部搜索。
+        - checkpoints[k] = (dims_tens, bool_tens, group_ids)，是收缩第 k * checkpoint_stride 条边之前的状态，
+          检查点的数量是 ceil(run_edges / checkpoint_stride)，内存由 checkpoint_stride 控制
+        - 输入父代的收缩顺序 prev_edge_sorts 和它的 prev_pow_counts, prev_checkpoints 时，
+          每个环境的收缩顺序与父代的前缀相同，所以从第一个不同的位置之前最近的检查点继续模拟，
+          每一步只计算已经开始模拟的环境，越靠后的改动越省计算
+        """
+        num_envs, run_edges = edge_sorts.shape
+        device = self.device
+        num_checkpoints = (run_edges + checkpoint_stride - 1) // checkpoint_stride
+
+        '''每个环境开始模拟的位置 start_is，以及开始时的状态'''
+        if prev_checkpoints is None:
+            start_is = th.zeros(num_envs, dtype=th.long, device=device)
+            dims_tens = self.dims_ten.repeat(num_envs, 1, 1)
+            bool_tens = self.bool_ten.repeat(num_envs, 1, 1)
+            group_ids = th.arange(self.num_nodes, device=device).repeat(num_envs, 1)
+            pow_counts = th.zeros((num_envs, run_edges), dtype=th.float64, device=device)
+        else:
+            diffs = edge_sorts.ne(prev_edge_sorts)
+            first_diffs = th.where(diffs.any(dim=1), diffs.int().argmax(dim=1), run_edges)
+            checkpoint_ks = (first_diffs // checkpoint_stride).clamp_max(num_checkpoints - 1)
+            start_is = checkpoint_ks * checkpoint_stride
+
+            dims_tens, bool_tens, group_ids = [t.clone() for t in prev_checkpoints[0]]
+            for k in checkpoint_ks.unique().tolist():
+                mask = checkpoint_ks.eq(k)
+                for t, prev_t in zip((dims_tens, bool_tens, group_ids), prev_checkpoints[k]):
+                    t[mask] = prev_t[mask]
+            pow_counts = prev_pow_counts.clone()  # 相同的前缀的 pow_counts 不变
+
+        '''按开始的位置排序，第 i 步需要模拟的环境是排序后的前 num_actives 个'''
+        sort_ids = start_is.argsort()
+        sorted_start_is = start_is[sort_ids].tolist()
+        first_i = sorted_start_is[0] if num_envs > 0 else run_edges
+        checkpoints = list(prev_checkpoints[:first_i // checkpoint_stride]) if prev_checkpoints else []
+
+        node2s = self.edge_node2s[edge_sorts]  # node2s.shape == (num_envs, run_edges, 2)
+        num_actives = 0
+        for i in range(first_i, run_edges):
+            while num_actives < num_envs and sorted_start_is[num_actives] <= i:
+                num_actives += 1
+            env_is = sort_ids[:num_actives]
+
+            if i % checkpoint_stride == 0:  # 还没有开始模拟的环境，与父代的检查点相同
+                checkpoint = [t.clone() for t in (dims_tens, bool_tens, group_ids)]
+                if num_actives < num_envs:
+                    wait_is = sort_ids[num_actives:]
+                    for t, prev_t in zip(checkpoint, prev_checkpoints[i // checkpoint_stride]):
+                        t[wait_is] = prev_t[wait_is]
+                checkpoints.append(tuple(checkpoint))
+
+            pow_count = self.contract_edges_batched(env_is, node2s[env_is, i], dims_tens, bool_tens, group_ids)
+            pow_counts[env_is, i] = pow_count.to(pow_counts.dtype)
+        return pow_counts, checkpoints
+
+    @staticmethod
+    def merge_checkpoints(good_is: TEN, checkpoints0: list, checkpoints1: list) -> list:
+        """good_is 为 True 的环境使用 checkpoints1，否则使用 checkpoints0，与 update_xs_by_vs 一起使用"""
+        checkpoints = []
+        for checkpoint0, checkpoint1 in zip(checkpoints0, checkpoints1):
+            if checkpoint0 is checkpoint1:
+                checkpoints.append(checkpoint0)
+                continue
+            checkpoint = []
+            for t0, t1 in zip(checkpoint0, checkpoint1):
+                mask = good_is.view(-1, *[1] * (t0.dim() - 1))
+                checkpoint.append(th.where(mask, t1, t0))
+            checkpoints.append(tuple(checkpoint))
+        return checkpoints
+
     def get_multiple_times_accurately(self, pow_times: TEN) -> TEN:
         num_envs = pow_times.shape[0]
         # 缓慢但是完全不损失精度的计算方法
@@ -794,6 +994,58 @@ class SimulatorTensorNetContract:
             multiple_times.append(multiple_time)
         return th.tensor(multiple_times, dtype=th.float64, device=self.device)
 
+    def get_multiple_times_stable(self, pow_times: TEN, best_v: float = None,
+                                  ref_vs: TEN = None, ref_pow_times: TEN = None, ref_edge_sorts: TEN = None) -> TEN:
+        """
+        代替 get_multiple_times_accurately 的默认计算方法：float64 的 log-sum-exp，
+        log10(sum(2 ** p)) = max(p) * log10(2) + log10(sum(2 ** (p - max(p))))，每一项都不超过1，不会溢出。
+        num_terms 项求和的相对误差不超过 (num_terms + 1) * eps，取log10后的绝对误差不超过 err_bound。
+        结果与最好的值（更小的乘法次数，best_v 与这一批的最小值）的差距在误差以内的环境，
+        改用 get_multiple_times_accurately 计算，所以与最好的解比较时，排序与原来的计算方法相同
+
+        ref_vs: 每个环境各自比较的值，例如局部搜索中父代的值 prev_vs，shape == (num_envs, )。
+        结果与 ref_vs 的差距在误差以内的环境，也改用 get_multiple_times_accurately 计算。
+        ref_pow_times: ref_vs 对应的 pow_times，或者 ref_edge_sorts: ref_vs 对应的收缩顺序（只模拟这些环境的）。
+        给出时，这些环境的 ref_vs 也原地改为 get_multiple_times_accurately 的值，
+        所以逐个环境比较 vs 与 ref_vs 时，排序与原来的计算方法相同
+        """
+        pow_times = pow_times.double()
+        num_envs, num_terms = pow_times.shape
+        if num_envs == 0:
+            return th.zeros(0, dtype=th.float64, device=self.device)
+
+        multiple_times = self.get_multiple_times_log_sum_exp(pow_times)
+        err_bound = self.get_err_bound_of_log_sum_exp(multiple_times, num_terms=num_terms)
+        best_v = multiple_times.min().item() if best_v is None else min(best_v, multiple_times.min().item())
+        near_is = multiple_times.le(best_v + 2 * err_bound)
+        if ref_vs is not None:
+            ref_near_is = (multiple_times - ref_vs).abs().le(2 * err_bound)
+            ref_ids = th.nonzero(ref_near_is).flatten()
+            if (ref_pow_times is not None or ref_edge_sorts is not None) and ref_ids.shape[0] > 0:
+                ref_pow_times = ref_pow_times[ref_ids] if ref_pow_times is not None \
+                    else self.get_pow_counts(edge_sorts=ref_edge_sorts[ref_ids])
+                exact_times = self.get_multiple_times_accurately(ref_pow_times.double())
+                ref_vs[ref_ids] = th.where(exact_times.isfinite(), exact_times, ref_vs[ref_ids]).to(ref_vs.dtype)
+            near_is = near_is | ref_near_is
+        env_ids = th.nonzero(near_is).flatten()
+        if env_ids.shape[0] > 0:
+            exact_times = self.get_multiple_times_accurately(pow_times[env_ids])
+            multiple_times[env_ids] = th.where(exact_times.isfinite(), exact_times, multiple_times[env_ids])
+        return multiple_times
+
+    @staticmethod
+    def get_multiple_times_log_sum_exp(pow_times: TEN) -> TEN:
+        """get_multiple_times_stable 中 log-sum-exp 的部分，每个环境的结果只取决于它自己的 pow_times"""
+        pow_times = pow_times.double()
+        max_pow_times = pow_times.max(dim=1)[0]
+        sum_times = th.exp2(pow_times - max_pow_times.unsqueeze(1)).sum(dim=1)
+        return sum_times.log10() + max_pow_times * math.log10(2)
+
+    @staticmethod
+    def get_err_bound_of_log_sum_exp(multiple_times: TEN, num_terms: int) -> float:
+        eps = th.finfo(th.float64).eps
+        return 2 * ((num_terms + 1) * eps / math.log(10) + eps * multiple_times.abs().max().item())
+
     def get_multiple_times_vectorized(self, pow_times: TEN) -> TEN:
         # 快速，但是有效数值有 1e-7 的计算方法（以下都是 float64）
         adj_pow_times = pow_times.max(dim=1)[0] - 960  # automatically set `max - 960`, 960 < the limit 1024
@@ -804,6 +1056,12 @@ class SimulatorTensorNetContract:
         return multiple_times
 
     def convert_edge_sort_to_node2s(self, edge_sort: TEN) -> list:
+        """每条边两端的节点从 self.edge_node2s 查表得到，与 convert_edge_sort_to_node2s_for_loop 相同"""
+        run_edges = edge_sort.shape[0]
+        assert run_edges == self.num_edges - self.ban_edges
+        return [tuple(node2) for node2 in self.edge_node2s[edge_sort.to(self.device)].tolist()]
+
+    def convert_edge_sort_to_node2s_for_loop(self, edge_sort: TEN) -> list:  # 代码简洁，但是计算效率低
         edges_ary: TEN = self.edges_ary.cpu()
         edge_sort = edge_sort.cpu()
 
@@ -849,15 +1107,54 @@ class SimulatorTensorNetContract:
         return edge_sort
 
     def generate_xs_randomly(self, num_sims: int) -> TEN:
-        edge_sorts = th.stack([th.randperm(self.num_edges, device=self.device)
-                               for _ in range(num_sims)])
+        edge_sorts = th.rand((num_sims, self.num_edges), device=self.device).argsort(dim=1)  # 每一行都是随机的排列
         xs = self.convert_edge_sorts_to_binary_xs(edge_sorts=edge_sorts)
         return xs
 
     def calculate_obj_values(self, xs: TEN, if_acc: bool = False) -> TEN:
         edge_sorts = self.convert_binary_xs_to_edge_sorts(xs=xs)
-        log10_multiple_times = self.get_log10_multiple_times(edge_sorts=edge_sorts, if_acc=if_acc)
-        return log10_multiple_times
+        if self.cost_cache is None:
+            return self.get_log10_multiple_times(edge_sorts=edge_sorts, if_acc=if_acc)
+
+        '''只计算没有缓存的收缩顺序，这一批里重复的收缩顺序只计算一次'''
+        keys = self.cost_cache.hash_edge_sorts(edge_sorts, if_acc=if_acc)
+        costs = [self.cost_cache.get(key) for key in keys]
+        miss_keys = list(dict.fromkeys(key for key, cost in zip(keys, costs) if cost is None))
+        key_to_id = {key: i for i, key in enumerate(keys)}  # 每个 key 最后一次出现的位置
+        miss_pow_counts = {}
+        if miss_keys:
+            miss_ids = th.tensor([key_to_id[key] for key in miss_keys], dtype=th.long, device=edge_sorts.device)
+            pow_counts = self.get_pow_counts(edge_sorts=edge_sorts[miss_ids])
+            miss_vs = self.get_multiple_times_vectorized(pow_counts) if if_acc \
+                else self.get_multiple_times_log_sum_exp(pow_counts)
+            key_to_cost = {}
+            for j, (key, v) in enumerate(zip(miss_keys, miss_vs.tolist())):
+                key_to_cost[key] = [v, None]
+                miss_pow_counts[key] = pow_counts[j]
+                self.cost_cache.put(key, key_to_cost[key])
+            costs = [key_to_cost[key] if cost is None else cost for key, cost in zip(keys, costs)]
+        multiple_times = th.tensor([cost[0] for cost in costs], dtype=th.float64, device=self.device)
+        if if_acc or len(costs) == 0:
+            return multiple_times
+
+        '''与 get_multiple_times_stable 相同，接近这一批最好的值的收缩顺序使用精确值，所以缓存命中与否，结果完全相同'''
+        err_bound = self.get_err_bound_of_log_sum_exp(multiple_times, num_terms=edge_sorts.shape[1])
+        env_ids = th.nonzero(multiple_times.le(multiple_times.min().item() + 2 * err_bound)).flatten().tolist()
+        exact_keys = list(dict.fromkeys(keys[i] for i in env_ids if costs[i][1] is None))
+        if exact_keys:
+            sim_keys = [key for key in exact_keys if key not in miss_pow_counts]
+            if sim_keys:
+                sim_ids = th.tensor([key_to_id[key] for key in sim_keys], dtype=th.long, device=edge_sorts.device)
+                miss_pow_counts.update(zip(sim_keys, self.get_pow_counts(edge_sorts=edge_sorts[sim_ids])))
+            pow_counts = th.stack([miss_pow_counts[key] for key in exact_keys]).double()
+            exact_times = self.get_multiple_times_accurately(pow_counts).tolist()
+            key_to_cost = {key: cost for key, cost in zip(keys, costs)}
+            for key, exact_time in zip(exact_keys, exact_times):
+                cost = key_to_cost[key]
+                cost[1] = exact_time if math.isfinite(exact_time) else cost[0]
+        for i in env_ids:
+            multiple_times[i] = costs[i][1]
+        return multiple_times
 
     def convert_binary_xs_to_edge_sorts(self, xs):
         num_sims = xs.shape[0]
@@ -868,6 +1165,17 @@ class SimulatorTensorNetContract:
         return edge_sorts
 
     def convert_edge_sorts_to_binary_xs(self, edge_sorts: TEN):
+        """
+        每条边在收缩顺序中的位置 edge_ranks 按二进制展开，高位在前，num_bases 位，
+        与 convert_edge_sorts_to_binary_xs_for_loop 相同，用移位和掩码代替逐个数字格式化为字符串
+        """
+        num_sims = edge_sorts.shape[0]
+        edge_ranks = self.matching_sorts(edge_sorts.to(self.device))
+        shifts = th.arange(self.num_bases - 1, -1, -1, device=self.device)
+        xs = (edge_ranks[:, :, None] >> shifts).bitwise_and_(1).bool()
+        return xs.reshape(num_sims, self.num_bits)
+
+    def convert_edge_sorts_to_binary_xs_for_loop(self, edge_sorts: TEN):  # 代码简洁，但是计算效率低
         num_sims = edge_sorts.shape[0]
 
         xs = th.empty((num_sims, self.num_bits), dtype=th.bool, device=self.device)
@@ -895,6 +1203,13 @@ class SimulatorTensorNetContract:
 
     @staticmethod
     def matching_sorts(src_sorts):
+        """逆排列 dst_sorts[i, src_sorts[i, j]] = j，一次 scatter 完成所有的 sims"""
+        num_sims, num_edges = src_sorts.shape
+        indices = th.arange(num_edges, device=src_sorts.device).expand(num_sims, num_edges)
+        return th.zeros_like(src_sorts).scatter_(1, src_sorts, indices.to(src_sorts.dtype))
+
+    @staticmethod
+    def matching_sorts_for_loop(src_sorts):  # 代码简洁，但是计算效率低
         num_sims, num_edges = src_sorts.shape
         device = src_sorts.device
 
@@ -1177,6 +1492,68 @@ def check_format_xs():
     print(f"| {vs.min().item():20.16f}  {vs.mean().item():20.16f}")
 
 
+def benchmark_update_pow_counts():
+    """比较 update_pow_vanilla, update_pow_vectorized, get_pow_counts_batched 每秒计算的收缩顺序的数量，并检查结果相同"""
+    import time
+    gpu_id = int(sys.argv[1]) if len(sys.argv) > 1 else -1
+    device = th.device(f'cuda:{gpu_id}' if th.cuda.is_available() and gpu_id >= 0 else 'cpu')
+    num_sims = 2 ** 5
+
+    for graph_name, nodes_list in (('SycamoreN12M14', NodesSycamoreN12M14),
+                                   ('SycamoreN53M12', NodesSycamoreN53M12),
+                                   ('SycamoreN53M20', NodesSycamoreN53M20)):
+        sim = SimulatorTensorNetContract(nodes_list=nodes_list, ban_edges=0, device=device)
+        edge_sorts = th.rand((num_sims, sim.num_edges), device=device).argsort(dim=1)
+
+        results = []
+        for if_batch, update_pow_counts in ((False, sim.update_pow_vanilla),
+                                            (False, sim.update_pow_vectorized),
+                                            (True, None)):
+            sim.if_batch = if_batch
+            sim.update_pow_counts = update_pow_counts
+            timer = time.time()
+            results.append(sim.get_log10_multiple_times(edge_sorts=edge_sorts, if_acc=True))
+            if device.type == 'cuda':
+                th.cuda.synchronize(device)
+            used_time = time.time() - timer
+            func_name = 'get_pow_counts_batched' if if_batch else update_pow_counts.__name__
+            print(f"| {graph_name}  num_edges {sim.num_edges:4}  {func_name:22}  "
+                  f"UsedTime {used_time:8.3f}s  OrdersPerSecond {num_sims / used_time:9.1f}")
+        assert all(th.equal(results[0], result) for result in results[1:])
+
+
+def check_vectorized_conversions():
+    """检查向量化的转换函数与 for_loop 的版本结果相同，并比较耗时"""
+    import time
+    gpu_id = int(sys.argv[1]) if len(sys.argv) > 1 else -1
+    device = th.device(f'cuda:{gpu_id}' if th.cuda.is_available() and gpu_id >= 0 else 'cpu')
+    num_sims = 2 ** 6
+
+    for graph_name, nodes_list in (('SycamoreN12M14', NodesSycamoreN12M14),
+                                   ('SycamoreN53M20', NodesSycamoreN53M20)):
+        sim = SimulatorTensorNetContract(nodes_list=nodes_list, ban_edges=0, device=device)
+        edge_sorts = th.rand((num_sims, sim.num_edges), device=device).argsort(dim=1)
+
+        used_times = []
+        for func_name in ('matching_sorts', 'convert_edge_sorts_to_binary_xs'):
+            func, func_for_loop = getattr(sim, func_name), getattr(sim, f'{func_name}_for_loop')
+            timer = time.time()
+            result = func(edge_sorts)
+            used_times.append(time.time() - timer)
+            timer = time.time()
+            result_for_loop = func_for_loop(edge_sorts)
+            used_times.append(time.time() - timer)
+            assert th.equal(result, result_for_loop)
+
+        assert sim.convert_edge_sort_to_node2s(edge_sorts[0]) == sim.convert_edge_sort_to_node2s_for_loop(edge_sorts[0])
+        xs = sim.convert_edge_sorts_to_binary_xs(edge_sorts)
+        assert th.equal(sim.convert_binary_xs_to_edge_sorts(xs), edge_sorts)
+        assert th.equal(sim.format_xs(xs), xs)
+        print(f"| {graph_name}  num_sims {num_sims}  "
+              f"matching_sorts {used_times[0]:7.4f}s (for_loop {used_times[1]:7.4f}s)  "
+              f"convert_edge_sorts_to_binary_xs {used_times[2]:7.4f}s (for_loop {used_times[3]:7.4f}s)")
+
+
 def check_str_edge_sort():
     gpu_id = int(sys.argv[1]) if len(sys.argv) > 1 else 0
     device = th.device(f'cuda:{gpu_id}' if th.cuda.is_available() and gpu_id >= 0 else 'cpu')
@@ -1206,4 +1583,6 @@ if __name__ == '__main__':
     # unit_test_convert_node2s_to_edge_sorts_of_load()
     # unit_test_edge_sorts_to_log10_multiple_times()
     # unit_test_warm_up()
+    # benchmark_update_pow_counts()
+    # check_vectorized_conversions()
     check_str_edge_sort()
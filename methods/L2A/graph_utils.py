@@ -1,8 +1,10 @@
 import os
 import sys
+import numpy as np
 import torch as th
 import networkx as nx
 from typing import List, Tuple
+from methods.graph_csr import GraphCSR
 
 '''graph'''
 
@@ -16,14 +18,11 @@ DataDir = './data/graph_max_cut'  # 保存图最大割的txt文件的目录，tx
 
 
 def load_graph_list_from_txt(txt_path: str = 'G14.txt') -> GraphList:
-    with open(txt_path, 'r') as file:
-        lines = file.readlines()
-        lines = [[int(i1) for i1 in i0.split()] for i0 in lines]
-    num_nodes, num_edges = lines[0]
-    graph_list = [(n0 - 1, n1 - 1, dt) for n0, n1, dt in lines[1:]]  # 将node_id 由“从1开始”改为“从0开始”
-
-    assert num_nodes == obtain_num_nodes(graph_list=graph_list)
-    assert num_edges == len(graph_list)
+    """txt 文件第一次读取后保存为二进制缓存（见 graph_csr.py），之后通过内存映射读取，txt 文件修改后缓存自动失效"""
+    graph = GraphCSR.from_txt(txt_path)  # 将node_id 由“从1开始”改为“从0开始”
+    graph_list = graph.to_graph_list()
+
+    assert graph.num_nodes == obtain_num_nodes(graph_list=graph_list)
     return graph_list
 
 
@@ -113,6 +112,16 @@ def load_graph_list(graph_name: str):
     return graph_list
 
 
+def load_graph_csr(graph_name: str) -> GraphCSR:
+    """与 load_graph_list 相同的查找规则，但 txt 文件直接读取为 GraphCSR，不经过 Python 的 GraphList"""
+    if os.path.exists(f"{DataDir}/{graph_name}.txt"):
+        return GraphCSR.from_txt(f"{DataDir}/{graph_name}.txt")
+    elif os.path.isfile(graph_name) and os.path.splitext(graph_name)[-1] == '.txt':
+        return GraphCSR.from_txt(graph_name)
+    else:
+        return GraphCSR.from_graph_list(load_graph_list(graph_name=graph_name))
+
+
 '''adjacency matrix'''
 
 
@@ -246,6 +255,28 @@ def build_adjacency_indies(graph_list: GraphList, if_bidirectional: bool = False
     return n0_to_n1s, n0_to_dts
 
 
+def build_adjacency_indies_from_csr(graph: GraphCSR, if_bidirectional: bool = False) -> (IndexList, IndexList):
+    """
+    与 build_adjacency_indies 的返回值相同，但直接切分 GraphCSR 的数组，不需要逐条边的 Python 循环。
+    - if_bidirectional=True: 每个节点的邻居就是 CSR 的一行
+    - if_bidirectional=False: 只记录 txt 文件中 node0 -> node1 的方向，按 (node0, node1) 排序
+    """
+    num_nodes = graph.num_nodes
+    if if_bidirectional:
+        n0s = np.repeat(np.arange(num_nodes), graph.degrees)
+        n1s = graph.indices
+        dts = graph.weights
+    else:
+        sort_ids = np.lexsort((graph.edge_n1s, graph.edge_n0s))
+        n0s = graph.edge_n0s[sort_ids]
+        n1s = graph.edge_n1s[sort_ids]
+        dts = graph.edge_weights[sort_ids]
+    split_sizes = np.bincount(n0s, minlength=num_nodes).tolist()
+    n0_to_n1s = list(th.from_numpy(n1s.astype(np.int64)).split(split_sizes))
+    n0_to_dts = list(th.from_numpy(dts).split(split_sizes))
+    return n0_to_n1s, n0_to_dts
+
+
 '''get_hot_tensor_of_graph'''
 
 
@@ -47,31 +47,24 @@ class SolverLocalSearch:
 
         prev_xs = self.good_xs.clone()
         prev_vs_raw = sim.obj_for_loop(prev_xs, if_sum=False)
-        prev_vs = prev_vs_raw.sum(dim=1)
+        prev_vs = prev_vs_raw.sum(dim=1).to(self.good_vs.dtype)
+
+        fields = sim.calc_local_fields(prev_xs)  # 局部场，翻转的 gain 不需要重新计算整个 obj
 
         thresh = None
         for _ in range(num_iters):
             '''flip randomly with ws(weights)'''
-            ws = sim.n0_num_n1 - (4 if sim.if_bidirectional else 2) * prev_vs_raw
+            ws = sim.n0_sum_dts - (4 if sim.if_bidirectional else 2) * prev_vs_raw
             ws_std = ws.max(dim=0, keepdim=True)[0] - ws.min(dim=0, keepdim=True)[0]
 
             spin_rand = ws + th.randn_like(ws, dtype=th.float32) * (ws_std.float() * noise_std)
             thresh = th.kthvalue(spin_rand, k=kth, dim=1)[0][:, None] if thresh is None else thresh
             spin_mask = spin_rand.gt(thresh)
 
-            xs = prev_xs.clone()
-            xs[spin_mask] = th.logical_not(xs[spin_mask])
-            vs = sim.obj(xs)
-
-            update_xs_by_vs(prev_xs, prev_vs, xs, vs)
+            sim.flip_set_inplace(prev_xs, prev_vs, fields, spin_mask)
 
         '''addition'''
-        for i in range(sim.num_nodes):
-            xs1 = prev_xs.clone()
-            xs1[:, i] = th.logical_not(xs1[:, i])
-            vs1 = sim.obj(xs1)
-
-            update_xs_by_vs(prev_xs, prev_vs, xs1, vs1)
+        sim.flip_nodes_inplace(prev_xs, prev_vs, fields)
 
         num_update = update_xs_by_vs(self.good_xs, self.good_vs, prev_xs, prev_vs)
         return self.good_xs, self.good_vs, num_update
@@ -2,16 +2,40 @@ import os
 import sys
 import time
 import torch as th
+from typing import Union
 
-from methods.L2A.graph_utils import load_graph_list, GraphList
-from methods.L2A.graph_utils import build_adjacency_bool, build_adjacency_indies, obtain_num_nodes
+from methods.graph_csr import GraphCSR
+from methods.L2A.graph_utils import load_graph_list, load_graph_csr, GraphList
+from methods.L2A.graph_utils import build_adjacency_indies_from_csr, obtain_num_nodes
 from methods.L2A.graph_utils import update_xs_by_vs, gpu_info_str, evolutionary_replacement
 
 TEN = th.Tensor
+PACK_BITS = 64  # 每个 int64 word 存 64 个节点的解
+
+
+def pack_xs(xs: TEN) -> TEN:
+    """
+    把 bool 的解 xs.shape == (num_sims, num_nodes) 压缩为 int64 的 packed_xs.shape == (num_sims, num_words)，
+    num_words = ceil(num_nodes / 64)，节点 i 存在第 i // 64 个 word 的第 i % 64 位，内存是 bool 的 1/8
+    """
+    num_sims, num_nodes = xs.shape
+    num_words = (num_nodes + PACK_BITS - 1) // PACK_BITS
+    bits = th.zeros((num_sims, num_words * PACK_BITS), dtype=th.int64, device=xs.device)
+    bits[:, :num_nodes] = xs
+    bits = bits.view(num_sims, num_words, PACK_BITS) << th.arange(PACK_BITS, dtype=th.int64, device=xs.device)
+    return bits.sum(dim=2)  # 每一位只有一个1，求和不会进位，第63位是int64的符号位，结果的位模式也是对的
+
+
+def unpack_xs(packed_xs: TEN, num_nodes: int) -> TEN:
+    """pack_xs 的逆运算，返回 bool 的 xs.shape == (num_sims, num_nodes)"""
+    num_sims = packed_xs.shape[0]
+    shifts = th.arange(PACK_BITS, dtype=th.int64, device=packed_xs.device)
+    bits = (packed_xs[:, :, None] >> shifts) & 1
+    return bits.view(num_sims, -1)[:, :num_nodes].bool()
 
 
 class SimulatorMaxcut:
-    def __init__(self, sim_name: str = 'max_cut', graph_list: GraphList = (),
+    def __init__(self, sim_name: str = 'max_cut', graph_list: Union[GraphList, GraphCSR] = (),
                  device=th.device('cpu'), if_bidirectional: bool = False):
         self.device = device
         self.sim_name = sim_name
@@ -20,48 +44,115 @@ class SimulatorMaxcut:
         self.if_bidirectional = if_bidirectional
 
         '''load graph'''
-        graph_list: GraphList = graph_list if graph_list else load_graph_list(graph_name=sim_name)
-
-        '''建立邻接矩阵'''
-        # self.adjacency_matrix = build_adjacency_matrix(graph_list=graph_list, if_bidirectional=True).to(device)
-        self.adjacency_bool = build_adjacency_bool(graph_list=graph_list, if_bidirectional=True).to(device)
-
-        '''建立邻接索引'''
-        n0_to_n1s, n0_to_dts = build_adjacency_indies(graph_list=graph_list, if_bidirectional=if_bidirectional)
-        n0_to_n1s = [t.to(int_type).to(device) for t in n0_to_n1s]
-        self.num_nodes = obtain_num_nodes(graph_list)
-        self.num_edges = len(graph_list)
-        self.adjacency_indies = n0_to_n1s
-
-        '''基于邻接索引，建立基于边edge的索引张量：(n0_ids, n1_ids)是所有边(第0个, 第1个)端点的索引'''
-        n0_to_n0s = [(th.zeros_like(n1s) + i) for i, n1s in enumerate(n0_to_n1s)]
-        self.n0_ids = th.hstack(n0_to_n0s)[None, :]
-        self.n1_ids = th.hstack(n0_to_n1s)[None, :]
-        len_sim_ids = self.num_edges * (2 if if_bidirectional else 1)
-        self.sim_ids = th.zeros(len_sim_ids, dtype=int_type, device=device)[None, :]
-        self.n0_num_n1 = th.tensor([n1s.shape[0] for n1s in n0_to_n1s], device=device)[None, :]
+        if isinstance(graph_list, GraphCSR):
+            graph = graph_list
+        elif graph_list:
+            graph = GraphCSR.from_graph_list(graph_list)
+        else:
+            graph = load_graph_csr(graph_name=sim_name)
+        self.graph = graph
+
+        '''邻接矩阵 adjacency_bool 是 N*N 的稠密矩阵，只在第一次访问时建立，见 adjacency_bool'''
+        self._adjacency_bool = None
+        _, _, edge_weights = graph.edge_tensors()
+
+        '''建立邻接索引：所有节点的邻居存在一个张量里，adjacency_indies[i] 是它的切片（view），不逐个节点复制'''
+        n0_to_n1s, n0_to_dts = build_adjacency_indies_from_csr(graph=graph, if_bidirectional=if_bidirectional)
+        n0_num_n1 = th.tensor([n1s.shape[0] for n1s in n0_to_n1s], dtype=int_type)
+        split_sizes = n0_num_n1.tolist()
+        self.num_nodes = graph.num_nodes
+        self.num_edges = graph.num_edges
+        self.adjacency_indies = list(th.hstack(n0_to_n1s).to(int_type).to(device).split(split_sizes))
+        self.adjacency_dts = list(th.hstack(n0_to_dts).float().to(device).split(split_sizes))
+
+        '''带权图（包括±1的有符号图）的割是被切割的边的权重之和，obj 的值是 float；所有边的权重都是1时仍然用整数计数'''
+        self.if_weighted = bool(edge_weights.ne(1).any())
+        self.obj_type = th.float32 if self.if_weighted else int_type
+
+        '''基于邻接索引，建立基于边edge的索引张量：(n0_ids, n1_ids)是所有边(第0个, 第1个)端点的索引
+        n0_ids.shape == (1, num_edges)，obj 中对所有并行的解广播，不按 num_sims 重复，内存与 num_sims 无关'''
+        self.n0_ids = th.repeat_interleave(th.arange(self.num_nodes, dtype=int_type), n0_num_n1).to(device)[None, :]
+        self.n1_ids = th.hstack(self.adjacency_indies)[None, :]
+        self.n0_num_n1 = n0_num_n1.to(device)[None, :]
+        self.dts = th.hstack(self.adjacency_dts)[None, :]  # 每条边的权重，与 n1_ids 的顺序相同
+        if self.if_weighted:  # 每个节点的边的权重之和，代替局部搜索中的 n0_num_n1
+            self.n0_sum_dts = th.zeros(self.num_nodes, device=device).index_add_(0, self.n0_ids[0], self.dts[0])[None, :]
+        else:
+            self.n0_sum_dts = self.n0_num_n1
+
+        '''bit-packed 的解：每条边的两个端点所在的 word 和 bit，见 obj_packed'''
+        self.n0_words, self.n0_bits = self.n0_ids[0] // PACK_BITS, self.n0_ids[0] % PACK_BITS
+        self.n1_words, self.n1_bits = self.n1_ids[0] // PACK_BITS, self.n1_ids[0] % PACK_BITS
+
+        '''CSR 格式的稀疏双向邻接矩阵，用于局部场 local fields，见 calc_local_fields。自环不影响割，权重置0'''
+        offsets, indices, weights = graph.csr_tensors()
+        row_ids = th.repeat_interleave(th.arange(graph.num_nodes), th.from_numpy(graph.degrees).long())
+        values = weights.float() * indices.long().ne(row_ids)
+        self.csr_offsets = offsets.long().to(device)
+        self.csr_indices = indices.long().to(device)
+        self.csr_values = values.to(device)
+        self.adjacency_sparse = th.sparse_coo_tensor(th.stack((row_ids.to(device), self.csr_indices)), self.csr_values,
+                                                     size=(graph.num_nodes, graph.num_nodes),
+                                                     check_invariants=False).coalesce()
+        self.csr_bounds = graph.offsets.tolist()
+
+    @property
+    def adjacency_bool(self) -> TEN:
+        """稠密的双向邻接矩阵，shape == (num_nodes, num_nodes)，只有 maxcut_end2end 的网络输入需要，第一次访问时由 CSR 建立"""
+        if self._adjacency_bool is None:
+            row_ids = th.repeat_interleave(th.arange(self.num_nodes, device=self.device), self.csr_offsets.diff())
+            adjacency_bool = th.zeros((self.num_nodes, self.num_nodes), dtype=th.bool, device=self.device)
+            adjacency_bool[row_ids, self.csr_indices] = True
+            self._adjacency_bool = adjacency_bool
+        return self._adjacency_bool
+
+    def release_adjacency_bool(self):
+        """释放稠密的邻接矩阵，下次访问 adjacency_bool 时重新建立"""
+        self._adjacency_bool = None
 
     def obj(self, xs: TEN, if_sum: bool = True) -> TEN:
-        num_sims = xs.shape[0]  # 并行维度，环境数量。xs, vs第一个维度， dim0 , 就是环境数量
-        if num_sims != self.sim_ids.shape[0]:
-            self.n0_ids = self.n0_ids[0].repeat(num_sims, 1)
-            self.n1_ids = self.n1_ids[0].repeat(num_sims, 1)
-            self.sim_ids = self.sim_ids[0:1] + th.arange(num_sims, dtype=self.int_type, device=self.device)[:, None]
-
-        values = xs[self.sim_ids, self.n0_ids] ^ xs[self.sim_ids, self.n1_ids]
+        # xs.shape == (num_sims, num_nodes)，num_sims 是并行维度，环境数量。边的索引 (1, num_edges) 在 dim0 上广播
+        values = xs[:, self.n0_ids[0]] ^ xs[:, self.n1_ids[0]]
+        if self.if_weighted:
+            values = values * self.dts
         if if_sum:
             values = values.sum(1)
         if self.if_bidirectional:
-            values = values // 2
+            values = values / 2 if self.if_weighted else values // 2
+        return values
+
+    def obj_packed(self, packed_xs: TEN, if_sum: bool = True, chunk_bytes: int = 2 ** 18) -> TEN:
+        """
+        与 obj 相同，但输入 pack_xs 压缩后的解 packed_xs.shape == (num_sims, num_words)。
+        每条边取出两个端点所在的 word，移位后 XOR，最低位就是这条边是否被切割。
+        一个解只有 num_words 个 word，取 word 时命中缓存。
+        按 num_sims 分块计算，使中间结果 (chunk_sims, num_edges) 不超过 chunk_bytes，留在CPU的缓存里
+        """
+        num_sims = packed_xs.shape[0]
+        chunk_sims = max(1, chunk_bytes // (8 * max(self.n0_words.shape[0], 1)))
+        values = []
+        for xs in packed_xs.split(chunk_sims, dim=0):
+            cuts = xs[:, self.n0_words] >> self.n0_bits
+            cuts ^= xs[:, self.n1_words] >> self.n1_bits
+            cuts &= 1
+            if self.if_weighted:
+                cuts = cuts * self.dts
+            values.append(cuts.sum(1) if if_sum else cuts)
+        values = th.cat(values, dim=0) if num_sims > 0 else th.zeros(0, dtype=self.obj_type, device=self.device)
+        if self.if_bidirectional:
+            values = values / 2 if self.if_weighted else values // 2
         return values
 
     def obj_for_loop(self, xs: TEN, if_sum: bool = True) -> TEN:  # 代码简洁，但是计算效率低
         num_sims, num_nodes = xs.shape
-        values = th.zeros((num_sims, num_nodes), dtype=self.int_type, device=self.device)
+        values = th.zeros((num_sims, num_nodes), dtype=self.obj_type, device=self.device)
         for node0 in range(num_nodes):
             node1s = self.adjacency_indies[node0]
             if node1s.shape[0] > 0:
-                values[:, node0] = (xs[:, node0, None] ^ xs[:, node1s]).sum(dim=1)
+                cuts = xs[:, node0, None] ^ xs[:, node1s]
+                if self.if_weighted:
+                    cuts = cuts * self.adjacency_dts[node0]
+                values[:, node0] = cuts.sum(dim=1)
 
         if if_sum:
             values = values.sum(dim=1)
@@ -69,6 +160,52 @@ class SimulatorMaxcut:
             values = values.float() / 2
         return values
 
+    '''局部场 local fields：spins = 2 * xs - 1，fields = spins @ A，A是对称的（带权的）邻接矩阵
+    翻转节点i，割的变化量 gain_i = spins_i * fields_i，翻转一组节点 F 的变化量见 calc_flip_set_gains，
+    翻转后只需要用稀疏矩阵乘法（或节点i的邻居）更新 fields，不需要重新计算整个 obj'''
+
+    def calc_local_fields(self, xs: TEN) -> TEN:
+        spins = xs.float() * 2 - 1
+        return th.sparse.mm(self.adjacency_sparse, spins.t()).t()
+
+    def calc_flip_set_gains(self, xs: TEN, fields: TEN, flip_mask: TEN) -> (TEN, TEN):
+        """
+        每个并行的解 xs[k] 翻转 flip_mask[k] 中的节点后，割的变化量 gains[k]
+        gains = sum_{i in F} spins_i * fields_i - 2 * sum_{(i, j) in edges, i, j in F} spins_i * spins_j
+        同时返回 flip_fields = (A @ (mask * spins)) ，翻转后 fields -= 2 * flip_fields
+        """
+        flip_spins = flip_mask.float() * (xs.float() * 2 - 1)
+        flip_fields = th.sparse.mm(self.adjacency_sparse, flip_spins.t()).t()
+        gains = (flip_spins * fields).sum(dim=1) - (flip_spins * flip_fields).sum(dim=1)
+        return gains, flip_fields
+
+    def flip_set_inplace(self, xs: TEN, vs: TEN, fields: TEN, flip_mask: TEN):
+        """翻转 flip_mask 中的节点，如果 割不变小（与 update_xs_by_vs 相同），就原地更新 xs, vs, fields"""
+        gains, flip_fields = self.calc_flip_set_gains(xs, fields, flip_mask)
+        good_is = gains.ge(0) if self.if_maximize else gains.le(0)
+        xs[good_is] ^= flip_mask[good_is]
+        vs[good_is] += gains[good_is].to(vs.dtype)
+        fields[good_is] -= 2 * flip_fields[good_is]
+
+    def flip_nodes_inplace(self, xs: TEN, vs: TEN, fields: TEN = None):
+        """
+        依次尝试翻转每个节点，割不变小就接受，与逐个节点翻转后重新计算 obj 再 update_xs_by_vs 的结果相同。
+        每个节点的 gain 直接从 fields 读出，接受后只更新它的邻居的 fields，每个解的总计算量是 O(E) 而不是 O(N * E)
+        """
+        fields = self.calc_local_fields(xs) if fields is None else fields
+        spins = xs.float() * 2 - 1
+        for i in range(self.num_nodes):
+            gains = spins[:, i] * fields[:, i]
+            good_is = gains.ge(0) if self.if_maximize else gains.le(0)
+            delta_spins = -2 * spins[:, i] * good_is  # 被接受的解，spins_i 从 s 变为 -s
+            begin, end = self.csr_bounds[i], self.csr_bounds[i + 1]
+            if end > begin:
+                fields[:, self.csr_indices[begin:end]] += delta_spins[:, None] * self.csr_values[None, begin:end]
+            spins[:, i] += delta_spins
+            vs += (gains * good_is).to(vs.dtype)
+        xs[:] = spins.gt(0)
+        return fields
+
     def generate_xs_randomly(self, num_sims):
         xs = th.randint(0, 2, size=(num_sims, self.num_nodes), dtype=th.bool, device=self.device)
         xs[:, 0] = 0
@@ -78,31 +215,23 @@ class SimulatorMaxcut:
                              num_iters: int = 8, num_spin: int = 8, noise_std: float = 0.3):
 
         vs_raw = self.obj_for_loop(good_xs, if_sum=False)
-        good_vs = vs_raw.sum(dim=1).long() if good_vs.shape == () else good_vs.long()
-        ws = self.n0_num_n1 - (2 if self.if_bidirectional else 1) * vs_raw
+        good_vs = (vs_raw.sum(dim=1) if good_vs.shape == () else good_vs).to(self.obj_type)
+        ws = self.n0_sum_dts - (2 if self.if_bidirectional else 1) * vs_raw
         ws_std = ws.max(dim=0, keepdim=True)[0] - ws.min(dim=0, keepdim=True)[0]
         rd_std = ws_std.float() * noise_std
         spin_rand = ws + th.randn_like(ws, dtype=th.float32) * rd_std
         thresh = th.kthvalue(spin_rand, k=self.num_nodes - num_spin, dim=1)[0][:, None]
 
+        fields = self.calc_local_fields(good_xs)
         for _ in range(num_iters):
             '''flip randomly with ws(weights)'''
             spin_rand = ws + th.randn_like(ws, dtype=th.float32) * rd_std
             spin_mask = spin_rand.gt(thresh)
 
-            xs = good_xs.clone()
-            xs[spin_mask] = th.logical_not(xs[spin_mask])
-            vs = self.obj(xs)
-
-            update_xs_by_vs(good_xs, good_vs, xs, vs, if_maximize=self.if_maximize)
+            self.flip_set_inplace(good_xs, good_vs, fields, spin_mask)
 
         '''addition'''
-        for i in range(self.num_nodes):
-            xs1 = good_xs.clone()
-            xs1[:, i] = th.logical_not(xs1[:, i])
-            vs1 = self.obj(xs1)
-
-            update_xs_by_vs(good_xs, good_vs, xs1, vs1, if_maximize=self.if_maximize)
+        self.flip_nodes_inplace(good_xs, good_vs, fields)
         return good_xs, good_vs
 
 
@@ -165,6 +294,39 @@ def check_simulator():
     pass
 
 
+def benchmark_packed_obj():
+    """比较 bool 的 obj 和 bit-packed 的 obj_packed 的耗时和解的内存"""
+    gpu_id = int(sys.argv[1]) if len(sys.argv) > 1 else -1
+    device = th.device(f'cuda:{gpu_id}' if th.cuda.is_available() and gpu_id >= 0 else 'cpu')
+    num_sims = 2 ** 10
+    num_repeats = 4
+
+    for graph_name in ('gset_14', 'gset_22', 'gset_55', 'gset_70'):
+        simulator = SimulatorMaxcut(sim_name=graph_name, device=device)
+        xs = simulator.generate_xs_randomly(num_sims=num_sims)
+        packed_xs = pack_xs(xs)
+        assert th.equal(unpack_xs(packed_xs, simulator.num_nodes), xs)
+        assert th.equal(simulator.obj(xs), simulator.obj_packed(packed_xs))
+
+        used_times = []
+        for obj_func, _xs in ((simulator.obj, xs), (simulator.obj_packed, packed_xs)):
+            timer = time.time()
+            for _ in range(num_repeats):
+                obj_func(_xs)
+            if device.type == 'cuda':
+                th.cuda.synchronize(device)
+            used_times.append((time.time() - timer) / num_repeats)
+        xs_mb = xs.numel() * xs.element_size() / 2 ** 20
+        ids_mb = sum(t.numel() * 8 for t in (simulator.n0_ids, simulator.n1_ids)) / 2 ** 20
+        packed_xs_mb = packed_xs.numel() * packed_xs.element_size() / 2 ** 20
+        packed_ids_mb = sum(t.numel() * 8 for t in (simulator.n0_words, simulator.n0_bits,
+                                                     simulator.n1_words, simulator.n1_bits)) / 2 ** 20
+        print(f"| {graph_name:8}  num_nodes {simulator.num_nodes:6}  num_edges {simulator.num_edges:6}  "
+              f"num_sims {num_sims}  "
+              f"obj {used_times[0]:7.3f}s xs {xs_mb:6.2f}MB ids {ids_mb:7.2f}MB  "
+              f"obj_packed {used_times[1]:7.3f}s xs {packed_xs_mb:6.2f}MB ids {packed_ids_mb:7.2f}MB")
+
+
 def check_local_search():
     gpu_id = int(sys.argv[1]) if len(sys.argv) > 1 else 0
     device = th.device(f'cuda:{gpu_id}' if th.cuda.is_available() and gpu_id >= 0 else 'cpu')
@@ -223,3 +385,4 @@ def check_local_search():
 if __name__ == '__main__':
     check_simulator()
     # check_local_search()
+    # benchmark_packed_obj()
@@ -0,0 +1,85 @@
+import functools
+import numpy as np
+import networkx as nx
+import scipy.sparse
+import scipy.sparse.linalg
+from typing import Optional, Union
+
+from methods.config import *
+from methods.graph_csr import GraphCSR
+
+
+# Cheap upper bounds of maxcut, so that the gap of a heuristic is known without running gurobi.
+# The cut of x in {-1, 1}^N is x^T L x / 4, where L is the weighted Laplacian. For any y in R^N,
+#   x^T L x / 4 = sum_i y_i + x^T (L / 4 - Diag(y)) x <= sum_i y_i + N * max(0, lambda_max(L / 4 - Diag(y))),
+# which is the dual of the SDP relaxation of maxcut.
+# - y = 0: the eigenvalue bound N * lambda_max(L) / 4.
+# - y_i = (L V V^T)_ii / 4 from the low-rank SDP solution V: the SDP dual bound, which is close to the SDP value.
+# lambda_max is computed by Lanczos (eigsh) on the sparse matrix, O(E) per iteration.
+
+OBJ_BOUND_METHODS = ['eigenvalue', 'sdp']
+
+
+def build_laplacian(graph: Union[nx.Graph, GraphCSR]) -> scipy.sparse.csr_matrix:
+    from methods.util import obtain_edge_arrays
+    num_nodes = int(graph.number_of_nodes())
+    edge_n0s, edge_n1s, edge_weights = obtain_edge_arrays(graph)
+    edge_weights = np.asarray(edge_weights, dtype=np.float64)
+    adjacency_matrix = scipy.sparse.coo_matrix((edge_weights, (edge_n0s, edge_n1s)), shape=(num_nodes, num_nodes))
+    adjacency_matrix = (adjacency_matrix + adjacency_matrix.T).tocsr()
+    degrees = np.asarray(adjacency_matrix.sum(axis=1)).reshape(-1)
+    return (scipy.sparse.diags(degrees) - adjacency_matrix).tocsr()
+
+
+# the largest eigenvalue of a symmetric sparse matrix
+def calc_max_eigenvalue(matrix: scipy.sparse.spmatrix) -> float:
+    num_nodes = matrix.shape[0]
+    if num_nodes <= 64:
+        return float(np.linalg.eigvalsh(matrix.toarray())[-1])
+    # the tolerance of Lanczos is relative, and a small margin keeps the bound valid
+    eigenvalue = scipy.sparse.linalg.eigsh(matrix, k=1, which='LA', tol=1e-8, return_eigenvectors=False)[0]
+    return float(eigenvalue) + 1e-6 * max(abs(float(eigenvalue)), 1.0)
+
+
+# sum_i y_i + N * max(0, lambda_max(L / 4 - Diag(y)))
+def calc_dual_bound_maxcut(laplacian: scipy.sparse.csr_matrix, ys: np.ndarray) -> float:
+    num_nodes = laplacian.shape[0]
+    eigenvalue = calc_max_eigenvalue(laplacian / 4 - scipy.sparse.diags(ys))
+    return float(ys.sum()) + num_nodes * max(0.0, eigenvalue)
+
+
+def eigenvalue_bound_maxcut(graph: Union[nx.Graph, GraphCSR]) -> float:
+    laplacian = build_laplacian(graph)
+    return calc_dual_bound_maxcut(laplacian, np.zeros(laplacian.shape[0]))
+
+
+def sdp_bound_maxcut(graph: Union[nx.Graph, GraphCSR], rank: Optional[int] = None) -> float:
+    from methods.sdp import solve_sdp_maxcut_low_rank
+    laplacian = build_laplacian(graph)
+    vectors, _ = solve_sdp_maxcut_low_rank(graph, rank, if_print=False)
+    ys = np.sum(vectors * (laplacian @ vectors), axis=1) / 4
+    return calc_dual_bound_maxcut(laplacian, ys)
+
+
+# the best (smallest) upper bound of the methods up to method, i.e., 'sdp' returns the min of the eigenvalue bound
+# and the SDP dual bound. Only maxcut is supported, and None is returned for the other problems.
+def calc_obj_bound(graph: Union[nx.Graph, GraphCSR], method: str = 'sdp') -> Optional[float]:
+    assert method in OBJ_BOUND_METHODS
+    if PROBLEM != Problem.maxcut:
+        return None
+    obj_bound = eigenvalue_bound_maxcut(graph)
+    if method == 'sdp':
+        obj_bound = min(obj_bound, sdp_bound_maxcut(graph))
+    return obj_bound
+
+
+# the bound of a data file, computed once per file, since the results of a file are written many times.
+# None is returned if eigsh or the SDP fails, so that the results are still written.
+@functools.lru_cache(maxsize=None)
+def calc_obj_bound_of_file(filename: str, method: str = 'sdp') -> Optional[float]:
+    from methods.util import read_graph_csr
+    try:
+        return calc_obj_bound(read_graph_csr(filename), method)
+    except (scipy.sparse.linalg.ArpackError, np.linalg.LinAlgError, ValueError, FloatingPointError) as error:
+        print(f'the obj_bound of {filename} is not calculated: {error!r}')
+        return None
@@ -53,6 +53,17 @@ GUROBI_VAR_CONTINUOUS = False  # True: relax it to LP, and return x values. Fals
 GUROBI_MILP_QUBO = 1  # 0: MILP, 1: QUBO
 assert GUROBI_MILP_QUBO in [0, 1]
 
+# the heuristic whose solution is the MIP start of gurobi and scip, see warm_start.py.
+# None: no warm start. 'greedy', 'simulated_annealing', or 'local_search' (L2A, maxcut only)
+MIP_WARM_START_ALG = None
+assert MIP_WARM_START_ALG in [None, 'greedy', 'simulated_annealing', 'local_search']
+
+# the upper bound of maxcut written with the results and used to report the gap to bound, see bounds.py.
+# None: not calculated. 'eigenvalue': the eigenvalue bound. 'sdp': the min of the eigenvalue bound and the SDP dual bound
+# The bound is computed once per file, by AnytimeRecorder before the clock of the solver starts, or when the result is written.
+OBJ_BOUND_METHOD = None
+assert OBJ_BOUND_METHOD in [None, 'eigenvalue', 'sdp']
+
 
 ModelDir = './model'  # FIXME plan to cancel
 
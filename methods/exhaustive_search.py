@@ -0,0 +1,344 @@
+import sys
+sys.path.append('../')
+
+import time
+import itertools
+from typing import Union, Optional, List
+import numpy as np
+import networkx as nx
+from util import (read_graph_csr,
+                  obtain_edge_arrays,
+                  run_greedy_over_multiple_files,
+                  )
+
+from config import *
+from methods.graph_csr import GraphCSR
+
+# Exact solvers of maxcut, graph_partitioning, minimum_vertex_cover and maximum_independent_set on small graphs,
+# as the ground truth of the heuristics. The objectives are the same as obj_maxcut, obj_graph_partitioning,
+# obj_minimum_vertex_cover and obj_maximum_independent_set, i.e., the higher, the better, and -INF if infeasible.
+# - gray_code_search: exhaustive search up to MAX_NUM_NODES_GRAY_CODE nodes.
+# - branch_and_bound: for slightly larger graphs.
+
+MAX_NUM_NODES_GRAY_CODE = 30
+NUM_BLOCK_NODES = 16  # the 2^NUM_BLOCK_NODES assignments of the first nodes are evaluated together as a numpy block
+
+
+def obtain_simple_edge_arrays(graph: Union[nx.Graph, GraphCSR]) -> (np.ndarray, np.ndarray, np.ndarray):
+    edge_n0s, edge_n1s, edge_weights = obtain_edge_arrays(graph)
+    edge_n0s, edge_n1s = np.asarray(edge_n0s, dtype=np.int64), np.asarray(edge_n1s, dtype=np.int64)
+    is_not_loop = edge_n0s != edge_n1s
+    return edge_n0s[is_not_loop], edge_n1s[is_not_loop], np.asarray(edge_weights, dtype=np.float64)[is_not_loop]
+
+
+# the objectives of the rows of a block, from the cut values, the numbers of selected nodes, uncovered edges
+# (both ends unselected) and conflicting edges (both ends selected)
+def calc_block_objs(num_nodes: int, cuts: np.ndarray, nums_selected: np.ndarray, nums_uncovered: np.ndarray,
+                    nums_conflict: np.ndarray) -> np.ndarray:
+    if PROBLEM == Problem.maxcut:
+        return cuts
+    elif PROBLEM == Problem.graph_partitioning:
+        return np.where(nums_selected == num_nodes / 2, -cuts, -INF)
+    elif PROBLEM == Problem.minimum_vertex_cover:
+        return np.where(nums_uncovered == 0, -nums_selected.astype(np.float64), -INF)
+    elif PROBLEM == Problem.maximum_independent_set:
+        return np.where(nums_conflict == 0, nums_selected.astype(np.float64), -INF)
+    raise ValueError(f'{PROBLEM} is not supported')
+
+
+# Exhaustive search over all the 2^N solutions. The first k = min(N, NUM_BLOCK_NODES) nodes (low nodes) take all
+# their 2^k assignments in a numpy block, and the other nodes (high nodes) are walked in Gray-code order, so that each
+# step flips one high node h and updates the block in O(2^k + deg(h)):
+#   cut += (1 - 2 * x_h) * (W_h - 2 * Wsel_h), nums_uncovered -= (1 - 2 * x_h) * (deg_h - Nsel_h),
+#   nums_conflict += (1 - 2 * x_h) * Nsel_h, nums_selected += 1 - 2 * x_h,
+# where W_h, deg_h are the weighted and unweighted degrees, and Wsel_h, Nsel_h are those of the selected neighbors,
+# i.e., a block vector of the low neighbors fixed for the whole search, plus a scalar of the high neighbors.
+def gray_code_search(graph: Union[nx.Graph, GraphCSR]) -> (float, List[int]):
+    num_nodes = int(graph.number_of_nodes())
+    assert num_nodes <= MAX_NUM_NODES_GRAY_CODE
+    edge_n0s, edge_n1s, edge_weights = obtain_simple_edge_arrays(graph)
+    num_low = min(num_nodes, NUM_BLOCK_NODES)
+    num_high = num_nodes - num_low
+
+    # the block of all the assignments of the low nodes, and the high nodes are 0
+    low_xs = ((np.arange(2 ** num_low)[:, None] >> np.arange(num_low)[None, :]) & 1).astype(np.int8)
+    xs = np.zeros((2 ** num_low, num_nodes), dtype=np.int8)
+    xs[:, :num_low] = low_xs
+    xs0, xs1 = xs[:, edge_n0s], xs[:, edge_n1s]
+    cuts = (xs0 != xs1).astype(np.float64) @ edge_weights
+    nums_selected = low_xs.sum(axis=1).astype(np.int64)
+    nums_uncovered = ((xs0 == 0) & (xs1 == 0)).sum(axis=1).astype(np.int64)
+    nums_conflict = ((xs0 == 1) & (xs1 == 1)).sum(axis=1).astype(np.int64)
+    del xs, xs0, xs1
+
+    # the low neighbors (block vectors) and high neighbors (scalars) of the high nodes
+    weighted_degrees = np.bincount(np.concatenate((edge_n0s, edge_n1s)),
+                                   weights=np.concatenate((edge_weights, edge_weights)), minlength=num_nodes)
+    degrees = np.bincount(np.concatenate((edge_n0s, edge_n1s)), minlength=num_nodes)
+    low_selected_weights = np.zeros((num_high, 2 ** num_low))
+    low_selected_counts = np.zeros((num_high, 2 ** num_low), dtype=np.int64)
+    high_neighbors = [[] for _ in range(num_high)]
+    for n0, n1, weight in zip(edge_n0s.tolist(), edge_n1s.tolist(), edge_weights.tolist()):
+        for h, j in ((n0, n1), (n1, n0)):
+            if h < num_low:
+                continue
+            if j < num_low:
+                low_selected_weights[h - num_low] += weight * low_xs[:, j]
+                low_selected_counts[h - num_low] += low_xs[:, j]
+            else:
+                high_neighbors[h - num_low].append((j - num_low, weight))
+    need_cuts = PROBLEM in [Problem.maxcut, Problem.graph_partitioning]
+    need_uncovered = PROBLEM == Problem.minimum_vertex_cover
+    need_conflict = PROBLEM == Problem.maximum_independent_set
+    high_selected_weights = np.zeros(num_high)
+    high_selected_counts = np.zeros(num_high, dtype=np.int64)
+    high_xs = np.zeros(num_high, dtype=np.int8)
+
+    objs = calc_block_objs(num_nodes, cuts, nums_selected, nums_uncovered, nums_conflict)
+    best_row = int(np.argmax(objs))
+    best_obj = float(objs[best_row])
+    best_high_xs = high_xs.copy()
+    for step in range(1, 2 ** num_high):
+        h = (step & -step).bit_length() - 1  # the lowest set bit of step
+        direction = 1 - 2 * int(high_xs[h])  # +1: 0 -> 1, -1: 1 -> 0
+        node = h + num_low
+        # only the counters used by the objective of PROBLEM are updated
+        if need_cuts:
+            cuts += direction * (weighted_degrees[node] - 2 * high_selected_weights[h])
+            cuts -= (2 * direction) * low_selected_weights[h]
+        if need_uncovered:
+            nums_uncovered -= direction * (degrees[node] - high_selected_counts[h])
+            nums_uncovered += direction * low_selected_counts[h]
+        if need_conflict:
+            nums_conflict += direction * high_selected_counts[h]
+            nums_conflict += direction * low_selected_counts[h]
+        nums_selected += direction
+        high_xs[h] ^= 1
+        for j, weight in high_neighbors[h]:
+            high_selected_weights[j] += direction * weight
+            high_selected_counts[j] += direction
+
+        objs = calc_block_objs(num_nodes, cuts, nums_selected, nums_uncovered, nums_conflict)
+        row = int(np.argmax(objs))
+        if objs[row] > best_obj:
+            best_obj = float(objs[row])
+            best_row = row
+            best_high_xs = high_xs.copy()
+    solution = low_xs[best_row].tolist() + best_high_xs.tolist()
+    return best_obj, solution
+
+
+# Depth-first branch and bound of maxcut and graph_partitioning, i.e., maximize sign * cut with sign = 1 and -1.
+# The nodes are assigned in descending order of degrees, and node 0 of the order is fixed to 0 by symmetry.
+# gains[b][v] is the change of sign * cut if the unassigned node v is assigned b, from its assigned neighbors, and
+# the bound of a partial solution is
+#   obj + sum_{unassigned v} max(gains[0][v], gains[1][v]) + sum_{unassigned edges} max(0, sign * w).
+def branch_and_bound_cut(graph: Union[nx.Graph, GraphCSR]) -> (float, List[int]):
+    num_nodes = int(graph.number_of_nodes())
+    sign = 1.0 if PROBLEM == Problem.maxcut else -1.0
+    need_balance = PROBLEM == Problem.graph_partitioning
+    if need_balance and num_nodes % 2 == 1:
+        return -INF, [0] * num_nodes
+    edge_n0s, edge_n1s, edge_weights = obtain_simple_edge_arrays(graph)
+    neighbors = [[] for _ in range(num_nodes)]
+    for n0, n1, weight in zip(edge_n0s.tolist(), edge_n1s.tolist(), edge_weights.tolist()):
+        neighbors[n0].append((n1, sign * weight))
+        neighbors[n1].append((n0, sign * weight))
+    order = sorted(range(num_nodes), key=lambda v: -len(neighbors[v]))
+    position = [0] * num_nodes
+    for d, v in enumerate(order):
+        position[v] = d
+
+    gains = np.zeros((2, num_nodes))
+    solution = [0] * num_nodes
+    state = {'obj': 0.0, 'rest': float(np.maximum(sign * edge_weights, 0).sum()),
+             'best_obj': -INF, 'best_solution': [0] * num_nodes, 'nums': [0, 0]}
+
+    def assign(v: int, b: int, direction: int):
+        for j, weight in neighbors[v]:
+            if position[j] > position[v]:
+                # the edge (v, j) is cut iff j is assigned 1 - b
+                gains[1 - b][j] += direction * weight
+                state['rest'] -= direction * max(0.0, weight)
+
+    def search(depth: int):
+        if depth == num_nodes:
+            if state['obj'] > state['best_obj']:
+                state['best_obj'] = state['obj']
+                state['best_solution'] = list(solution)
+            return
+        unassigned = order[depth:]
+        bound = state['obj'] + float(np.maximum(gains[0][unassigned], gains[1][unassigned]).sum()) + state['rest']
+        if bound <= state['best_obj'] + 1e-9:
+            return
+        v = order[depth]
+        values = [0] if depth == 0 else sorted([0, 1], key=lambda b: -gains[b][v])
+        for b in values:
+            if need_balance and state['nums'][b] >= num_nodes // 2:
+                continue
+            solution[v] = b
+            state['nums'][b] += 1
+            gain = gains[b][v]
+            state['obj'] += gain
+            assign(v, b, 1)
+            search(depth + 1)
+            assign(v, b, -1)
+            state['obj'] -= gain
+            state['nums'][b] -= 1
+        solution[v] = 0
+
+    recursion_limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(recursion_limit, 2 * num_nodes + 100))
+    search(0)
+    sys.setrecursionlimit(recursion_limit)
+    return float(state['best_obj']), state['best_solution']
+
+
+# Branch and bound of maximum_independent_set with the nodes as bits of python ints. The bound of a partial solution
+# is the number of selected nodes plus the number of candidates. The node with the most candidate neighbors is
+# branched, and the candidates without candidate neighbors are selected directly.
+def branch_and_bound_independent_set(graph: Union[nx.Graph, GraphCSR]) -> (int, List[int]):
+    num_nodes = int(graph.number_of_nodes())
+    edge_n0s, edge_n1s, _ = obtain_simple_edge_arrays(graph)
+    neighbor_masks = [0] * num_nodes
+    for n0, n1 in zip(edge_n0s.tolist(), edge_n1s.tolist()):
+        neighbor_masks[n0] |= 1 << n1
+        neighbor_masks[n1] |= 1 << n0
+    best = {'size': -1, 'mask': 0}
+
+    def search(selected_mask: int, size: int, candidates: int):
+        while True:
+            if size + bin(candidates).count('1') <= best['size']:
+                return
+            if candidates == 0:
+                best['size'], best['mask'] = size, selected_mask
+                return
+            # the candidates without candidate neighbors are in every maximum independent set of the rest
+            isolated = 0
+            rest = candidates
+            while rest:
+                bit = rest & -rest
+                rest ^= bit
+                if neighbor_masks[bit.bit_length() - 1] & candidates == 0:
+                    isolated |= bit
+            if isolated == 0:
+                break
+            selected_mask |= isolated
+            size += bin(isolated).count('1')
+            candidates &= ~isolated
+        v, max_degree = -1, -1
+        rest = candidates
+        while rest:
+            bit = rest & -rest
+            rest ^= bit
+            degree = bin(neighbor_masks[bit.bit_length() - 1] & candidates).count('1')
+            if degree > max_degree:
+                v, max_degree = bit.bit_length() - 1, degree
+        search(selected_mask | (1 << v), size + 1, candidates & ~(1 << v) & ~neighbor_masks[v])
+        search(selected_mask, size, candidates & ~(1 << v))
+
+    recursion_limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(recursion_limit, 2 * num_nodes + 100))
+    search(0, 0, (1 << num_nodes) - 1)
+    sys.setrecursionlimit(recursion_limit)
+    solution = [(best['mask'] >> i) & 1 for i in range(num_nodes)]
+    return best['size'], solution
+
+
+# the minimum vertex cover is the complement of the maximum independent set
+def branch_and_bound(graph: Union[nx.Graph, GraphCSR]) -> (float, List[int]):
+    if PROBLEM in [Problem.maxcut, Problem.graph_partitioning]:
+        return branch_and_bound_cut(graph)
+    elif PROBLEM == Problem.maximum_independent_set:
+        size, solution = branch_and_bound_independent_set(graph)
+        return float(size), solution
+    elif PROBLEM == Problem.minimum_vertex_cover:
+        size, solution = branch_and_bound_independent_set(graph)
+        return -float(len(solution) - size), [1 - x for x in solution]
+    raise ValueError(f'{PROBLEM} is not supported')
+
+
+# num_steps is useless. The same interface as the greedy algorithms, so that run_greedy_over_multiple_files is used.
+def exhaustive_search(num_steps: Optional[int], graph: Union[nx.Graph, GraphCSR]) -> (float, List[int], List[float]):
+    print('exhaustive_search')
+    start_time = time.time()
+    num_nodes = int(graph.number_of_nodes())
+    if num_nodes <= MAX_NUM_NODES_GRAY_CODE:
+        score, solution = gray_code_search(graph)
+    else:
+        score, solution = branch_and_bound(graph)
+    running_duration = time.time() - start_time
+    print(f"score: {score}, solution: {solution}")
+    print('running_duration: ', running_duration)
+    return score, solution, [score]
+
+
+# the objective of a solution of PROBLEM, computed directly from the edges (i, j, weight)
+def calc_obj_of_edges(solution: List[int], edges: List[tuple]) -> float:
+    num_selected = sum(solution)
+    if PROBLEM == Problem.maxcut:
+        return float(sum(weight for i, j, weight in edges if solution[i] != solution[j]))
+    elif PROBLEM == Problem.graph_partitioning:
+        if 2 * num_selected != len(solution):
+            return -INF
+        return -float(sum(weight for i, j, weight in edges if solution[i] != solution[j]))
+    elif PROBLEM == Problem.minimum_vertex_cover:
+        return -float(num_selected) if all(solution[i] or solution[j] for i, j, _ in edges) else -INF
+    elif PROBLEM == Problem.maximum_independent_set:
+        return float(num_selected) if not any(solution[i] and solution[j] for i, j, _ in edges) else -INF
+    raise ValueError(f'{PROBLEM} is not supported')
+
+
+# the brute force over all the 2^N solutions by itertools.product, as the reference of check_exhaustive_search
+def brute_force_search(graph: Union[nx.Graph, GraphCSR]) -> float:
+    num_nodes = int(graph.number_of_nodes())
+    edge_n0s, edge_n1s, edge_weights = obtain_simple_edge_arrays(graph)
+    edges = list(zip(edge_n0s.tolist(), edge_n1s.tolist(), edge_weights.tolist()))
+    return max(calc_obj_of_edges(list(solution), edges) for solution in itertools.product([0, 1], repeat=num_nodes))
+
+
+# gray_code_search (with the default blocks, and with small blocks so that the Gray-code walk of the high nodes is
+# used) and branch_and_bound are compared with brute_force_search on syn_5_5 and random graphs of at most 12 nodes,
+# for maxcut, graph_partitioning, minimum_vertex_cover and maximum_independent_set.
+def check_exhaustive_search(num_graphs: int = 8, seed: int = 0):
+    global PROBLEM, NUM_BLOCK_NODES
+    graphs = [('syn_5_5', read_graph_csr('../data/syn_5_5.txt'))]
+    rng = np.random.default_rng(seed)
+    for i in range(num_graphs):
+        num_nodes = int(rng.integers(2, 13))
+        graph = nx.gnp_random_graph(num_nodes, 0.4, seed=int(rng.integers(2 ** 30)))
+        for n0, n1 in graph.edges:
+            graph[n0][n1]['weight'] = int(rng.integers(1, 4))
+        graphs.append((f'random_{num_nodes}_{i}', graph))
+
+    problem, num_block_nodes = PROBLEM, NUM_BLOCK_NODES
+    for PROBLEM in [Problem.maxcut, Problem.graph_partitioning,
+                    Problem.minimum_vertex_cover, Problem.maximum_independent_set]:
+        for name, graph in graphs:
+            edge_n0s, edge_n1s, edge_weights = obtain_simple_edge_arrays(graph)
+            edges = list(zip(edge_n0s.tolist(), edge_n1s.tolist(), edge_weights.tolist()))
+            obj = brute_force_search(graph)
+            results = []
+            for NUM_BLOCK_NODES in [num_block_nodes, 3]:
+                results.append(('gray_code_search', *gray_code_search(graph)))
+            NUM_BLOCK_NODES = num_block_nodes
+            results.append(('branch_and_bound', *branch_and_bound(graph)))
+            for alg_name, score, solution in results:
+                assert score == obj, (PROBLEM, name, alg_name, score, obj)
+                assert obj == -INF or calc_obj_of_edges(solution, edges) == score, (PROBLEM, name, alg_name, solution)
+        print(f'check_exhaustive_search: {PROBLEM} of {len(graphs)} graphs is OK')
+    PROBLEM, NUM_BLOCK_NODES = problem, num_block_nodes
+
+
+if __name__ == '__main__':
+    check_exhaustive_search()
+    print(f'problem: {PROBLEM}')
+    graph = read_graph_csr('../data/syn_5_5.txt')
+    score, solution, scores = exhaustive_search(None, graph)
+
+    alg_name = 'exhaustive_search'
+    num_steps = None
+    directory_data = '../data/syn'
+    prefixes = ['syn_10_']
+    scoress = run_greedy_over_multiple_files(exhaustive_search, alg_name, num_steps, directory_data, prefixes)
+    print(f"scoress: {scoress}")
@@ -0,0 +1,103 @@
+import heapq
+import numpy as np
+import networkx as nx
+from typing import List, Union, Optional
+
+from methods.graph_csr import GraphCSR
+
+
+# Incremental objective of binary graph problems (maxcut, graph_partitioning) under single-node flips.
+# gains[i] is the change of the cut value when node i is flipped, i.e.,
+#   gains[i] = sum of the weights of the uncut edges of i - sum of the weights of the cut edges of i.
+# Flipping node i only changes gains[i] and the gains of its neighbors, so each flip costs O(deg(i)) instead of
+# recomputing the objective in O(E) or O(N^2).
+# For graph_partitioning (minimize_cut=True), the objective is the negative cut value, and the gains are negated as well.
+class FlipGainEngine:
+    def __init__(self, graph: Union[nx.Graph, GraphCSR], solution: Union[List[int], np.array],
+                 minimize_cut: bool = False):
+        self.graph = graph if isinstance(graph, GraphCSR) else GraphCSR.from_nxgraph(graph)
+        self.sign = -1.0 if minimize_cut else 1.0
+        self.solution = np.array(solution, dtype=np.int8)
+        assert self.solution.shape == (self.graph.num_nodes,)
+
+        edge_n0s, edge_n1s = self.graph.edge_n0s, self.graph.edge_n1s
+        edge_weights = self.graph.edge_weights.astype(np.float64)
+        is_cut = self.solution[edge_n0s] != self.solution[edge_n1s]
+        contributions = np.where(is_cut, -edge_weights, edge_weights)
+        self.cut_gains = np.bincount(edge_n0s, weights=contributions, minlength=self.graph.num_nodes) \
+            + np.bincount(edge_n1s, weights=contributions, minlength=self.graph.num_nodes)
+        self.cut_value = float(edge_weights[is_cut].sum())
+
+    @property
+    def objective(self) -> float:
+        return self.sign * self.cut_value
+
+    @property
+    def gains(self) -> np.ndarray:
+        return self.sign * self.cut_gains
+
+    # the change of the objective if node i is flipped
+    def gain(self, i: int) -> float:
+        return self.sign * float(self.cut_gains[i])
+
+    # the total weight of the edges between node i and node j
+    def edge_weight(self, i: int, j: int) -> float:
+        neighbors = self.graph.neighbors(i)
+        begin, end = np.searchsorted(neighbors, [j, j + 1])
+        return float(self.graph.neighbor_weights(i)[begin:end].sum())
+
+    # the change of the objective if node i and node j, in different parts, swap their parts
+    def swap_gain(self, i: int, j: int) -> float:
+        assert self.solution[i] != self.solution[j]
+        return self.sign * (float(self.cut_gains[i] + self.cut_gains[j]) + 2 * self.edge_weight(i, j))
+
+    def flip(self, i: int):
+        neighbors = self.graph.neighbors(i)
+        weights = self.graph.neighbor_weights(i).astype(np.float64)
+        # the edges to the neighbors on the same side become cut, and the cut edges become uncut
+        is_same_side = self.solution[neighbors] == self.solution[i]
+        np.add.at(self.cut_gains, neighbors, np.where(is_same_side, -2 * weights, 2 * weights))
+        self.cut_value += float(self.cut_gains[i])
+        self.cut_gains[i] = -self.cut_gains[i]
+        self.solution[i] ^= 1
+
+    def swap(self, i: int, j: int):
+        assert self.solution[i] != self.solution[j]
+        self.flip(i)
+        self.flip(j)
+
+    # (node, gain) of the flip with the largest gain, the smallest index is selected among ties.
+    # mask: bool array, only the nodes with mask[i] == True are considered.
+    def best_move(self, mask: Optional[np.ndarray] = None) -> (int, float):
+        gains = self.gains
+        if mask is not None:
+            gains = np.where(mask, gains, -np.inf)
+        node = int(np.argmax(gains))
+        return node, float(gains[node])
+
+
+# Max-priority queue of the gains in a FlipGainEngine, so that the best flip is found in O(log N) instead of O(N).
+# The heap keeps (-gain, node, version) and is updated lazily: after a flip, new entries are pushed for the flipped
+# node and its neighbors, and the entries with an old version are dropped when they reach the top.
+# The order of (-gain, node) selects the smallest index among ties, the same as FlipGainEngine.best_move().
+class FlipGainQueue:
+    def __init__(self, engine: FlipGainEngine):
+        self.engine = engine
+        self.versions = np.zeros(engine.graph.num_nodes, dtype=np.int64)
+        self.heap = [(-gain, node, 0) for node, gain in enumerate(engine.gains.tolist())]
+        heapq.heapify(self.heap)
+
+    def best_move(self) -> (int, float):
+        while True:
+            neg_gain, node, version = self.heap[0]
+            if version == self.versions[node]:
+                return node, -neg_gain
+            heapq.heappop(self.heap)
+
+    def flip(self, i: int):
+        self.engine.flip(i)
+        nodes = np.unique(np.append(self.engine.graph.neighbors(i), i))
+        self.versions[nodes] += 1
+        gains = self.engine.sign * self.engine.cut_gains[nodes]
+        for node, gain, version in zip(nodes.tolist(), gains.tolist(), self.versions[nodes].tolist()):
+            heapq.heappush(self.heap, (-gain, node, version))
@@ -1,8 +1,10 @@
 import copy
 import numpy as np
 import random
+import time
 
-from util import read_nxgraph
+from util import read_graph_csr
+from util import AnytimeRecorder
 from util import obj_maxcut
 
 # constants for tabuSearch
@@ -11,20 +13,20 @@ MaxIter = 100000
 gamma = 60
 
 
-def generate_random(graph):
+def generate_random(graph, recorder=None):
     nodes = list(graph.nodes())
     binary_vector = [random.randint(0, 1) for _ in range(len(nodes))]
-    return tabu_search(binary_vector, graph)
+    return tabu_search(binary_vector, graph, recorder)
 
 
-def generate_random_population(graph, pop_size):
+def generate_random_population(graph, pop_size, recorder=None):
     count = 1
     Pop = []
     best_binary_vector = []
     score_list = []
     best_score = 0
     while len(Pop) < pop_size:
-        binary_vector, result = generate_random(graph)
+        binary_vector, result = generate_random(graph, recorder)
         score = result
 
         if binary_vector not in Pop:
@@ -35,6 +37,8 @@ def generate_random_population(graph, pop_size):
             if score > best_score:
                 best_score = score
                 best_binary_vector = binary_vector
+        if recorder is not None and recorder.is_over():
+            break
     return Pop, best_binary_vector, best_score, score_list
 
 
@@ -85,7 +89,9 @@ def perturb(binary_vector):
     return binary_vector
 
 
-def tabu_search(initial_solution, graph):
+# If recorder (util.AnytimeRecorder) is not None, the best scores are reported to it, and the search stops after its
+# last running duration.
+def tabu_search(initial_solution, graph, recorder=None):
     # Initialize best solution and its score
     best_solution = initial_solution
     best_score = obj_maxcut(initial_solution, graph)
@@ -123,6 +129,8 @@ def tabu_search(initial_solution, graph):
             best_solution = copy.deepcopy(curr_solution)
             best_score = curr_score
             pit = 0
+        if recorder is not None and recorder.report(best_score, best_solution):
+            break
 
         # Increment iteration counter
         Iter += 1
@@ -137,7 +145,7 @@ def tabu_search(initial_solution, graph):
 
     return best_solution, best_score
 
-def cross_over(population):
+def cross_over(population, recorder=None):
     selected_parents = random.sample(population, num_parents)
 
     child = []
@@ -148,15 +156,17 @@ def cross_over(population):
             child.append(selected_parents[0][node])
         else:
             child.append(random.randint(0,1))
-    child, child_score = tabu_search(child,graph)
+    child, child_score = tabu_search(child, graph, recorder)
     return child
 
-def algorithm_run(graph):
-    population, best_binary_vector, best_score, population_scores = generate_random_population(graph, 10)
+# If recorder is not None, the tabu searches report to it, and the population generation and the crossovers stop
+# after its last running duration.
+def algorithm_run(graph, recorder=None):
+    population, best_binary_vector, best_score, population_scores = generate_random_population(graph, 10, recorder)
     c_iter = 0
     print("Start Genetic Crossover")
-    while c_iter < c_itMax:
-        child = cross_over(population)
+    while c_iter < c_itMax and not (recorder is not None and recorder.is_over()):
+        child = cross_over(population, recorder)
         if(child not in population):
             child_score = obj_maxcut(child,graph)
 
@@ -182,10 +192,18 @@ if __name__ == '__main__':
     # Constants
     num_parents = 5
     c_itMax = 5
+    # True: write the results at RUNNING_DURATIONS by AnytimeRecorder, and stop after the last one
+    use_anytime_recorder = False
     # read data
-    graph = read_nxgraph('../data/syn_PL/powerlaw_100_ID0.txt')
+    filename = '../data/syn_PL/powerlaw_100_ID0.txt'
+    start_time = time.time()
+    graph = read_graph_csr(filename)
+    recorder = AnytimeRecorder(filename, 'genetic_algorithm', graph.number_of_nodes(), start_time=start_time) \
+        if use_anytime_recorder else None
     print("Genetic Search Start")
-    algorithm_run(graph)
+    algorithm_run(graph, recorder)
+    if recorder is not None:
+        recorder.finish()
 
     # Cut checker
     # vector = [1, 1, 1, 0, 0, 1, 1, 1, 1, 0, 0, 0, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1, 1, 0, 0, 1, 0, 0, 1, 1, 0, 1, 0, 1, 1, 1, 0, 1, 1, 1, 1]
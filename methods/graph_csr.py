@@ -0,0 +1,279 @@
+import os
+import zlib
+import struct
+import numpy as np
+import networkx as nx
+import torch as th
+from typing import List, Tuple, Optional
+
+TEN = th.Tensor
+GraphList = List[Tuple[int, int, int]]
+
+# The txt instances are converted into binary files under `{dir of txt}/.graph_cache/` on first use, and memory-mapped
+# afterwards. Set it False to always parse the txt files.
+USE_GRAPH_CACHE = True
+GRAPH_CACHE_DIRNAME = '.graph_cache'
+
+
+class EdgeView:
+    """
+    A light-weight stand-in for networkx's `graph.edges`, so that the solvers written against nx.Graph
+    (e.g., `for i, j in graph.edges`, `list(graph.edges())`, `(i, j) in graph.edges()`) also accept GraphCSR.
+    """
+
+    def __init__(self, graph: 'GraphCSR'):
+        self.graph = graph
+
+    def __call__(self):
+        return self
+
+    def __iter__(self):
+        return zip(self.graph.edge_n0s.tolist(), self.graph.edge_n1s.tolist())
+
+    def __len__(self):
+        return self.graph.num_edges
+
+    def __contains__(self, edge) -> bool:
+        n0, n1 = edge
+        return bool(np.any(self.graph.neighbors(n0) == n1))
+
+
+class GraphCSR:
+    """
+    Undirected weighted graph stored in flat arrays, shared by the solvers in methods/.
+
+    The edge list keeps each edge once, in the order of the txt file (node ids start from 0):
+    - edge_n0s, edge_n1s: int32, shape == (num_edges, )
+    - edge_weights: float32, shape == (num_edges, )
+
+    The CSR adjacency keeps both directions of each edge:
+    - offsets: int32, shape == (num_nodes + 1, )
+    - indices: int32, shape == (2 * num_edges, ), the neighbors of node i are indices[offsets[i]: offsets[i + 1]], sorted
+    - weights: float32, shape == (2 * num_edges, ), the weights of the edges in `indices`
+    - degrees: int32, shape == (num_nodes, )
+
+    All arrays are plain NumPy arrays, and `edge_tensors()`, `csr_tensors()` wrap them as torch tensors without copying on CPU.
+    """
+
+    def __init__(self, num_nodes: int, edge_n0s, edge_n1s, edge_weights=None,
+                 offsets=None, indices=None, weights=None):
+        self.num_nodes = int(num_nodes)
+        self.edge_n0s = np.ascontiguousarray(edge_n0s, dtype=np.int32)
+        self.edge_n1s = np.ascontiguousarray(edge_n1s, dtype=np.int32)
+        self.num_edges = int(self.edge_n0s.shape[0])
+        if edge_weights is None:
+            edge_weights = np.ones(self.num_edges, dtype=np.float32)
+        self.edge_weights = np.ascontiguousarray(edge_weights, dtype=np.float32)
+        assert self.edge_n1s.shape[0] == self.num_edges
+        assert self.edge_weights.shape[0] == self.num_edges
+
+        if offsets is None or indices is None or weights is None:
+            offsets, indices, weights = build_csr_arrays(self.num_nodes, self.edge_n0s, self.edge_n1s, self.edge_weights)
+        self.offsets = offsets
+        self.indices = indices
+        self.weights = weights
+        self.degrees = np.diff(self.offsets).astype(np.int32)
+
+    '''build'''
+
+    @classmethod
+    def from_txt(cls, filename: str, use_cache: bool = USE_GRAPH_CACHE) -> 'GraphCSR':
+        # Load the graph from the binary cache of the txt file if it is up to date, otherwise parse the txt file
+        # and (re)build the cache. If the cache can not be written, e.g., read-only dir, the parsed graph is returned.
+        if not use_cache:
+            return cls.parse_txt(filename)
+        cache_path = obtain_cache_path(filename)
+        graph = load_graph_csr_cache(cache_path, filename)
+        if graph is None:
+            graph = cls.parse_txt(filename)
+            save_graph_csr_cache(graph, cache_path, filename)
+        return graph
+
+    @classmethod
+    def parse_txt(cls, filename: str) -> 'GraphCSR':
+        # The nodes in file start from 1, but the nodes start from 0 in our codes. The lines with '//' are comments.
+        with open(filename, 'r') as file:
+            lines = [line for line in file if '//' not in line]
+        num_nodes, num_edges = [int(s) for s in lines[0].split()[:2]]
+        values = np.array(''.join(lines[1:]).split(), dtype=np.float64).reshape(-1, 3)
+        assert values.shape[0] == num_edges
+        return cls(num_nodes=num_nodes,
+                   edge_n0s=values[:, 0].astype(np.int32) - 1,
+                   edge_n1s=values[:, 1].astype(np.int32) - 1,
+                   edge_weights=values[:, 2])
+
+    @classmethod
+    def from_graph_list(cls, graph_list: GraphList, num_nodes: int = 0) -> 'GraphCSR':
+        values = np.array(graph_list, dtype=np.float64).reshape(-1, 3)
+        if num_nodes == 0:
+            num_nodes = int(values[:, :2].max()) + 1
+        return cls(num_nodes=num_nodes, edge_n0s=values[:, 0], edge_n1s=values[:, 1], edge_weights=values[:, 2])
+
+    @classmethod
+    def from_nxgraph(cls, graph: nx.Graph) -> 'GraphCSR':
+        edges = list(graph.edges(data='weight', default=1))
+        values = np.array([(n0, n1, float(weight)) for n0, n1, weight in edges], dtype=np.float64).reshape(-1, 3)
+        return cls(num_nodes=graph.number_of_nodes(), edge_n0s=values[:, 0], edge_n1s=values[:, 1], edge_weights=values[:, 2])
+
+    '''convert'''
+
+    def to_nxgraph(self) -> nx.Graph:
+        graph = nx.Graph()
+        graph.add_nodes_from(range(self.num_nodes))
+        graph.add_weighted_edges_from(zip(self.edge_n0s.tolist(), self.edge_n1s.tolist(), self.edge_weights.tolist()))
+        return graph
+
+    def to_graph_list(self) -> GraphList:
+        weights = self.edge_weights.tolist()
+        if np.all(self.edge_weights == np.round(self.edge_weights)):
+            weights = [int(w) for w in weights]
+        return list(zip(self.edge_n0s.tolist(), self.edge_n1s.tolist(), weights))
+
+    def to_dense(self) -> np.ndarray:
+        adjacency_matrix = np.zeros((self.num_nodes, self.num_nodes), dtype=np.float64)
+        adjacency_matrix[self.edge_n0s, self.edge_n1s] = self.edge_weights
+        adjacency_matrix[self.edge_n1s, self.edge_n0s] = self.edge_weights
+        return adjacency_matrix
+
+    def edge_tensors(self, device=th.device('cpu')) -> (TEN, TEN, TEN):
+        # (edge_n0s, edge_n1s, edge_weights) as tensors. On CPU, they share the memory with the arrays.
+        return tuple(th.from_numpy(ary).to(device) for ary in (self.edge_n0s, self.edge_n1s, self.edge_weights))
+
+    def csr_tensors(self, device=th.device('cpu')) -> (TEN, TEN, TEN):
+        # (offsets, indices, weights) as tensors. On CPU, they share the memory with the arrays.
+        return tuple(th.from_numpy(ary).to(device) for ary in (self.offsets, self.indices, self.weights))
+
+    '''the subset of the networkx.Graph interface used by the solvers'''
+
+    def number_of_nodes(self) -> int:
+        return self.num_nodes
+
+    def number_of_edges(self) -> int:
+        return self.num_edges
+
+    def nodes(self) -> List[int]:
+        return list(range(self.num_nodes))
+
+    @property
+    def edges(self) -> EdgeView:
+        return EdgeView(self)
+
+    def neighbors(self, node: int) -> np.ndarray:
+        return self.indices[self.offsets[node]: self.offsets[node + 1]]
+
+    def neighbor_weights(self, node: int) -> np.ndarray:
+        return self.weights[self.offsets[node]: self.offsets[node + 1]]
+
+    def degree(self, node: int) -> int:
+        return int(self.degrees[node])
+
+    def weighted_degrees(self) -> np.ndarray:
+        return np.bincount(self.edge_n0s, weights=self.edge_weights, minlength=self.num_nodes) \
+            + np.bincount(self.edge_n1s, weights=self.edge_weights, minlength=self.num_nodes)
+
+
+def build_csr_arrays(num_nodes: int, edge_n0s: np.ndarray, edge_n1s: np.ndarray, edge_weights: np.ndarray) \
+        -> (np.ndarray, np.ndarray, np.ndarray):
+    srcs = np.concatenate((edge_n0s, edge_n1s))
+    dsts = np.concatenate((edge_n1s, edge_n0s))
+    ws = np.concatenate((edge_weights, edge_weights))
+    order = np.lexsort((dsts, srcs))  # sort by srcs, then by dsts
+
+    offsets = np.zeros(num_nodes + 1, dtype=np.int32)
+    np.cumsum(np.bincount(srcs, minlength=num_nodes), out=offsets[1:])
+    indices = np.ascontiguousarray(dsts[order], dtype=np.int32)
+    weights = np.ascontiguousarray(ws[order], dtype=np.float32)
+    return offsets, indices, weights
+
+
+'''binary cache'''
+
+"""
+Layout of a cache file, little-endian. All arrays are 4-byte items, so every array starts at an aligned offset.
+- header (64 bytes): magic, version, num_nodes, num_edges, source size, source mtime_ns, source crc32
+- edge_n0s int32[E], edge_n1s int32[E], edge_weights float32[E]
+- offsets int32[N + 1], indices int32[2E], weights float32[2E]
+"""
+CACHE_MAGIC = b'RLCOCSR\0'
+CACHE_VERSION = 1
+CACHE_HEADER = struct.Struct('<8sIqqqqI')
+CACHE_HEADER_SIZE = 64
+
+
+def obtain_cache_path(filename: str) -> str:
+    dirname, basename = os.path.split(os.path.abspath(filename))
+    return os.path.join(dirname, GRAPH_CACHE_DIRNAME, f"{os.path.splitext(basename)[0]}.csr")
+
+
+def calc_file_crc32(filename: str) -> int:
+    crc32 = 0
+    with open(filename, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            crc32 = zlib.crc32(chunk, crc32)
+    return crc32 & 0xFFFFFFFF
+
+
+def obtain_cache_arrays_layout(num_nodes: int, num_edges: int) -> List[Tuple[str, type, int]]:
+    return [('edge_n0s', np.int32, num_edges),
+            ('edge_n1s', np.int32, num_edges),
+            ('edge_weights', np.float32, num_edges),
+            ('offsets', np.int32, num_nodes + 1),
+            ('indices', np.int32, 2 * num_edges),
+            ('weights', np.float32, 2 * num_edges)]
+
+
+def save_graph_csr_cache(graph: GraphCSR, cache_path: str, src_filename: str) -> bool:
+    stat = os.stat(src_filename)
+    header = CACHE_HEADER.pack(CACHE_MAGIC, CACHE_VERSION, graph.num_nodes, graph.num_edges,
+                               stat.st_size, stat.st_mtime_ns, calc_file_crc32(src_filename))
+    # write to a temporary file and rename it, so that the parallel jobs never read a partially written cache
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(tmp_path, 'wb') as file:
+            file.write(header.ljust(CACHE_HEADER_SIZE, b'\0'))
+            for name, dtype, _ in obtain_cache_arrays_layout(graph.num_nodes, graph.num_edges):
+                file.write(np.ascontiguousarray(getattr(graph, name), dtype=dtype).tobytes())
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+    return True
+
+
+def load_graph_csr_cache(cache_path: str, src_filename: str) -> Optional[GraphCSR]:
+    # return None if the cache does not exist, is broken, or is out of date with the source txt file
+    try:
+        with open(cache_path, 'rb') as file:
+            header = file.read(CACHE_HEADER_SIZE)
+        magic, version, num_nodes, num_edges, src_size, src_mtime_ns, src_crc32 = CACHE_HEADER.unpack_from(header)
+        stat = os.stat(src_filename)
+    except (OSError, struct.error):
+        return None
+    if magic != CACHE_MAGIC or version != CACHE_VERSION:
+        return None
+    if stat.st_size != src_size:
+        return None
+    if stat.st_mtime_ns != src_mtime_ns:
+        # only compute the checksum when the mtime changes, e.g., after a `git checkout` or a copy
+        if calc_file_crc32(src_filename) != src_crc32:
+            return None
+        try:  # the content is the same, record the new mtime so that the checksum is not computed again
+            with open(cache_path, 'r+b') as file:
+                file.write(CACHE_HEADER.pack(magic, version, num_nodes, num_edges, src_size, stat.st_mtime_ns, src_crc32))
+        except OSError:
+            pass
+
+    layout = obtain_cache_arrays_layout(num_nodes, num_edges)
+    if os.path.getsize(cache_path) != CACHE_HEADER_SIZE + sum(4 * size for _, _, size in layout):
+        return None
+
+    arrays = {}
+    offset = CACHE_HEADER_SIZE
+    for name, dtype, size in layout:
+        # mode 'c' is copy-on-write: the pages are shared between processes and the file is never modified
+        arrays[name] = np.memmap(cache_path, dtype=dtype, mode='c', offset=offset, shape=(size,)) \
+            if size > 0 else np.empty(0, dtype=dtype)
+        offset += 4 * size
+    return GraphCSR(num_nodes=num_nodes, **arrays)
@@ -3,11 +3,12 @@ sys.path.append('../')
 
 import copy
 import time
+import heapq
 from typing import Union, Optional
 import numpy as np
-import multiprocessing as mp
 import networkx as nx
 from util import (read_nxgraph,
+                  read_graph_csr,
                   plot_fig,
                   plot_nxgraph,
                   transfer_nxgraph_to_weightmatrix,
@@ -23,6 +24,8 @@ from util import (read_nxgraph,
                 )
 
 from config import *
+from flip_gain import FlipGainEngine, FlipGainQueue
+from set_cover_index import SetCoverIndex, SetCoverCounter
 
 def split_list(my_list: List[int], chunk_size: int):
     res = []
@@ -30,90 +33,42 @@ def split_list(my_list: List[int], chunk_size: int):
         res.append(my_list[i: i + chunk_size])
     return res
 
-# the len of result may not be mp.cpu_count()
-def split_list_equally_by_cpus(my_list: List[int]):
-    res = []
-    num_cpus = mp.cpu_count()
-    chunk_size = int(np.ceil(len(my_list) / num_cpus))
-    for i in range(0, len(my_list), chunk_size):
-        res.append(my_list[i: i + chunk_size])
-    return res
-
 def split_list_equally(my_list: List[int], chunk_size: int):
     res = []
     for i in range(0, len(my_list), chunk_size):
         res.append(my_list[i: i + chunk_size])
     return res
 
-def traverse_in_greedy_maxcut(curr_solution, selected_nodes, graph):
-    traversal_scores = []
-    traversal_solutions = []
-    # calc the new solution when moving to a new node. Then store the scores and solutions.
-    for node in selected_nodes:
-        new_solution = copy.deepcopy(curr_solution)
-        # search a new solution and calc obj
-        new_solution[node] = (new_solution[node] + 1) % 2
-        new_score = obj_maxcut(new_solution, graph)
-        traversal_scores.append(new_score)
-        traversal_solutions.append(new_solution)
-    return traversal_scores, traversal_solutions
-
-
 # init_solution is useless
+# Each step flips the node with the largest gain, which is kept in a heap (FlipGainQueue) and updated only for the
+# flipped node and its neighbors, O((N + E) log N) in total. The node with the smallest index is selected among ties.
 def greedy_maxcut(num_steps: Optional[int], graph: nx.Graph) -> (int, Union[List[int], np.array], List[int]):
     print('greedy')
     start_time = time.time()
     num_nodes = int(graph.number_of_nodes())
-    nodes = list(range(num_nodes))
     init_solution = [0] * graph.number_of_nodes()
     assert sum(init_solution) == 0
     if num_steps is None:
         num_steps = num_nodes
-    curr_solution = copy.deepcopy(init_solution)
-    curr_score: int = obj_maxcut(curr_solution, graph)
+    engine = FlipGainEngine(graph, init_solution)
+    queue = FlipGainQueue(engine)
+    curr_score: int = engine.objective
     init_score = curr_score
     scores = []
     for iteration in range(num_nodes):
         if iteration >= num_steps:
             break
-        score = obj_maxcut(curr_solution, graph)
-        print(f"iteration: {iteration}, score: {score}")
-        traversal_scores = []
-        traversal_solutions = []
-        # calc the new solution when moving to a new node. Then store the scores and solutions.
-        use_multiprocessing = False
-        if use_multiprocessing:
-            pass
-            split_nodess = split_list_equally_by_cpus(nodes)
-            pool = mp.Pool(len(split_nodess))
-            # print(f'len split_nodess: {len(split_nodess)}')
-            results = []
-            for split_nodes in split_nodess:
-                results.append(pool.apply_async(traverse_in_greedy_maxcut, (curr_solution, split_nodes, graph)))
-            for result in results:
-                tmp_traversal_scores, tmp_traversal_solutions = result.get()
-                # print(f'tmp_traversal_scores: {tmp_traversal_scores}, tmp_traversal_solutions: {tmp_traversal_solutions}')
-                traversal_scores.extend(tmp_traversal_scores)
-                traversal_solutions.extend(tmp_traversal_solutions)
-        else:
-            for node in nodes:
-                new_solution = copy.deepcopy(curr_solution)
-                # search a new solution and calc obj
-                new_solution[node] = (new_solution[node] + 1) % 2
-                new_score = obj_maxcut(new_solution, graph)
-                traversal_scores.append(new_score)
-                traversal_solutions.append(new_solution)
-        best_score = max(traversal_scores)
-        index = traversal_scores.index(best_score)
-        best_solution = traversal_solutions[index]
-        if best_score > curr_score:
-            scores.append(best_score)
-            curr_score = best_score
-            curr_solution = best_solution
+        print(f"iteration: {iteration}, score: {curr_score}")
+        node, gain = queue.best_move()
+        if gain > 0:
+            queue.flip(node)
+            curr_score = engine.objective
+            scores.append(curr_score)
         else:
             break
+    curr_solution = engine.solution.tolist()
     print("init_score, final score of greedy", init_score, curr_score, )
-    print("scores: ", traversal_scores)
+    print("scores: ", scores)
     print("solution: ", curr_solution)
     running_duration = time.time() - start_time
     print('running_duration: ', running_duration)
@@ -266,37 +221,33 @@ def greedy_maximum_independent_set(num_steps: Optional[int], graph: nx.Graph) ->
     print('running_duration: ', running_duration)
     return curr_score, curr_solution, scores
 
+# Lazy greedy: the heap keeps (-gain, set, round) and the gain of a set only decreases when other sets are selected,
+# so a popped gain computed in an earlier round is an upper bound and is re-evaluated only then.
+# The set with the smallest index is selected among ties, the same as scanning all the sets.
 def greedy_set_cover(num_items: int, num_sets: int, item_matrix: List[List[int]]) -> (int, Union[List[int], np.array], List[int]):
     print('greedy')
     start_time = time.time()
-    curr_solution = [0] * num_sets
+    index = SetCoverIndex(num_items, num_sets, item_matrix)
+    counter = SetCoverCounter(index, [0] * num_sets)
     init_score = 0.0
     curr_score = 0.0
     scores = []
-    selected_sets = []
-    unselected_sets = set(np.array(range(num_sets)) + 1)
-    unselected_items = set(np.array(range(num_items)) + 1)
-    while len(unselected_items) > 0:
-        max_intersection_num = 0
-        selected_set = None
-        for i in unselected_sets:
-            intersection_num = 0
-            for j in item_matrix[i - 1]:
-                if j in unselected_items:
-                    intersection_num += 1
-            if intersection_num > max_intersection_num:
-                max_intersection_num = intersection_num
-                selected_set = i
-        if selected_set is not None:
-            selected_sets.append(selected_set)
-            unselected_sets.remove(selected_set)
-            for j in item_matrix[selected_set - 1]:
-                if j in unselected_items:
-                    unselected_items.remove(j)
-            curr_score += max_intersection_num / num_items
-            scores.append(curr_score)
-            curr_solution[selected_set - 1] = 1
-    real_score = obj_set_cover(curr_solution, num_items, item_matrix)
+    heap = [(-index.set_size(i), i, 0) for i in range(num_sets)]
+    heapq.heapify(heap)
+    curr_round = 0
+    while counter.num_covered < num_items and len(heap) > 0:
+        neg_gain, selected_set, gain_round = heapq.heappop(heap)
+        if gain_round < curr_round:
+            gain = counter.marginal_gain(selected_set)
+            if gain > 0:
+                heapq.heappush(heap, (-gain, selected_set, curr_round))
+            continue
+        counter.flip(selected_set)
+        curr_round += 1
+        curr_score += -neg_gain / num_items
+        scores.append(curr_score)
+    curr_solution = counter.solution.tolist()
+    real_score = counter.objective
     print("real score of greedy:", real_score)
     print(f'num_sets: {num_sets}, num_items: {num_items}')
     print("init_score, final score of greedy", init_score, curr_score)
@@ -359,7 +310,7 @@ def greedy_graph_coloring(num_steps: Optional[int], graph: nx.Graph) -> (int, Un
 if __name__ == '__main__':
     # read data
     print(f'problem: {PROBLEM}')
-    graph = read_nxgraph('../data/syn/syn_10_21.txt')
+    graph = read_graph_csr('../data/syn/syn_10_21.txt')
     weightmatrix = transfer_nxgraph_to_weightmatrix(graph)
     # run alg
     alg_name = 'GR'
@@ -2,19 +2,22 @@ import sys
 sys.path.append('../')
 from gurobipy import *
 import copy
+import numpy as np
 import networkx as nx
 import time
 import sys
 import matplotlib.pyplot as plt
+from typing import List, Optional
 
-from util import read_nxgraph
+from util import read_graph_csr
 from util import calc_txt_files_with_prefix
 from util import calc_result_file_name
 from util import calc_avg_std_of_objs
 from util import plot_fig
 from util import fetch_node
 from util import (transfer_float_to_binary,
-                          transfer_nxgraph_to_adjacencymatrix)
+                          transfer_nxgraph_to_adjacencymatrix,
+                          obtain_edge_arrays)
 # from util import fetch_indices
 from util import read_tsp,read_knapsack_data,read_set_cover_data
 from config import *
@@ -24,6 +27,7 @@ from itertools import combinations
 # 的文件中。同时，将当前进展输出到 report.txt 报告中。
 def mycallback(model, where):
     if where == GRB.Callback.MIPSOL:
+        record_first_incumbent(model)
         # MIP solution callback
         currentTime = time.time()
         running_duation = int((currentTime - model._startTime) / model._interval) * model._interval
@@ -74,6 +78,44 @@ def mycallback(model, where):
                 value = int(round(soln[i]) + 1) if not GUROBI_VAR_CONTINUOUS else soln[i]
                 new_file.write(f"{i + 1} {value}\n")
 
+# 单次求解记录多个时间点的结果：model._checkpoints 为需要记录的时间点（秒），求解一次（时间上限为最大的时间点），
+# 每到达一个时间点，将当时的最好可行解、界和 gap 写入与单独以该时间点为 time_limit 求解时相同格式的结果文件。
+# 每次回调（presolve、simplex、MIP、MIPNODE 等）先写出已经到达的时间点，再更新可行解和界，
+# 所以时间点 t 的结果只使用 t 之前找到的可行解和界。
+def checkpoint_callback(model, where):
+    if where == GRB.Callback.POLLING:
+        return
+    runtime = model.cbGet(GRB.Callback.RUNTIME)
+    while model._num_written_checkpoints < len(model._checkpoints) \
+            and model._checkpoints[model._num_written_checkpoints] <= runtime:
+        checkpoint = model._checkpoints[model._num_written_checkpoints]
+        if not write_result_gurobi_checkpoint(model, checkpoint):
+            # no feasible solution before the checkpoint, so there is no result at it
+            model._skipped_checkpoints.append(checkpoint)
+            print(f'checkpoint: {checkpoint} is skipped, since no feasible solution is found before it')
+        model._num_written_checkpoints += 1
+
+    if where == GRB.Callback.MIPSOL:
+        record_first_incumbent(model)
+        obj = model.cbGet(GRB.Callback.MIPSOL_OBJ)
+        if model._incumbent_obj is None or model._sense * (obj - model._incumbent_obj) < 0:
+            model._incumbent_obj = obj
+            model._incumbent_values = model.cbGetSolution(model._x_vars)
+        model._obj_bound = model.cbGet(GRB.Callback.MIPSOL_OBJBND)
+    elif where == GRB.Callback.MIP:
+        model._obj_bound = model.cbGet(GRB.Callback.MIP_OBJBND)
+    elif where == GRB.Callback.MIPNODE:
+        model._obj_bound = model.cbGet(GRB.Callback.MIPNODE_OBJBND)
+
+# the runtime when the first feasible solution is found, which is the MIP start if it is accepted
+def record_first_incumbent(model):
+    if model._first_incumbent_duration is None:
+        model._first_incumbent_duration = model.cbGet(GRB.Callback.RUNTIME)
+
+def incumbent_callback(model, where):
+    if where == GRB.Callback.MIPSOL:
+        record_first_incumbent(model)
+
 def find_subtour(edges,n):
     unvisited = list(range(n))
     cycle = range(n + 1)
@@ -119,6 +161,14 @@ def write_statistics(model, new_file, add_slash = False):
     # new_file.write(f"time_limit: {time_limit}\n")
     time_limit = model.getParamInfo("TIME_LIMIT")
     new_file.write(f"{prefix}time_limit: {time_limit}\n")
+    new_file.write(f"{prefix}build_duration: {model._build_duration}\n")
+    write_warm_start_statistics(model, new_file, prefix)
+
+# the warm start alg (None if not used), its running duration, and the time to the first incumbent
+def write_warm_start_statistics(model, new_file, prefix: str):
+    new_file.write(f"{prefix}warm_start_alg: {model._warm_start_alg}\n")
+    new_file.write(f"{prefix}warm_start_duration: {model._warm_start_duration}\n")
+    new_file.write(f"{prefix}first_incumbent_duration: {model._first_incumbent_duration}\n")
 
 def write_statistics_in_mycallback(model, new_file, add_slash = False):
     if model.getAttr('SolCount') == 0:
@@ -221,7 +271,81 @@ def write_result_gurobi(model, filename: str = './result/result', running_durati
 
 
 
-def run_using_gurobi(filename: str, time_limit: int = None, plot_fig_: bool = False):
+# sum_{(i, j) in edges} w_ij * (x_i + x_j - 2 * x_i * x_j), i.e., the total weight of the cut edges,
+# the same as sum_{i < j} w_ij * (0.5 - 2 * (x_i - 0.5) * (x_j - 0.5)) but with O(E) terms instead of O(N^2)
+def build_cut_expr(x, num_nodes: int, edge_n0s: List[int], edge_n1s: List[int], edge_weights: np.ndarray) -> QuadExpr:
+    weighted_degrees = np.bincount(edge_n0s + edge_n1s, weights=np.concatenate((edge_weights, edge_weights)),
+                                   minlength=num_nodes)
+    expr = QuadExpr()
+    expr.addTerms(weighted_degrees.tolist(), [x[i] for i in range(num_nodes)])
+    expr.addTerms((-2 * edge_weights).tolist(), [x[i] for i in edge_n0s], [x[j] for j in edge_n1s])
+    return expr
+
+
+# write the incumbent recorded in checkpoint_callback, in the same format as write_result_gurobi.
+# return False if no incumbent is found yet, and nothing is written.
+def write_result_gurobi_checkpoint(model, checkpoint: int) -> bool:
+    if model._incumbent_obj is None:
+        return False
+    obj = model._incumbent_obj
+    obj_bound = model._obj_bound
+    gap = abs(obj - obj_bound) / (abs(obj) + 1e-6)
+    nodes: List[int] = []
+    values: List[int] = []
+    for var, value in zip(model._x_vars, model._incumbent_values):
+        try:
+            node = fetch_node(var.VarName)
+            value = transfer_float_to_binary(value)
+            nodes.append(node)
+            values.append(value)
+        except ValueError:
+            pass
+    if PROBLEM == Problem.maximum_independent_set:
+        from util import obj_maximum_independent_set
+        obj = obj_maximum_independent_set(values, model._attribute['graph'])
+
+    new_filename = calc_result_file_name(model._attribute['result_filename'], '_' + str(int(checkpoint)))
+    with open(new_filename, 'w', encoding="UTF-8") as new_file:
+        prefix = '// '
+        new_file.write(f"{prefix}obj: {obj}\n")
+        new_file.write(f"{prefix}running_duration: {checkpoint}\n")
+        new_file.write(f"{prefix}gap: {gap}\n")
+        new_file.write(f"{prefix}obj_bound: {obj_bound}\n")
+        new_file.write(f"{prefix}time_limit: {checkpoint}\n")
+        new_file.write(f"{prefix}build_duration: {model._build_duration}\n")
+        write_warm_start_statistics(model, new_file, prefix)
+        new_file.write(f"// num_nodes: {len(nodes)}\n")
+        for i in range(len(nodes)):
+            if PROBLEM == Problem.minimum_vertex_cover:
+                new_file.write(f"{nodes[i] + 1} {values[i]}\n")
+            else:
+                new_file.write(f"{nodes[i] + 1} {values[i] + 1}\n")
+        new_file.write("// Tuples Format: \n")
+    print(f'checkpoint: {checkpoint}, warm_start_alg: {model._warm_start_alg}, obj: {obj}, obj_bound: {obj_bound}, gap: {gap}')
+    return True
+
+
+# set the heuristic solution as the MIP start, i.e., the Start attributes of the x vars (and the y vars of MILP).
+# return the running duration of the heuristic.
+def set_warm_start(model, warm_start_alg: str, graph, x, y=None) -> float:
+    from warm_start import calc_warm_start_solution
+    score, solution, running_duration = calc_warm_start_solution(warm_start_alg, graph)
+    for i in range(len(solution)):
+        x[i].Start = solution[i]
+    if y is not None:
+        # y_{i, j} = x_i XOR x_j
+        for i, j in y.keys():
+            y[(i, j)].Start = solution[i] ^ solution[j]
+    return running_duration
+
+
+# If checkpoints (seconds) is not None, the model is solved once with the time limit max(checkpoints), and the results
+# at all the checkpoints are written by checkpoint_callback, e.g., barabasi_albert_100_ID0_600.txt, ..._3600.txt.
+# warm_start_alg: None, or the heuristic whose solution is the MIP start (see warm_start.py), for maxcut,
+# graph_partitioning, minimum_vertex_cover and maximum_independent_set.
+def run_using_gurobi(filename: str, time_limit: int = None, plot_fig_: bool = False, checkpoints: List[int] = None,
+                     warm_start_alg: Optional[str] = MIP_WARM_START_ALG):
+    build_start_time = time.time()
     model = Model("maxcut")
 
     if PROBLEM == Problem.tsp:
@@ -231,47 +355,56 @@ def run_using_gurobi(filename: str, time_limit: int = None, plot_fig_: bool = Fa
     elif PROBLEM ==Problem.set_cover:
         total_elements, total_subsets, subsets = read_set_cover_data(filename)
     else:
-        graph = read_nxgraph(filename)
+        graph = read_graph_csr(filename)
 
 
     if PROBLEM not in [Problem.knapsack,Problem.set_cover]:
         edges = list(graph.edges)
-        subax1 = plt.subplot(111)
-        nx.draw_networkx(graph, with_labels=True)
         if plot_fig_:
+            subax1 = plt.subplot(111)
+            nx.draw_networkx(graph if isinstance(graph, nx.Graph) else graph.to_nxgraph(), with_labels=True)
             plt.show()
 
-        adjacency_matrix = transfer_nxgraph_to_adjacencymatrix(graph)
-        num_nodes = nx.number_of_nodes(graph)
+        # the objectives of maxcut, graph_partitioning and minimum_vertex_cover are built from the edges, O(E) terms.
+        # tsp is a complete graph, and uses the dense adjacency_matrix.
+        # the parallel edges, i.e., the repeated or reversed (i, j), are merged into one edge (min(i, j), max(i, j))
+        # whose weight is the sum, so there is one y var per pair.
+        edge_n0s, edge_n1s, edge_weights = obtain_edge_arrays(graph)
+        edge_pairs = np.stack((np.minimum(edge_n0s, edge_n1s), np.maximum(edge_n0s, edge_n1s)), axis=1).astype(np.int64)
+        edge_pairs, pair_ids = np.unique(edge_pairs.reshape(-1, 2), axis=0, return_inverse=True)
+        merged_weights = np.zeros(len(edge_pairs), dtype=np.float64)
+        np.add.at(merged_weights, pair_ids.reshape(-1), np.asarray(edge_weights, dtype=np.float64))
+        edge_n0s, edge_n1s, edge_weights = edge_pairs[:, 0].tolist(), edge_pairs[:, 1].tolist(), merged_weights
+        if PROBLEM == Problem.tsp:
+            adjacency_matrix = transfer_nxgraph_to_adjacencymatrix(graph)
+        num_nodes = graph.number_of_nodes()
         nodes = list(range(num_nodes))
-        num_subsets = len(adjacency_matrix[0])
 
 
     if PROBLEM == Problem.maxcut:
-        y_lb = adjacency_matrix.min()
-        y_ub = adjacency_matrix.max()
+        y_lb = min(0.0, edge_weights.min(initial=0.0))
+        y_ub = max(0.0, edge_weights.max(initial=0.0))
         x = model.addVars(num_nodes, vtype=GRB.BINARY, name="x")
         if GUROBI_MILP_QUBO == 0:
-            y = model.addVars(num_nodes, num_nodes, vtype=GRB.CONTINUOUS, lb=y_lb, ub=y_ub, name="y")
-            model.setObjective(quicksum(quicksum(adjacency_matrix[(i, j)] * y[(i, j)] for i in range(0, j)) for j in nodes),
+            y = model.addVars(zip(edge_n0s, edge_n1s), vtype=GRB.CONTINUOUS, lb=y_lb, ub=y_ub, name="y")
+            model.setObjective(LinExpr(edge_weights.tolist(), [y[(i, j)] for i, j in zip(edge_n0s, edge_n1s)]),
                             GRB.MAXIMIZE)
         else:
-            model.setObjective(
-                quicksum(quicksum(adjacency_matrix[(i, j)] * (0.5 - 2 * (x[i] - 0.5) * (x[j] - 0.5)) for i in range(0, j)) for j in nodes),
-                GRB.MAXIMIZE)
+            model.setObjective(build_cut_expr(x, num_nodes, edge_n0s, edge_n1s, edge_weights), GRB.MAXIMIZE)
     elif PROBLEM == Problem.graph_partitioning:
         if GUROBI_MILP_QUBO == 0:
-            y_lb = adjacency_matrix.min()
-            y_ub = adjacency_matrix.max()
+            y_lb = min(0.0, edge_weights.min(initial=0.0))
+            y_ub = max(0.0, edge_weights.max(initial=0.0))
             x = model.addVars(num_nodes, vtype=GRB.BINARY, name="x")
-            y = model.addVars(num_nodes, num_nodes, vtype=GRB.CONTINUOUS, lb=y_lb, ub=y_ub, name="y")
-            model.setObjective(quicksum(quicksum(adjacency_matrix[(i, j)] * y[(i, j)] for i in range(0, j)) for j in nodes),
+            y = model.addVars(zip(edge_n0s, edge_n1s), vtype=GRB.CONTINUOUS, lb=y_lb, ub=y_ub, name="y")
+            model.setObjective(LinExpr(edge_weights.tolist(), [y[(i, j)] for i, j in zip(edge_n0s, edge_n1s)]),
                                GRB.MINIMIZE)
         else:
             x = model.addVars(num_nodes, vtype=GRB.BINARY, name="x")
             coef_A = len(edges) + 10
+            # the balance penalty is dense by definition, and only the cut is built from the edges
             model.setObjective(coef_A * quicksum(2 * (x[k] - 0.5) for k in nodes) * quicksum(2 * (x[k] - 0.5) for k in nodes)
-                +quicksum(quicksum(adjacency_matrix[(i, j)] * (0.5 - 2 * (x[i] - 0.5) * (x[j] - 0.5)) for i in range(0, j)) for j in nodes),
+                + build_cut_expr(x, num_nodes, edge_n0s, edge_n1s, edge_weights),
                 GRB.MINIMIZE)
     elif PROBLEM == Problem.minimum_vertex_cover:
         if GUROBI_MILP_QUBO == 0:
@@ -281,9 +414,13 @@ def run_using_gurobi(filename: str, time_limit: int = None, plot_fig_: bool = Fa
         else:
             x = model.addVars(num_nodes, vtype=GRB.BINARY, name="x")
             coef_A = len(nodes) + 10
-            model.setObjective(coef_A * quicksum(quicksum(adjacency_matrix[(i, j)] * (1 - x[i]) * (1 - x[j]) for i in range(0, j)) for j in nodes)
-                               + quicksum(x[j] for j in nodes),
-                               GRB.MINIMIZE)
+            # coef_A * sum_{(i, j) in edges} w_ij * (1 - x_i) * (1 - x_j) + sum_j x_j
+            weighted_degrees = np.bincount(edge_n0s + edge_n1s, weights=np.concatenate((edge_weights, edge_weights)),
+                                           minlength=num_nodes)
+            expr = QuadExpr(coef_A * float(edge_weights.sum()))
+            expr.addTerms((1 - coef_A * weighted_degrees).tolist(), [x[j] for j in nodes])
+            expr.addTerms((coef_A * edge_weights).tolist(), [x[i] for i in edge_n0s], [x[j] for j in edge_n1s])
+            model.setObjective(expr, GRB.MINIMIZE)
     elif PROBLEM == Problem.maximum_independent_set:
         if GUROBI_MILP_QUBO == 0:
             x = model.addVars(num_nodes, vtype=GRB.BINARY, name="x")
@@ -354,21 +491,19 @@ def run_using_gurobi(filename: str, time_limit: int = None, plot_fig_: bool = Fa
     # constrs if using MILP
     if GUROBI_MILP_QUBO == 0:
         if PROBLEM == Problem.maxcut:
-            # y_{i, j} = x_i XOR x_j
-            for j in nodes:
-                for i in range(0, j):
-                    model.addConstr(y[(i, j)] <= x[i] + x[j], name='C0b_' + str(i) + '_' + str(j))
-                    model.addConstr(y[(i, j)] <= 2 - x[i] - x[j], name='C0a_' + str(i) + '_' + str(j))
-                    model.addConstr(y[(i, j)] >= x[i] - x[j], name='C0c_' + str(i) + '_' + str(j))
-                    model.addConstr(y[(i, j)] >= -x[i] + x[j], name='C0d_' + str(i) + '_' + str(j))
+            # y_{i, j} = x_i XOR x_j, only for the edges
+            for i, j in y.keys():
+                model.addConstr(y[(i, j)] <= x[i] + x[j], name='C0b_' + str(i) + '_' + str(j))
+                model.addConstr(y[(i, j)] <= 2 - x[i] - x[j], name='C0a_' + str(i) + '_' + str(j))
+                model.addConstr(y[(i, j)] >= x[i] - x[j], name='C0c_' + str(i) + '_' + str(j))
+                model.addConstr(y[(i, j)] >= -x[i] + x[j], name='C0d_' + str(i) + '_' + str(j))
         elif PROBLEM == Problem.graph_partitioning:
-            # y_{i, j} = x_i XOR x_j
-            for j in nodes:
-                for i in range(0, j):
-                    model.addConstr(y[(i, j)] <= x[i] + x[j], name='C0b_' + str(i) + '_' + str(j))
-                    model.addConstr(y[(i, j)] <= 2 - x[i] - x[j], name='C0a_' + str(i) + '_' + str(j))
-                    model.addConstr(y[(i, j)] >= x[i] - x[j], name='C0c_' + str(i) + '_' + str(j))
-                    model.addConstr(y[(i, j)] >= -x[i] + x[j], name='C0d_' + str(i) + '_' + str(j))
+            # y_{i, j} = x_i XOR x_j, only for the edges
+            for i, j in y.keys():
+                model.addConstr(y[(i, j)] <= x[i] + x[j], name='C0b_' + str(i) + '_' + str(j))
+                model.addConstr(y[(i, j)] <= 2 - x[i] - x[j], name='C0a_' + str(i) + '_' + str(j))
+                model.addConstr(y[(i, j)] >= x[i] - x[j], name='C0c_' + str(i) + '_' + str(j))
+                model.addConstr(y[(i, j)] >= -x[i] + x[j], name='C0d_' + str(i) + '_' + str(j))
             model.addConstr(quicksum(x[j] for j in nodes) == num_nodes / 2, name='C1')
         elif PROBLEM == Problem.minimum_vertex_cover:
             for i in range(len(edges)):
@@ -409,6 +544,10 @@ def run_using_gurobi(filename: str, time_limit: int = None, plot_fig_: bool = Fa
 
 
 
+    if checkpoints is not None:
+        assert not GUROBI_VAR_CONTINUOUS
+        checkpoints = sorted(checkpoints)
+        time_limit = checkpoints[-1]
     if time_limit is not None:
         model.setParam('TimeLimit', time_limit)
 
@@ -456,10 +595,34 @@ def run_using_gurobi(filename: str, time_limit: int = None, plot_fig_: bool = Fa
         print(f'values of x: {x_values}')
         return x_values
 
-    if GUROBI_INTERVAL is None:
-        model.optimize()
+    model.update()
+    model._build_duration = time.time() - build_start_time
+    print(f'build_duration of model: {model._build_duration}')
+    model._warm_start_alg = warm_start_alg
+    model._warm_start_duration = None
+    model._first_incumbent_duration = None
+    if warm_start_alg is not None:
+        assert PROBLEM in [Problem.maxcut, Problem.graph_partitioning,
+                           Problem.minimum_vertex_cover, Problem.maximum_independent_set]
+        y_vars = y if GUROBI_MILP_QUBO == 0 and PROBLEM in [Problem.maxcut, Problem.graph_partitioning] else None
+        model._warm_start_duration = set_warm_start(model, warm_start_alg, graph, x, y_vars)
+    if checkpoints is not None:
+        model._checkpoints = checkpoints
+        model._num_written_checkpoints = 0
+        model._skipped_checkpoints = []
+        model._sense = model.ModelSense  # 1: minimize, -1: maximize
+        model._x_vars = [var for var in model.getVars() if "x" in var.VarName]
+        model._incumbent_obj = None
+        model._incumbent_values = None
+        model._obj_bound = None
+        if PROBLEM not in [Problem.knapsack, Problem.set_cover]:
+            model._attribute['graph'] = graph
+        model.optimize(checkpoint_callback)
+    elif GUROBI_INTERVAL is None:
+        model.optimize(incumbent_callback)
     else:
         model.optimize(mycallback)
+    print(f'warm_start_alg: {warm_start_alg}, first_incumbent_duration: {model._first_incumbent_duration}')
 
     if model.status == GRB.INFEASIBLE:
         model.computeIIS()
@@ -473,7 +636,14 @@ def run_using_gurobi(filename: str, time_limit: int = None, plot_fig_: bool = Fa
         # result_filename = '../result/result'
         if PROBLEM not in [Problem.knapsack,Problem.set_cover]:
             model._attribute['graph'] = graph
-        write_result_gurobi(model, result_filename, time_limit)
+        if checkpoints is None:
+            write_result_gurobi(model, result_filename, time_limit)
+        else:
+            # the checkpoints not reached, e.g., solved to optimality before them, get the final result
+            for checkpoint in checkpoints[model._num_written_checkpoints:]:
+                write_result_gurobi(model, result_filename, checkpoint)
+            if len(model._skipped_checkpoints) > 0:
+                print(f'skipped_checkpoints (no feasible solution before them): {model._skipped_checkpoints}')
     if PROBLEM in [Problem.maxcut, Problem.minimum_vertex_cover, Problem.maximum_independent_set, Problem.graph_partitioning]:
         x_values = [x[i].x for i in range(num_nodes) if i in x]
     elif PROBLEM == Problem.tsp:
@@ -512,12 +682,18 @@ def run_using_gurobi(filename: str, time_limit: int = None, plot_fig_: bool = Fa
     print(f'values of x: {x_values}')
     return x_values
 
-def run_gurobi_over_multiple_files(prefixes: List[str], time_limits: List[int], directory_data: str = 'data', directory_result: str = 'result'):
+# single_run: True: solve each file once with the max time limit, and record the results at all the time limits.
+# False: solve each file once per time limit.
+def run_gurobi_over_multiple_files(prefixes: List[str], time_limits: List[int], directory_data: str = 'data', directory_result: str = 'result',
+                                   single_run: bool = True):
     for prefix in prefixes:
         files = calc_txt_files_with_prefix(directory_data, prefix)
         files.sort()
         for i in range(len(files)):
             print(f'The {i}-th file: {files[i]}')
+            if single_run:
+                run_using_gurobi(files[i], checkpoints=time_limits)
+                continue
             for j in range(len(time_limits)):
                 run_using_gurobi(files[i], time_limits[j])
     avg_std = calc_avg_std_of_objs(directory_result, prefixes, time_limits)
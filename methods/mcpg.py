@@ -1,7 +1,10 @@
 import os
+import time
 import torch as th
 import sys
 from torch_geometric.data import Data
+from methods.graph_csr import GraphCSR
+from methods.util import AnytimeRecorder
 from L2A.evaluator import EncoderBase64
 from L2A.maxcut_simulator import load_graph_list
 from envs.env_mcpg_maxcut import (metro_sampling,
@@ -17,112 +20,52 @@ GPU_ID = int(sys.argv[1]) if len(sys.argv) > 1 else 0
 
 
 def maxcut_dataloader(path, device=th.device(f'cuda:{GPU_ID}' if th.cuda.is_available() else 'cpu')):
-    with open(path) as f:
-        fline = f.readline()
-        fline = fline.split()
-        num_nodes, num_edges = int(fline[0]), int(fline[1])
-        edge_index = th.LongTensor(2, num_edges)
-        cnt = 0
-        while True:
-            lines = f.readlines(num_edges * 2)
-            if not lines:
-                break
-            for line in lines:
-                line = line.rstrip('\n').split()
-                edge_index[0][cnt] = int(line[0]) - 1
-                edge_index[1][cnt] = int(line[1]) - 1
-                cnt += 1
-
-        data = Data(num_nodes=num_nodes, edge_index=edge_index.to(device))
-        data = append_neighbors(data)
-
-        data.single_degree = []
-        data.weighted_degree = []
-        tensor_abs_weighted_degree = []
-        for i0 in range(data.num_nodes):
-            data.single_degree.append(len(data.neighbors[i0]))
-            data.weighted_degree.append(
-                float(th.sum(data.neighbor_edges[i0])))
-            tensor_abs_weighted_degree.append(
-                float(th.sum(th.abs(data.neighbor_edges[i0]))))
-        tensor_abs_weighted_degree = th.tensor(tensor_abs_weighted_degree)
-        data.sorted_degree_nodes = th.argsort(
-            tensor_abs_weighted_degree, descending=True)
-
-        edge_degree = []
-        add = th.zeros(3, num_edges).to(device)
-        for i0 in range(num_edges):
-            edge_degree.append(
-                tensor_abs_weighted_degree[edge_index[0][i0]] + tensor_abs_weighted_degree[edge_index[1][i0]])
-            node_r = edge_index[0][i0]
-            node_c = edge_index[1][i0]
-            add[0][i0] = 1 - data.weighted_degree[node_r] / 2 - 0.05
-            add[1][i0] = 1 - data.weighted_degree[node_c] / 2 - 0.05
-            add[2][i0] = 1 + 0.05
-
-        for i0 in range(num_nodes):
-            data.neighbor_edges[i0] = data.neighbor_edges[i0].unsqueeze(0)
-        data.add_items = add
-        edge_degree = th.tensor(edge_degree)
-        data.sorted_degree_edges = th.argsort(
-            edge_degree, descending=True)
-        return data, num_nodes
-
-
-def append_neighbors(data, device=th.device(f'cuda:{GPU_ID}' if th.cuda.is_available() else 'cpu')):
-    data.neighbors = []
-    data.neighbor_edges = []
-    # num_nodes = data.encode_len
-    num_nodes = data.num_nodes
-    for i in range(num_nodes):
-        data.neighbors.append([])
-        data.neighbor_edges.append([])
-    edge_number = data.edge_index.shape[1]
-
-    edge_weight = 1
-    for index in range(0, edge_number):
-        row = data.edge_index[0][index]
-        col = data.edge_index[1][index]
-
-        data.neighbors[row].append(col.item())
-        data.neighbor_edges[row].append(edge_weight)
-        data.neighbors[col].append(row.item())
-        data.neighbor_edges[col].append(edge_weight)
-
-    data.n0 = []
-    data.n1 = []
-    data.n0_edges = []
-    data.n1_edges = []
-    for index in range(0, edge_number):
-        row = data.edge_index[0][index]
-        col = data.edge_index[1][index]
-        data.n0.append(data.neighbors[row].copy())
-        data.n1.append(data.neighbors[col].copy())
-        data.n0_edges.append(data.neighbor_edges[row].copy())
-        data.n1_edges.append(data.neighbor_edges[col].copy())
-        i = 0
-        for i in range(len(data.n0[index])):
-            if data.n0[index][i] == col:
-                break
-        data.n0[index].pop(i)
-        data.n0_edges[index].pop(i)
-        for i in range(len(data.n1[index])):
-            if data.n1[index][i] == row:
-                break
-        data.n1[index].pop(i)
-        data.n1_edges[index].pop(i)
-
-        data.n0[index] = th.LongTensor(data.n0[index]).to(device)
-        data.n1[index] = th.LongTensor(data.n1[index]).to(device)
-        data.n0_edges[index] = th.tensor(
-            data.n0_edges[index]).unsqueeze(0).to(device)
-        data.n1_edges[index] = th.tensor(
-            data.n1_edges[index]).unsqueeze(0).to(device)
-
-    for i in range(num_nodes):
-        data.neighbors[i] = th.LongTensor(data.neighbors[i]).to(device)
-        data.neighbor_edges[i] = th.tensor(
-            data.neighbor_edges[i]).to(device)
+    graph = GraphCSR.from_txt(path)
+    num_nodes, num_edges = graph.num_nodes, graph.num_edges
+    edge_n0s, edge_n1s, edge_weights = graph.edge_tensors()
+    edge_index = th.stack((edge_n0s, edge_n1s)).long()
+
+    data = Data(num_nodes=num_nodes, edge_index=edge_index.to(device), edge_weight=edge_weights.float().to(device))
+    data = append_neighbors(data, graph=graph, device=device)
+
+    node_ids = th.repeat_interleave(th.arange(num_nodes), th.from_numpy(graph.degrees).long())
+    neighbor_edges = th.cat(data.neighbor_edges).float().cpu()
+    weighted_degree = th.zeros(num_nodes).index_add_(0, node_ids, neighbor_edges)
+    abs_weighted_degree = th.zeros(num_nodes).index_add_(0, node_ids, neighbor_edges.abs())
+    data.single_degree = graph.degrees.tolist()
+    data.weighted_degree = weighted_degree.tolist()
+    data.sorted_degree_nodes = th.argsort(abs_weighted_degree, descending=True)
+
+    add = th.zeros(3, num_edges)
+    add[0] = 1 - weighted_degree[edge_index[0]] / 2 - 0.05
+    add[1] = 1 - weighted_degree[edge_index[1]] / 2 - 0.05
+    add[2] = 1 + 0.05
+    data.add_items = add.to(device)
+
+    for i0 in range(num_nodes):
+        data.neighbor_edges[i0] = data.neighbor_edges[i0].unsqueeze(0)
+    edge_degree = abs_weighted_degree[edge_index[0]] + abs_weighted_degree[edge_index[1]]
+    data.sorted_degree_edges = th.argsort(edge_degree, descending=True)
+    return data, num_nodes
+
+
+def append_neighbors(data, graph: GraphCSR = None, device=th.device(f'cuda:{GPU_ID}' if th.cuda.is_available() else 'cpu')):
+    """
+    data.neighbors[i], data.neighbor_edges[i]: the neighbors of node i and the weights of the edges, sliced from the CSR arrays.
+    The weights of a graph without data.edge_weight are 1.
+    """
+    if graph is None:
+        edge_index = data.edge_index.cpu().numpy()
+        edge_weight = getattr(data, 'edge_weight', None)
+        edge_weight = None if edge_weight is None else edge_weight.cpu().numpy()
+        graph = GraphCSR(num_nodes=data.num_nodes, edge_n0s=edge_index[0], edge_n1s=edge_index[1],
+                         edge_weights=edge_weight)
+    _, indices, weights = graph.csr_tensors()
+    indices = indices.long().to(device)
+    weights = weights.float().to(device)
+    split_sizes = graph.degrees.tolist()
+    data.neighbors = list(indices.split(split_sizes))
+    data.neighbor_edges = list(weights.split(split_sizes))
     return data
 
 def save_graph_list_to_txt(graph_list, txt_path: str):
@@ -203,6 +146,7 @@ def run():
     # path = 'data/gset_70.txt'  # GPU RAM 40GB
 
     show_gap = 2 ** 4
+    use_anytime_recorder = False  # True: write the results at RUNNING_DURATIONS, and stop after the last one
 
     if os.name == 'nt':
         max_epoch_num = 2 ** 4
@@ -212,6 +156,7 @@ def run():
         show_gap = 2 ** 0
 
     '''init'''
+    start_time = time.time()
     sim_name = path  # os.path.splitext(os.path.basename(path))[0]
     data, num_nodes = maxcut_dataloader(path)
     device = th.device(f'cuda:{GPU_ID}' if th.cuda.is_available() else 'cpu')
@@ -242,6 +187,8 @@ def run():
     xs_prob = (th.zeros(num_nodes) + 0.5).to(device)
     xs_bool = now_max_info.repeat(1, repeat_times)
 
+    recorder = AnytimeRecorder(path, 'mcpg', num_nodes, start_time=start_time) if use_anytime_recorder else None
+
     print('start loop')
     sys.stdout.flush()  # add for slurm stdout
     for epoch in range(1, max_epoch_num + 1):
@@ -260,6 +207,8 @@ def run():
 
             # update if min is too small
             now_max = max(now_max_res).item()
+            if recorder is not None and recorder.report(now_max):
+                break
             now_max_index = th.argmax(now_max_res)
             now_min_index = th.argmin(now_max_res)
             now_max_res[now_min_index] = now_max
@@ -308,6 +257,10 @@ def run():
                 break
         if os.path.exists('./stop'):
             break
+        if recorder is not None and recorder.is_over():
+            break
+    if recorder is not None:
+        recorder.finish()
     if os.path.exists('./stop'):
         print(f"break: os.path.exists('./stop') {os.path.exists('./stop')}")
         sys.stdout.flush()  # add for slurm stdout
@@ -9,23 +9,26 @@ from util import read_nxgraph
 from util import obj_maxcut
 from util import write_result
 from util import plot_fig
+from flip_gain import FlipGainEngine
 
 import sys
 sys.path.append('../')
 def random_walk(init_solution: Union[List[int], np.array], num_steps: int, graph: nx.Graph) -> (int, Union[List[int], np.array], List[int]):
     print('random_walk')
     start_time = time.time()
-    curr_solution = copy.deepcopy(init_solution)
-    init_score = obj_maxcut(init_solution, graph)
-    num_nodes = len(curr_solution)
+    # the obj after each flip is updated by FlipGainEngine in O(deg) instead of recomputed
+    engine = FlipGainEngine(graph, init_solution)
+    init_score = engine.objective
+    num_nodes = len(init_solution)
     scores = []
     for i in range(num_steps):
         # select a node randomly
         node = random.randint(0, num_nodes - 1)
-        curr_solution[node] = (curr_solution[node] + 1) % 2
+        engine.flip(node)
         # calc the obj
-        score = obj_maxcut(curr_solution, graph)
+        score = engine.objective
         scores.append(score)
+    curr_solution = engine.solution.tolist()
     print("score, init_score of random_walk", score, init_score)
     print("scores: ", scores)
     print("solution: ", curr_solution)
@@ -33,7 +36,6 @@ def random_walk(init_solution: Union[List[int], np.array], num_steps: int, graph
     print('running_duration: ', running_duration)
     return score, curr_solution, scores
 
-
 if __name__ == '__main__':
     # read data
     # graph1 = read_as_networkx_graph('data/gset_14.txt')
@@ -1,21 +1,39 @@
 import sys
 sys.path.append('../')
-from pyscipopt import Model, quicksum
+from pyscipopt import Model, quicksum, Eventhdlr, SCIP_EVENTTYPE
 import os
 import time
-from typing import List
+from typing import List, Optional
 import networkx as nx
-from util import read_nxgraph
+from util import read_graph_csr
 from util import calc_txt_files_with_prefix
 from util import calc_result_file_name
 from util import calc_avg_std_of_objs
 from util import plot_fig
 from util import fetch_node
 from util import transfer_float_to_binary
+from config import MIP_WARM_START_ALG
+
+
+# record the solving time when the first incumbent is found, which is the MIP start if it is accepted
+class FirstIncumbentEventhdlr(Eventhdlr):
+    def __init__(self):
+        self.first_incumbent_duration = None
+
+    def eventinit(self):
+        self.model.catchEvent(SCIP_EVENTTYPE.BESTSOLFOUND, self)
+
+    def eventexit(self):
+        self.model.dropEvent(SCIP_EVENTTYPE.BESTSOLFOUND, self)
+
+    def eventexec(self, event):
+        if self.first_incumbent_duration is None:
+            self.first_incumbent_duration = self.model.getSolvingTime()
 
 
 # the file has been open
-def write_statistics(model, new_file, add_slash = False):
+# warm_start_statistics: {'warm_start_alg': ..., 'warm_start_duration': ..., 'first_incumbent_duration': ...}
+def write_statistics(model, new_file, add_slash = False, warm_start_statistics: dict = None):
     prefix = '// ' if add_slash else ''
     obj = model.getObjVal()
     new_file.write(f"{prefix}obj: {obj}\n")
@@ -29,9 +47,13 @@ def write_statistics(model, new_file, add_slash = False):
         obj_bound = obj * (1 - gap)
     new_file.write(f"{prefix}obj_bound: {obj_bound}\n")
     new_file.write(f"{prefix}time_limit: {model.getParam('limits/time')}\n")
+    if warm_start_statistics is not None:
+        for key, value in warm_start_statistics.items():
+            new_file.write(f"{prefix}{key}: {value}\n")
 
 # running_duration (seconds) is included.
-def write_result_of_scip(model, filename: str = './result/result', running_duration: int = None):
+def write_result_of_scip(model, filename: str = './result/result', running_duration: int = None,
+                         warm_start_statistics: dict = None):
     if filename.split('/')[0] == 'data':
         filename = calc_result_file_name(filename)
     directory = filename.split('/')[0]
@@ -53,11 +75,11 @@ def write_result_of_scip(model, filename: str = './result/result', running_durat
         nodes.append(node)
         values.append(value)
     with open(f"{new_filename}.txt", 'w', encoding="UTF-8") as new_file:
-        write_statistics(model, new_file, True)
+        write_statistics(model, new_file, True, warm_start_statistics)
         for i in range(len(nodes)):
             new_file.write(f"{nodes[i] + 1} {values[i] + 1}\n")
     with open(f"{new_filename}.sta", 'w', encoding="UTF-8") as new_file:
-        write_statistics(model, new_file, False)
+        write_statistics(model, new_file, False, warm_start_statistics)
     with open(f"{new_filename}.sov", 'w', encoding="UTF-8") as new_file:
         new_file.write('values of vars: \n')
         for var in vars:
@@ -68,14 +90,17 @@ def write_result_of_scip(model, filename: str = './result/result', running_durat
     # model.writeSol(f"{filename}.sol")
     print()
 
-def run_using_scip(filename: str, time_limit: int = None, plot_fig_: bool = False):
+# warm_start_alg: None, or the heuristic whose solution is the MIP start (see warm_start.py), added as a partial solution
+# of the x vars and the y vars, and SCIP completes it.
+def run_using_scip(filename: str, time_limit: int = None, plot_fig_: bool = False,
+                   warm_start_alg: Optional[str] = MIP_WARM_START_ALG):
     start_time = time.time()
     model = Model("maxcut")
 
-    graph = read_nxgraph(filename)
+    graph = read_graph_csr(filename)
 
-    adjacency_matrix = nx.to_numpy_array(graph)
-    num_nodes = nx.number_of_nodes(graph)
+    adjacency_matrix = graph.to_dense()
+    num_nodes = graph.number_of_nodes()
     nodes = list(range(num_nodes))
 
     x = {}
@@ -95,12 +120,31 @@ def run_using_scip(filename: str, time_limit: int = None, plot_fig_: bool = Fals
             model.addCons(y[(i, j)] + x[i] + x[j] <= 2, name='C0b_' + str(i) + '_' + str(j))
     if time_limit is not None:
         model.setRealParam("limits/time", time_limit)
+
+    warm_start_duration = None
+    if warm_start_alg is not None:
+        from warm_start import calc_warm_start_solution
+        score, solution, warm_start_duration = calc_warm_start_solution(warm_start_alg, graph)
+        sol = model.createPartialSol()
+        for i in nodes:
+            model.setSolVal(sol, x[i], solution[i])
+        for j in nodes:
+            for i in range(0, j):
+                model.setSolVal(sol, y[(i, j)], solution[i] ^ solution[j])
+        model.addSol(sol)
+    eventhdlr = FirstIncumbentEventhdlr()
+    model.includeEventhdlr(eventhdlr, "first_incumbent", "record the time of the first incumbent")
     model.optimize()
+    warm_start_statistics = {'warm_start_alg': warm_start_alg,
+                             'warm_start_duration': warm_start_duration,
+                             'first_incumbent_duration': eventhdlr.first_incumbent_duration}
+    print(f"warm_start_alg: {warm_start_alg}, first_incumbent_duration: {eventhdlr.first_incumbent_duration}, "
+          f"gap: {model.getGap()}")
 
 
     # if model.getStatus() == "optimal":
     running_duration = time.time() - start_time
-    write_result_of_scip(model, filename, time_limit)
+    write_result_of_scip(model, filename, time_limit, warm_start_statistics)
 
 
     print('obj:', model.getObjVal())
@@ -1,12 +1,21 @@
 import sys
 sys.path.append('../')
-import cvxpy as cp
+try:
+    import cvxpy as cp
+except ImportError:
+    cp = None
 import networkx as nx
 import matplotlib.pyplot as plt
 import numpy as np
 import scipy.linalg
+import scipy.sparse
+from typing import Optional, Union
 from util import obj_maxcut
+from util import obj_maxcut_batch
+from util import obtain_edge_arrays
 from util import read_nxgraph
+from util import read_graph_csr
+from methods.graph_csr import GraphCSR
 import os
 os.environ["KMP_DUPLICATE_LIB_OK"]="TRUE"
 
@@ -23,6 +32,7 @@ def draw_graph(G, colors, pos):
 # approx ratio 0.87
 # goemans_williamson alg
 def sdp_maxcut(filename: str):
+    assert cp is not None, 'cvxpy is not installed, use sdp_maxcut_low_rank instead'
     graph = read_nxgraph(filename)
     n = graph.number_of_nodes() # num of nodes
     edges = graph.edges
@@ -61,6 +71,92 @@ def sdp_maxcut(filename: str):
     print("obj: ", score, ",solution = " + str(solution))
     return score, solution
 
+
+# Burer-Monteiro low-rank SDP of maxcut: X = V V^T, where V is of shape (num_nodes, rank) and each row v_i is a unit
+# vector, i.e.,
+#   max sum_{(i, j) in edges} w_ij * (1 - v_i . v_j) / 2  <=>  min sum_{(i, j) in edges} w_ij * v_i . v_j.
+# It is solved by the Riemannian gradient descent on the product of spheres with Armijo backtracking. The gradient A V
+# is a sparse product over the edges, O(E * rank) per iteration, instead of the O(N^2) vars and the O(N^3) sqrtm of
+# the cvxpy SDP. rank = ceil(sqrt(2 * num_nodes)) is enough for the optimum of the SDP (Barvinok-Pataki bound).
+# return: V, and the objective of the SDP relaxation
+def solve_sdp_maxcut_low_rank(graph: Union[nx.Graph, GraphCSR], rank: Optional[int] = None, num_iters: int = 2000,
+                              tol: float = 1e-7, seed: int = 0, if_print: bool = True) -> (np.ndarray, float):
+    num_nodes = int(graph.number_of_nodes())
+    if rank is None:
+        rank = int(np.ceil(np.sqrt(2 * num_nodes)))
+    edge_n0s, edge_n1s, edge_weights = obtain_edge_arrays(graph)
+    edge_weights = np.asarray(edge_weights, dtype=np.float64)
+    adjacency_matrix = scipy.sparse.coo_matrix((edge_weights, (edge_n0s, edge_n1s)), shape=(num_nodes, num_nodes))
+    adjacency_matrix = (adjacency_matrix + adjacency_matrix.T).tocsr()
+    total_weight = float(edge_weights.sum())
+
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((num_nodes, rank))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    products = adjacency_matrix @ vectors
+    loss = 0.5 * float(np.sum(vectors * products))  # sum_{(i, j) in edges} w_ij * v_i . v_j
+    abs_weights = np.abs(np.concatenate((edge_weights, edge_weights)))
+    abs_degrees = np.bincount(np.concatenate((edge_n0s, edge_n1s)), weights=abs_weights, minlength=num_nodes)
+    step = 1.0 / max(float(abs_degrees.max(initial=0.0)), 1e-12)
+    num_done_iters = 0
+    for _ in range(num_iters):
+        # the gradient projected to the tangent space of the spheres
+        grad = products - np.sum(products * vectors, axis=1, keepdims=True) * vectors
+        grad_norm2 = float(np.sum(grad * grad))
+        if grad_norm2 <= tol * tol:
+            break
+        while True:
+            new_vectors = vectors - step * grad
+            new_vectors /= np.linalg.norm(new_vectors, axis=1, keepdims=True)
+            new_products = adjacency_matrix @ new_vectors
+            new_loss = 0.5 * float(np.sum(new_vectors * new_products))
+            if new_loss <= loss - 1e-4 * step * grad_norm2 or step < 1e-12:
+                break
+            step *= 0.5
+        if new_loss >= loss:
+            # the backtracking stops at a tiny step without any decrease, and the step is rejected
+            break
+        improvement = loss - new_loss
+        vectors, products, loss = new_vectors, new_products, new_loss
+        step *= 2
+        num_done_iters += 1
+        if improvement <= tol * max(abs(loss), 1.0):
+            break
+    sdp_obj = 0.5 * (total_weight - loss)
+    if if_print:
+        print(f"iterations: {num_done_iters}, obj of sdp: {sdp_obj}")
+    return vectors, sdp_obj
+
+
+# Goemans-Williamson rounding with num_hyperplanes random hyperplanes: the sides of the nodes are the signs of V R,
+# where R is of shape (rank, num_hyperplanes), computed in chunks of hyperplanes in one matrix product each,
+# and the best cut is kept.
+def round_by_hyperplanes(vectors: np.ndarray, graph: Union[nx.Graph, GraphCSR], num_hyperplanes: int = 2048,
+                         chunk_size: int = 256, seed: int = 0) -> (float, np.ndarray):
+    rng = np.random.default_rng(seed)
+    best_score = -np.inf
+    best_solution = None
+    for begin in range(0, num_hyperplanes, chunk_size):
+        num_chunk_hyperplanes = min(chunk_size, num_hyperplanes - begin)
+        hyperplanes = rng.standard_normal((vectors.shape[1], num_chunk_hyperplanes))
+        solutions = (vectors @ hyperplanes >= 0).T.astype(np.int8)
+        scores = obj_maxcut_batch(solutions, graph)
+        best_id = int(np.argmax(scores))
+        if scores[best_id] > best_score:
+            best_score = float(scores[best_id])
+            best_solution = solutions[best_id]
+    return best_score, best_solution
+
+
+# the low-rank SDP mode of sdp_maxcut, for large graphs such as gset
+def sdp_maxcut_low_rank(filename: str, rank: Optional[int] = None, num_hyperplanes: int = 2048):
+    graph = read_graph_csr(filename)
+    vectors, sdp_obj = solve_sdp_maxcut_low_rank(graph, rank)
+    score, solution = round_by_hyperplanes(vectors, graph, num_hyperplanes)
+    solution = solution.tolist()
+    print("obj: ", score, ",solution = " + str(solution))
+    return score, solution
+
 if __name__ == '__main__':
     # n = 5
     # graph = nx.Graph()
@@ -74,10 +170,11 @@ if __name__ == '__main__':
     # graph = read_nxgraph('../data/syn/syn_50_176.txt')
     # filename = '../data/gset/gset_14.txt'
     filename = '../data/syn/syn_50_176.txt'
-    sdp_maxcut(filename)
+    mode = 'cvxpy'  # 'cvxpy': the SDP by cvxpy. 'low_rank': the low-rank SDP, see sdp_maxcut_low_rank
+    alg = sdp_maxcut if mode == 'cvxpy' else sdp_maxcut_low_rank
+    alg(filename)
 
     from util import run_sdp_over_multiple_files
-    alg = sdp_maxcut
     alg_name = 'sdp'
     directory_data = '../data/syn_BA'
     prefixes = ['barabasi_albert_300']
@@ -0,0 +1,90 @@
+import numpy as np
+from typing import List, Union
+
+from methods.config import INF
+
+
+# Sparse incidence index of a set cover instance, in CSR format in both directions.
+# The items start from 1 as in the data files, and the items out of [1, num_items] are ignored, the same as obj_set_cover.
+# The sets start from 0, i.e., set i is item_matrix[i].
+# - set_offsets, set_items: the items of set i are set_items[set_offsets[i]: set_offsets[i + 1]]
+# - item_offsets, item_sets: the sets containing item j are item_sets[item_offsets[j]: item_offsets[j + 1]]
+class SetCoverIndex:
+    def __init__(self, num_items: int, num_sets: int, item_matrix: List[List[int]]):
+        self.num_items = num_items
+        self.num_sets = num_sets
+        assert len(item_matrix) == num_sets
+
+        items_of_sets = [np.unique(np.asarray(items, dtype=np.int64)) for items in item_matrix]
+        items_of_sets = [items[(items >= 1) & (items <= num_items)] for items in items_of_sets]
+        set_sizes = np.array([len(items) for items in items_of_sets], dtype=np.int64)
+        self.set_offsets = np.zeros(num_sets + 1, dtype=np.int64)
+        np.cumsum(set_sizes, out=self.set_offsets[1:])
+        self.set_items = np.concatenate(items_of_sets) if num_sets > 0 else np.zeros(0, dtype=np.int64)
+
+        set_ids = np.repeat(np.arange(num_sets), set_sizes)
+        order = np.argsort(self.set_items, kind='stable')
+        self.item_offsets = np.zeros(num_items + 2, dtype=np.int64)
+        np.cumsum(np.bincount(self.set_items, minlength=num_items + 1), out=self.item_offsets[1:])
+        self.item_sets = set_ids[order]
+
+    def items(self, set_id: int) -> np.ndarray:
+        return self.set_items[self.set_offsets[set_id]: self.set_offsets[set_id + 1]]
+
+    def sets(self, item: int) -> np.ndarray:
+        return self.item_sets[self.item_offsets[item]: self.item_offsets[item + 1]]
+
+    def set_size(self, set_id: int) -> int:
+        return int(self.set_offsets[set_id + 1] - self.set_offsets[set_id])
+
+
+# Incremental coverage of a set cover solution. cover_counts[j] is the number of selected sets containing item j,
+# so selecting or unselecting set i costs O(|set i|), and the objective is read in O(1).
+class SetCoverCounter:
+    def __init__(self, index: SetCoverIndex, solution: Union[List[int], np.array]):
+        self.index = index
+        self.solution = np.array(solution, dtype=np.int8)
+        assert self.solution.shape == (index.num_sets,)
+        self.cover_counts = np.zeros(index.num_items + 1, dtype=np.int64)
+        for set_id in np.flatnonzero(self.solution).tolist():
+            self.cover_counts[index.items(set_id)] += 1
+        self.num_covered = int(np.count_nonzero(self.cover_counts[1:]))
+        self.num_selected = int(self.solution.sum())
+
+    # the same as obj_set_cover
+    @property
+    def objective(self) -> float:
+        if self.num_covered == self.index.num_items:
+            return -self.num_selected
+        return -INF
+
+    # the same as obj_set_cover_ratio
+    @property
+    def ratio(self) -> float:
+        return float(self.num_covered) / float(self.index.num_items)
+
+    # the number of uncovered items that set i would cover
+    def marginal_gain(self, set_id: int) -> int:
+        return int(np.count_nonzero(self.cover_counts[self.index.items(set_id)] == 0))
+
+    def flip(self, set_id: int):
+        items = self.index.items(set_id)
+        if self.solution[set_id] == 0:
+            self.num_covered += int(np.count_nonzero(self.cover_counts[items] == 0))
+            self.cover_counts[items] += 1
+            self.num_selected += 1
+        else:
+            self.cover_counts[items] -= 1
+            self.num_covered -= int(np.count_nonzero(self.cover_counts[items] == 0))
+            self.num_selected -= 1
+        self.solution[set_id] ^= 1
+
+    # the objective after flipping the sets, and the counter is restored. O(sum of |set|)
+    def objective_after_flips(self, set_ids: List[int]) -> float:
+        for set_id in set_ids:
+            self.flip(set_id)
+        obj = self.objective
+        for set_id in reversed(set_ids):
+            self.flip(set_id)
+        return obj
+
@@ -9,6 +9,7 @@ import networkx as nx
 
 from util import (obj_maxcut,
                   read_nxgraph,
+                  read_graph,
                   cover_all_edges,
                   read_set_cover_data,
                   obj_graph_partitioning,
@@ -19,6 +20,7 @@ from util import (obj_maxcut,
                   write_result,
                   calc_txt_files_with_prefix,
                   write_result2,
+                  AnytimeRecorder,
                   write_result_set_cover,
                   plot_fig
                  )
@@ -31,6 +33,9 @@ from greedy import (greedy_maxcut,
                     )
 # from util import run_simulated_annealing_over_multiple_files
 from methods.config import *
+from flip_gain import FlipGainEngine
+from set_cover_index import SetCoverIndex, SetCoverCounter
+from vertex_counter import VertexSelectionCounter
 
 
 def simulated_annealing_set_cover(init_temperature: int,
@@ -42,32 +47,28 @@ def simulated_annealing_set_cover(init_temperature: int,
     start_time = time.time()
     gr_score, gr_solution, gr_scores = greedy_set_cover(num_items, num_sets, item_matrix)
     init_score = gr_score
-    curr_solution = copy.deepcopy(gr_solution)
     curr_score = gr_score
+    # the coverage counts are updated incrementally, so a move is evaluated in O(|set|) instead of O(num_items)
+    index = SetCoverIndex(num_items, num_sets, item_matrix)
+    counter = SetCoverCounter(index, gr_solution)
     scores = []
     scores.append(init_score)
     for k in range(num_steps):
         # The temperature decreases
         temperature = init_temperature * (1 - (k + 1) / num_steps)
-        new_solution = copy.deepcopy(curr_solution)
-        selected_sets = []
-        unselected_sets = []
-        for i in range(len(new_solution)):
-            if new_solution[i] == 1:
-                selected_sets.append(i)
-            else:
-                unselected_sets.append(i)
+        selected_sets = np.flatnonzero(counter.solution == 1).tolist()
+        unselected_sets = np.flatnonzero(counter.solution == 0).tolist()
         # if prob < prob_thresh, swap one set in selected_sets with one set in unselected_sets;
         # if prob > prob_thresh, swap two sets in selected_sets with one set in unselected_sets;
         prob_thresh = 0.05
         prob = random.random()
         idx_in = np.random.randint(0, len(unselected_sets))
         set_in = unselected_sets[idx_in]
-        new_solution[set_in] = (new_solution[set_in] + 1) % 2
+        sets_to_flip = [set_in]
         if prob < prob_thresh:
             idx_out = np.random.randint(0, len(selected_sets))
             set_out = selected_sets[idx_out]
-            new_solution[set_out] = (new_solution[set_out] + 1) % 2
+            sets_to_flip.append(set_out)
         else:
             while True:
                 idx_out1, idx_out2 = np.random.randint(0, len(selected_sets), 2)
@@ -75,23 +76,22 @@ def simulated_annealing_set_cover(init_temperature: int,
                     break
             set_out1 = selected_sets[idx_out1]
             set_out2 = selected_sets[idx_out2]
-            new_solution[set_out1] = (new_solution[set_out1] + 1) % 2
-            new_solution[set_out2] = (new_solution[set_out2] + 1) % 2
-        new_score = obj_set_cover(new_solution, num_items, item_matrix)
+            sets_to_flip.extend([set_out1, set_out2])
+        new_score = counter.objective_after_flips(sets_to_flip)
         store = False
         delta_e = curr_score - new_score
         if delta_e < 0:
-            curr_solution = new_solution
-            curr_score = new_score
             store = True
         else:
             prob = np.exp(-delta_e / (temperature + 1e-6))
             if prob > random.random():
-                curr_solution = new_solution
-                curr_score = new_score
                 store = True
         if store:
+            for set_id in sets_to_flip:
+                counter.flip(set_id)
+            curr_score = new_score
             scores.append(new_score)
+    curr_solution = counter.solution.tolist()
     print("init_score, final score of simulated_annealing", init_score, curr_score)
     print("scores: ", scores)
     print("solution: ", curr_solution)
@@ -100,8 +100,10 @@ def simulated_annealing_set_cover(init_temperature: int,
     return curr_score, curr_solution, scores
 
 
-def simulated_annealing(init_temperature: int, num_steps: Optional[int], graph: nx.Graph) \
-        -> (int, Union[List[int], np.array], List[int]):
+# If recorder is not None, the incumbents are reported to it, and the loop runs until its last running duration instead
+# of num_steps, where the temperature restarts from init_temperature every num_steps steps.
+def simulated_annealing(init_temperature: int, num_steps: Optional[int], graph: nx.Graph,
+                        recorder: Optional[AnytimeRecorder] = None) -> (int, Union[List[int], np.array], List[int]):
     print('simulated_annealing')
     num_nodes = int(graph.number_of_nodes())
     if PROBLEM == Problem.maxcut:
@@ -131,64 +133,64 @@ def simulated_annealing(init_temperature: int, num_steps: Optional[int], graph:
     #     curr_score = gr_score / graph.number_of_edges()
     scores = []
     scores.append(init_score)
+    # maxcut and graph_partitioning evaluate the flips by the gains in FlipGainEngine, and minimum_vertex_cover and
+    # maximum_independent_set by the counters in VertexSelectionCounter, O(deg) per step
+    engine = None
+    counter = None
+    if PROBLEM in [Problem.maxcut, Problem.graph_partitioning]:
+        engine = FlipGainEngine(graph, curr_solution, minimize_cut=PROBLEM == Problem.graph_partitioning)
+    elif PROBLEM in [Problem.minimum_vertex_cover, Problem.maximum_independent_set]:
+        counter = VertexSelectionCounter(graph, curr_solution)
+    incremental_state = engine if engine is not None else counter
+    if recorder is not None:
+        recorder.report(curr_score)
 
-    for k in range(num_steps):
+    k = 0
+    while k < num_steps if recorder is None else not recorder.is_over():
         # The temperature decreases
-        temperature = init_temperature * (1 - (k + 1) / num_steps)
-        new_solution = copy.deepcopy(curr_solution)
+        temperature = init_temperature * (1 - (k % num_steps + 1) / num_steps)
+        new_solution = None
         if PROBLEM == Problem.maxcut:
             idx = np.random.randint(0, num_nodes)
-            new_solution[idx] = (new_solution[idx] + 1) % 2
-            new_score = obj_maxcut(new_solution, graph)
+            nodes_to_flip = [idx]
+            new_score = curr_score + engine.gain(idx)
         elif PROBLEM == Problem.graph_partitioning:
             while True:
                 idx = np.random.randint(0, num_nodes)
                 node2 = np.random.randint(0, num_nodes)
-                if new_solution[idx] != new_solution[node2]:
+                if engine.solution[idx] != engine.solution[node2]:
                     break
-            print(f"new_solution[index]: {new_solution[idx]}, new_solution[index2]: {new_solution[node2]}")
-            tmp = new_solution[idx]
-            new_solution[idx] = new_solution[node2]
-            new_solution[node2] = tmp
-            new_score = obj_graph_partitioning(new_solution, graph)
+            print(f"new_solution[index]: {engine.solution[idx]}, new_solution[index2]: {engine.solution[node2]}")
+            nodes_to_flip = [idx, node2]
+            new_score = curr_score + engine.swap_gain(idx, node2)
         elif PROBLEM == Problem.minimum_vertex_cover:
             iter = 0
             index = None
+            indices_eq_1 = np.flatnonzero(counter.solution == 1).tolist()
             while True:
                 iter += 1
                 if iter >= num_steps:
                     break
-                indices_eq_1 = []
-                for i in range(len(new_solution)):
-                    if new_solution[i] == 1:
-                        indices_eq_1.append(i)
                 idx = np.random.randint(0, len(indices_eq_1))
-                new_solution2 = copy.deepcopy(new_solution)
-                new_solution2[indices_eq_1[idx]] = 0
-                if cover_all_edges(new_solution2, graph):
+                # the cover is kept if all the neighbors of the removed node are selected
+                if counter.num_unselected_neighbors(indices_eq_1[idx]) == 0:
                     index = indices_eq_1[idx]
                     break
-            if index is not None:
-                new_solution[index] = 0
-            new_score = obj_minimum_vertex_cover(new_solution, graph, False)
+            nodes_to_flip = [] if index is None else [index]
+            new_score = -(counter.num_selected - len(nodes_to_flip))
         elif PROBLEM == Problem.maximum_independent_set:
-            selected_indices = []
-            unselected_indices = []
-            for i in range(len(new_solution)):
-                if new_solution[i] == 1:
-                    selected_indices.append(i)
-                else:
-                    unselected_indices.append(i)
+            selected_indices = np.flatnonzero(counter.solution == 1).tolist()
+            unselected_indices = np.flatnonzero(counter.solution == 0).tolist()
             idx_out = np.random.randint(0, len(selected_indices))
             node_out = selected_indices[idx_out]
-            new_solution[node_out] = (new_solution[node_out] + 1) % 2
+            nodes_to_flip = [node_out]
             # if prob < prob_thresh, change one node; if prob > prob_thresh, change two nodes
             prob_thresh = 0.05
             prob = random.random()
             if prob < prob_thresh:
                 idx_in = np.random.randint(0, len(unselected_indices))
                 node_in = unselected_indices[idx_in]
-                new_solution[node_in] = (new_solution[node_in] + 1) % 2
+                nodes_to_flip.append(node_in)
             else:
                 while True:
                     node1, node2 = np.random.randint(0, len(unselected_indices), 2)
@@ -196,10 +198,10 @@ def simulated_annealing(init_temperature: int, num_steps: Optional[int], graph:
                         break
                 node_in1 = unselected_indices[node1]
                 node_in2 = unselected_indices[node2]
-                new_solution[node_in1] = (new_solution[node_in1] + 1) % 2
-                new_solution[node_in2] = (new_solution[node_in2] + 1) % 2
-            new_score = obj_maximum_independent_set(new_solution, graph)
+                nodes_to_flip.extend([node_in1, node_in2])
+            new_score = counter.obj_maximum_independent_set_after_flips(nodes_to_flip)
         elif PROBLEM == Problem.graph_coloring:
+            new_solution = copy.deepcopy(curr_solution)
             while True:
                 node1, node2 = np.random.randint(0, num_nodes, 2)
                 if node1 != node2:
@@ -211,16 +213,18 @@ def simulated_annealing(init_temperature: int, num_steps: Optional[int], graph:
         store = False
         delta_e = curr_score - new_score
         if delta_e < 0:
-            curr_solution = new_solution
-            curr_score = new_score
             store = True
         else:
             prob = np.exp(-delta_e / (temperature + 1e-6))
             if prob > random.random():
-                curr_solution = new_solution
-                curr_score = new_score
                 store = True
         if store:
+            if incremental_state is not None:
+                for node in nodes_to_flip:
+                    incremental_state.flip(node)
+            else:
+                curr_solution = new_solution
+            curr_score = new_score
             scores.append(new_score)
             # if PROBLEM == Problem.maximum_independent_set:
             #     tmp_new_score = obj_maximum_independent_set(new_solution, graph)
@@ -228,6 +232,11 @@ def simulated_annealing(init_temperature: int, num_steps: Optional[int], graph:
             #     scores.append(tmp_new_score)
             # else:
             #     scores.append(new_score)
+            if recorder is not None:
+                recorder.report(curr_score)
+        k += 1
+    if incremental_state is not None:
+        curr_solution = incremental_state.solution.tolist()
     print("init_score, final score of simulated_annealing", init_score, curr_score)
     print("scores: ", scores)
     print("solution: ", curr_solution)
@@ -235,7 +244,103 @@ def simulated_annealing(init_temperature: int, num_steps: Optional[int], graph:
     print('running_duration: ', running_duration)
     return curr_score, curr_solution, scores
 
-def run_simulated_annealing_over_multiple_files(alg, alg_name, init_temperature, num_steps, directory_data: str, prefixes: List[str])-> List[List[float]]:
+# Batched simulated annealing of maxcut: num_chains independent chains run in lockstep, stored as a
+# (num_chains, num_nodes) array. Each step proposes one random flip per chain, evaluates all the proposals by the
+# flip gains (the same gains as FlipGainEngine, one row per chain), and updates the gains of the neighbors of the
+# flipped nodes, O(num_chains * deg) per step.
+# Chain c starts at the temperature init_temperature * min_temperature_ratio ** (c / (num_chains - 1)), and all the
+# temperatures decrease linearly as in simulated_annealing. If use_parallel_tempering, the chains at adjacent
+# temperatures exchange their solutions every swap_interval steps with the replica-exchange acceptance probability.
+# All the chains start from the solution of greedy_maxcut. The best solution of all the chains is returned, and
+# scores is the best score after each step. recorder is the same as in simulated_annealing, and all the temperatures
+# restart every num_steps steps.
+def simulated_annealing_batch(init_temperature: int, num_steps: Optional[int], graph: nx.Graph,
+                              num_chains: int = 256,
+                              min_temperature_ratio: float = 0.05,
+                              use_parallel_tempering: bool = True,
+                              swap_interval: int = 10,
+                              recorder: Optional[AnytimeRecorder] = None) -> (int, Union[List[int], np.array], List[int]):
+    print('simulated_annealing_batch')
+    assert PROBLEM == Problem.maxcut
+    num_nodes = int(graph.number_of_nodes())
+    if num_steps is None:
+        num_steps = num_nodes
+    gr_score, gr_solution, gr_scores = greedy_maxcut(num_steps, graph)
+    engine = FlipGainEngine(graph, gr_solution)
+    graph = engine.graph
+    offsets = graph.offsets.astype(np.int64)
+    indices = graph.indices.astype(np.int64)
+    weights = graph.weights.astype(np.float64)
+
+    start_time = time.time()
+    chain_ids = np.arange(num_chains)
+    solutions = np.tile(engine.solution, (num_chains, 1))
+    gains = np.tile(engine.gains, (num_chains, 1))
+    curr_scores = np.full(num_chains, engine.objective)
+    init_score = engine.objective
+    best_score = init_score
+    best_solution = engine.solution.copy()
+    scores = [init_score]
+    init_temperatures = init_temperature * min_temperature_ratio ** (chain_ids / max(num_chains - 1, 1))
+
+    k = 0
+    while k < num_steps if recorder is None else not recorder.is_over():
+        # The temperature decreases
+        temperatures = init_temperatures * (1 - (k % num_steps + 1) / num_steps)
+        nodes = np.random.randint(0, num_nodes, num_chains)
+        deltas = gains[chain_ids, nodes]
+        # the same acceptance as simulated_annealing, where delta_e = -delta
+        probs = np.exp(np.minimum(deltas / (temperatures + 1e-6), 0))
+        accepted = (deltas > 0) | (probs > np.random.rand(num_chains))
+
+        flip_chains = chain_ids[accepted]
+        flip_nodes = nodes[accepted]
+        degrees = offsets[flip_nodes + 1] - offsets[flip_nodes]
+        rows = np.repeat(flip_chains, degrees)
+        flipped = np.repeat(flip_nodes, degrees)
+        positions = np.repeat(offsets[flip_nodes] - np.cumsum(degrees) + degrees, degrees) + np.arange(degrees.sum())
+        neighbors = indices[positions]
+        is_same_side = solutions[rows, neighbors] == solutions[rows, flipped]
+        np.add.at(gains, (rows, neighbors), np.where(is_same_side, -2 * weights[positions], 2 * weights[positions]))
+        curr_scores[flip_chains] += deltas[accepted]
+        gains[flip_chains, flip_nodes] *= -1
+        solutions[flip_chains, flip_nodes] ^= 1
+
+        if use_parallel_tempering and (k + 1) % swap_interval == 0 and num_chains > 1:
+            # the pairs (c, c + 1) start from c = 0 or c = 1 alternately. exp((1/T_c - 1/T_c+1) * (E_c - E_c+1)), E = -score
+            chains0 = np.arange((k // swap_interval) % 2, num_chains - 1, 2)
+            chains1 = chains0 + 1
+            betas0 = 1 / (temperatures[chains0] + 1e-6)
+            betas1 = 1 / (temperatures[chains1] + 1e-6)
+            log_probs = (betas0 - betas1) * (curr_scores[chains1] - curr_scores[chains0])
+            swapped = np.log(np.random.rand(len(chains0)) + 1e-12) < log_probs
+            permutation = chain_ids.copy()
+            permutation[chains0[swapped]] = chains1[swapped]
+            permutation[chains1[swapped]] = chains0[swapped]
+            solutions = solutions[permutation]
+            gains = gains[permutation]
+            curr_scores = curr_scores[permutation]
+
+        best_chain = int(np.argmax(curr_scores))
+        if curr_scores[best_chain] > best_score:
+            best_score = float(curr_scores[best_chain])
+            best_solution = solutions[best_chain].copy()
+        scores.append(best_score)
+        if recorder is not None:
+            recorder.report(best_score, best_solution)
+        k += 1
+    curr_score = best_score
+    curr_solution = best_solution.tolist()
+    print("init_score, final score of simulated_annealing_batch", init_score, curr_score)
+    print("solution: ", curr_solution)
+    running_duration = time.time() - start_time
+    print('running_duration: ', running_duration)
+    return curr_score, curr_solution, scores
+
+# If use_anytime_recorder, the result of each graph is written at each duration in RUNNING_DURATIONS by AnytimeRecorder,
+# and alg stops after the last duration, so one run replaces the runs with different time limits.
+def run_simulated_annealing_over_multiple_files(alg, alg_name, init_temperature, num_steps, directory_data: str, prefixes: List[str],
+                                                use_anytime_recorder: bool = False)-> List[List[float]]:
     scoress = []
     for prefix in prefixes:
         files = calc_txt_files_with_prefix(directory_data, prefix)
@@ -255,11 +360,17 @@ def run_simulated_annealing_over_multiple_files(alg, alg_name, init_temperature,
                 alg_name = 'greedy'
                 write_result_set_cover(score, running_duration, num_items, num_sets, alg_name, filename)
             else:
-                graph = read_nxgraph(filename)
+                graph = read_graph(filename)
+                num_nodes = int(graph.number_of_nodes())
+                if use_anytime_recorder:
+                    recorder = AnytimeRecorder(filename, alg_name, num_nodes, start_time=start_time)
+                    score, solution, scores = alg(init_temperature, num_steps, graph, recorder=recorder)
+                    scoress.append(scores)
+                    recorder.finish()
+                    continue
                 score, solution, scores = alg(init_temperature, num_steps, graph)
                 scoress.append(scores)
                 running_duration = time.time() - start_time
-                num_nodes = int(graph.number_of_nodes())
                 write_result2(score, running_duration, num_nodes, alg_name, filename)
     return scoress
 
@@ -296,8 +407,9 @@ if __name__ == '__main__':
 
     else:
         pass
-        alg = simulated_annealing
-        alg_name = 'simulated_annealing'
+        use_batch = False  # True: simulated_annealing_batch, i.e., multiple chains with parallel tempering (maxcut)
+        alg = simulated_annealing_batch if use_batch else simulated_annealing
+        alg_name = 'simulated_annealing_batch' if use_batch else 'simulated_annealing'
         if_run_graph_based_problems = True
         if if_run_graph_based_problems:
             init_temperature = 4
@@ -309,4 +421,6 @@ if __name__ == '__main__':
             num_steps = None
             directory_data = '../data/set_cover'
             prefixes = ['frb30-15-1.msc']
-        run_simulated_annealing_over_multiple_files(alg, alg_name, init_temperature, num_steps, directory_data, prefixes)
+        use_anytime_recorder = False  # True: write the results at RUNNING_DURATIONS in one run
+        run_simulated_annealing_over_multiple_files(alg, alg_name, init_temperature, num_steps, directory_data, prefixes,
+                                                    use_anytime_recorder)
@@ -5,11 +5,13 @@ from torch.autograd import Variable
 import functools
 import time
 import numpy as np
-from typing import Union, Tuple
+from typing import Optional, Union, Tuple
 import networkx as nx
 from torch import Tensor
 # from methods.simulated_annealing import simulated_annealing_set_cover, simulated_annealing
 from methods.config import *
+from methods.graph_csr import GraphCSR
+from methods.bounds import calc_obj_bound_of_file
 try:
     import matplotlib as mpl
     import matplotlib.pyplot as plt
@@ -38,26 +40,22 @@ def plot_nxgraph(g: nx.Graph(), fig_filename='.result/fig.png'):
 
 # read graph file, e.g., gset_14.txt, as networkx.Graph
 # The nodes in file start from 1, but the nodes start from 0 in our codes.
+# The txt file is parsed once and cached as a binary file (see graph_csr.py), so the nodes and edges are added from arrays.
 def read_nxgraph(filename: str) -> nx.Graph():
-    graph = nx.Graph()
-    with open(filename, 'r') as file:
-        # lines = []
-        line = file.readline()
-        is_first_line = True
-        while line is not None and line != '':
-            if '//' not in line:
-                if is_first_line:
-                    strings = line.split(" ")
-                    num_nodes = int(strings[0])
-                    num_edges = int(strings[1])
-                    nodes = list(range(num_nodes))
-                    graph.add_nodes_from(nodes)
-                    is_first_line = False
-                else:
-                    node1, node2, weight = line.split(" ")
-                    graph.add_edge(int(node1) - 1, int(node2) - 1, weight=weight)
-            line = file.readline()
-    return graph
+    return read_graph_csr(filename).to_nxgraph()
+
+# read graph file, e.g., gset_14.txt, as GraphCSR, i.e., flat edge and CSR arrays instead of a networkx.Graph.
+# The solvers of maxcut, graph_partitioning and minimum_vertex_cover accept both GraphCSR and networkx.Graph.
+def read_graph_csr(filename: str) -> GraphCSR:
+    return GraphCSR.from_txt(filename)
+
+# the problems whose solvers only read the graph, and can use GraphCSR. The others modify or copy a networkx.Graph.
+CSR_PROBLEMS = [Problem.maxcut, Problem.graph_partitioning, Problem.minimum_vertex_cover]
+
+def read_graph(filename: str) -> Union[GraphCSR, nx.Graph]:
+    if PROBLEM in CSR_PROBLEMS:
+        return read_graph_csr(filename)
+    return read_nxgraph(filename)
 
 # read tsp file,latitude and longitude, horizontal and vertical coordinates
 def read_tsp(filename:str) -> nx.Graph():
@@ -108,23 +106,36 @@ def read_knapsack_data(filename):
     return N, W, items
 
 
+# Two formats are supported:
+# "num_items num_sets" followed by the items of each set per line, or
+# the .msc format of the frb instances, i.e., "p set num_items num_sets" followed by "s item1 item2 ..." per line.
 def read_set_cover_data(filename):
     with open(filename, 'r') as file:
         first_line = file.readline()
-        total_elements, total_subsets = map(int, first_line.split())
+        strings = first_line.split()
+        if strings[0] == 'p':
+            strings = strings[2:]
+        total_elements, total_subsets = map(int, strings[:2])
         subsets = []
         for line in file:
-            subset = list(map(int, line.strip().split()))
+            strings = line.split()
+            if len(strings) > 0 and strings[0] == 's':
+                strings = strings[1:]
+            subset = list(map(int, strings))
             subsets.append(subset)
 
     return total_elements, total_subsets, subsets
 
-def transfer_nxgraph_to_adjacencymatrix(graph: nx.Graph):
+def transfer_nxgraph_to_adjacencymatrix(graph: Union[nx.Graph, GraphCSR]):
+    if isinstance(graph, GraphCSR):
+        return graph.to_dense()
     return nx.to_numpy_array(graph)
 
 # the returned weightmatrix has the following format： node1 node2 weight
 # For example: 1 2 3 // the weight of node1 and node2 is 3
-def transfer_nxgraph_to_weightmatrix(graph: nx.Graph):
+def transfer_nxgraph_to_weightmatrix(graph: Union[nx.Graph, GraphCSR]):
+    if isinstance(graph, GraphCSR):
+        return np.stack((graph.edge_n0s, graph.edge_n1s, graph.edge_weights), axis=1).astype(np.float64)
     # edges = nx.edges(graph)
     res = np.array([])
     edges = graph.edges()
@@ -150,32 +161,45 @@ def transfer_weightmatrix_to_nxgraph(weightmatrix: List[List[int]], num_nodes: i
         graph.add_edge(i, j, weight=weight)
     return graph
 
+# (edge_n0s, edge_n1s, edge_weights) as arrays, each edge once. GraphCSR already stores them; nx.Graph is converted, O(E).
+def obtain_edge_arrays(graph: Union[nx.Graph, GraphCSR]) -> (np.ndarray, np.ndarray, np.ndarray):
+    if isinstance(graph, GraphCSR):
+        return graph.edge_n0s, graph.edge_n1s, graph.edge_weights
+    edges = list(graph.edges(data='weight', default=1))
+    edge_n0s = np.array([n0 for n0, _, _ in edges], dtype=np.int64)
+    edge_n1s = np.array([n1 for _, n1, _ in edges], dtype=np.int64)
+    edge_weights = np.array([float(weight) for _, _, weight in edges], dtype=np.float64)
+    return edge_n0s, edge_n1s, edge_weights
+
+# solutions of shape (num_nodes, ) or (num_solutions, num_nodes) in list, np.array or Tensor, as a 2D np.array
+def transfer_solutions_to_array(solutions: Union[Tensor, List[int], List[List[int]], np.array]) -> np.ndarray:
+    if isinstance(solutions, Tensor):
+        solutions = solutions.detach().cpu().numpy()
+    solutions = np.asarray(solutions)
+    return solutions.reshape(1, -1) if solutions.ndim == 1 else solutions
+
+# max total cuts of each solution, i.e., each row of solutions. O(num_solutions * E)
+def obj_maxcut_batch(solutions: Union[Tensor, List[List[int]], np.array], graph: Union[nx.Graph, GraphCSR]) -> np.ndarray:
+    solutions = transfer_solutions_to_array(solutions)
+    edge_n0s, edge_n1s, edge_weights = obtain_edge_arrays(graph)
+    is_cut = solutions[:, edge_n0s] != solutions[:, edge_n1s]
+    return is_cut.astype(np.float64) @ edge_weights.astype(np.float64)
+
 # max total cuts
-def obj_maxcut(result: Union[Tensor, List[int], np.array], graph: nx.Graph):
-    num_nodes = len(result)
-    obj = 0
-    adj_matrix = transfer_nxgraph_to_adjacencymatrix(graph)
-    for i in range(num_nodes):
-        for j in range(i + 1, num_nodes):
-            if result[i] != result[j]:
-                obj += adj_matrix[(i, j)]
-    return obj
+def obj_maxcut(result: Union[Tensor, List[int], np.array], graph: Union[nx.Graph, GraphCSR]):
+    return float(obj_maxcut_batch(result, graph)[0])
+
+# min total cuts of each solution, -INF if the two parts of a solution are not of the same size
+def obj_graph_partitioning_batch(solutions: Union[Tensor, List[List[int]], np.array], graph: Union[nx.Graph, GraphCSR]) -> np.ndarray:
+    solutions = transfer_solutions_to_array(solutions)
+    num_nodes = solutions.shape[1]
+    objs = -obj_maxcut_batch(solutions, graph)
+    is_balanced = (solutions == 0).sum(axis=1) == num_nodes / 2
+    return np.where(is_balanced, objs, -INF)
 
 # min total cuts
-def obj_graph_partitioning(solution: Union[Tensor, List[int], np.array], graph: nx.Graph):
-    num_nodes = len(solution)
-    obj = 0
-    adj_matrix = transfer_nxgraph_to_adjacencymatrix(graph)
-    sum1 = 0
-    for i in range(num_nodes):
-        if solution[i] == 0:
-            sum1 += 1
-        for j in range(i + 1, num_nodes):
-            if solution[i] != solution[j]:
-                obj -= adj_matrix[(i, j)]
-    if sum1 != num_nodes / 2:
-        return -INF
-    return obj
+def obj_graph_partitioning(solution: Union[Tensor, List[int], np.array], graph: Union[nx.Graph, GraphCSR]):
+    return float(obj_graph_partitioning_batch(solution, graph)[0])
 
 def cover_all_edges(solution: List[int], graph: nx.Graph):
     if graph.number_of_nodes() == 0:
@@ -221,12 +245,9 @@ def obj_maximum_independent_set(solution: Union[Tensor, List[int], np.array], gr
 # the returned score, the higher, the better
 def obj_maximum_independent_set_SA(node: int, solution: Union[Tensor, List[int], np.array], graph: nx.Graph):
     def adjacent_to_selected_nodes(node: int, solution: Union[Tensor, List[int], np.array]):
-        for i in range(len(solution)):
-            if solution[i] == 1:
-                min_node = min(node, i)
-                max_node = max(node, i)
-                if (min_node, max_node) in graph.edges():
-                    return True
+        for i in graph.neighbors(node):
+            if i != node and solution[i] == 1:
+                return True
         return False
     num_edges = graph.number_of_edges()
     if solution[node] == 0:  # 0 -> 1
@@ -240,39 +261,25 @@ def obj_maximum_independent_set_SA(node: int, solution: Union[Tensor, List[int],
 
 # the ratio of items that covered. 1.0 is the max returned value.
 def obj_set_cover_ratio(solution: Union[Tensor, List[int], np.array], num_items: int, item_matrix: List[List[int]]):
-    num_sets = len(solution)
-    covered_items = set()
-    for i in range(num_sets):
-        assert solution[i] in [0, 1]
-        if solution[i] == 1:
-            for j in range(len(item_matrix[i])):
-                covered_items.add(item_matrix[i][j])
-    num_covered = 0
-    items = set(np.array(range(num_items)) + 1)
-    for i in covered_items:
-        if i in items:
-            num_covered += 1
+    num_covered = calc_num_covered_items(solution, num_items, item_matrix)
     obj = float(num_covered) / float(num_items)
     return obj
 
-# return negative value. the smaller abs of obj, the better.
-def obj_set_cover(solution: Union[Tensor, List[int], np.array], num_items: int, item_matrix: List[List[int]]):
-    num_sets = len(solution)
-    covered_items = set()
-    selected_sets = []
-    for i in range(num_sets):
+# the number of items in [1, num_items] covered by the selected sets
+def calc_num_covered_items(solution: Union[Tensor, List[int], np.array], num_items: int, item_matrix: List[List[int]]) -> int:
+    covered = np.zeros(num_items + 1, dtype=bool)
+    for i in range(len(solution)):
         assert solution[i] in [0, 1]
         if solution[i] == 1:
-            selected_sets.append(i + 1)
-            for j in range(len(item_matrix[i])):
-                covered_items.add(item_matrix[i][j])
-    num_covered = 0
-    items = set(np.array(range(num_items)) + 1)
-    for i in covered_items:
-        if i in items:
-            num_covered += 1
+            items = np.asarray(item_matrix[i], dtype=np.int64)
+            covered[items[(items >= 1) & (items <= num_items)]] = True
+    return int(np.count_nonzero(covered))
+
+# return negative value. the smaller abs of obj, the better.
+def obj_set_cover(solution: Union[Tensor, List[int], np.array], num_items: int, item_matrix: List[List[int]]):
+    num_covered = calc_num_covered_items(solution, num_items, item_matrix)
     if num_covered == num_items:
-        obj = -len(selected_sets)
+        obj = -int(sum(1 for x in solution if x == 1))
     else:
         obj = -INF
     return obj
@@ -575,48 +582,63 @@ def calc_result_file_name(file: str, add_tail: str= ''):
         new_file = new_file.replace('.txt', '') + add_tail + '.txt'
     return new_file
 
+# the relative gap between obj and its bound, the same as the gap of gurobi
+def calc_gap(obj: float, obj_bound: float) -> float:
+    return abs(obj - obj_bound) / (abs(obj) + 1e-6)
+
+# the comment lines '// key: value' of a result file, e.g., {'obj': 100.0, 'running_duration': 3600.0, ...}.
+# The values are float if possible, and str otherwise.
+def read_result_statistics(filename: str) -> dict:
+    statistics = {}
+    with open(filename, 'r') as file:
+        for line in file:
+            if not line.startswith('//') or ':' not in line:
+                continue
+            key, value = line[2:].split(':', 1)
+            key, value = key.strip(), value.strip()
+            if key in statistics:
+                continue
+            try:
+                statistics[key] = float(value)
+            except ValueError:
+                statistics[key] = value
+    return statistics
+
 # For example, syn_10_21_3600.txt, the prefix is 'syn_10_', time_limit is 3600 (seconds).
-# The gap and running_duration are also be calculated.
+# The gap, obj_bound and running_duration are also be calculated, and the gap_to_bound is calculated from obj and
+# obj_bound, which is written by gurobi, or by write_result2 (see bounds.py).
 def calc_avg_std_of_obj(directory: str, prefix: str, time_limit: int):
     init_time_limit = copy.deepcopy(time_limit)
     objs = []
     gaps = []
     obj_bounds = []
+    gaps_to_bound = []
     running_durations = []
     suffix = str(time_limit)
     files = calc_files_with_prefix_suffix(directory, prefix, suffix)
     for i in range(len(files)):
-        with open(files[i], 'r') as file:
-            line = file.readline()
-            assert 'obj' in line
-            obj = float(line.split('obj:')[1].split('\n')[0])
-            objs.append(obj)
-
-            line2 = file.readline()
-            running_duration_ = line2.split('running_duration:')
-            running_duration = float(running_duration_[1]) if len(running_duration_) >= 2 else None
-            running_durations.append(running_duration)
-
-            line3 = file.readline()
-            gap_ = line3.split('gap:')
-            gap = float(gap_[1]) if len(gap_) >= 2 else None
-            gaps.append(gap)
-
-            line4 = file.readline()
-            obj_bound_ = line4.split('obj_bound:')
-            obj_bound = float(obj_bound_[1]) if len(obj_bound_) >= 2 else None
-            obj_bounds.append(obj_bound)
+        statistics = read_result_statistics(files[i])
+        assert 'obj' in statistics
+        obj = statistics['obj']
+        objs.append(obj)
+        running_durations.append(statistics.get('running_duration'))
+        gaps.append(statistics.get('gap'))
+        obj_bound = statistics.get('obj_bound')
+        obj_bound = obj_bound if isinstance(obj_bound, float) else None  # 'obj_bound: None' if it failed
+        obj_bounds.append(obj_bound)
+        gaps_to_bound.append(calc_gap(obj, obj_bound) if obj_bound is not None else None)
     if len(objs) == 0:
         return
     avg_obj = np.average(objs)
     std_obj = np.std(objs)
-    avg_running_duration = np.average(running_durations)
+    avg_running_duration = np.average(running_durations) if None not in running_durations else None
     avg_gap = np.average(gaps) if None not in gaps else None
     avg_obj_bound = np.average(obj_bounds) if None not in obj_bounds else None
-    print(f'{directory} prefix {prefix}, suffix {suffix}: avg_obj {avg_obj}, std_obj {std_obj}, avg_running_duration {avg_running_duration}, avg_gap {avg_gap}, avg_obj_bound {avg_obj_bound}')
+    avg_gap_to_bound = np.average(gaps_to_bound) if None not in gaps_to_bound else None
+    print(f'{directory} prefix {prefix}, suffix {suffix}: avg_obj {avg_obj}, std_obj {std_obj}, avg_running_duration {avg_running_duration}, avg_gap {avg_gap}, avg_obj_bound {avg_obj_bound}, avg_gap_to_bound {avg_gap_to_bound}')
     if time_limit != init_time_limit:
         print()
-    return {(prefix, time_limit): (avg_obj, std_obj, avg_running_duration, avg_gap, avg_obj_bound)}
+    return {(prefix, time_limit): (avg_obj, std_obj, avg_running_duration, avg_gap, avg_obj_bound, avg_gap_to_bound)}
 
 def calc_avg_std_of_objs(directory: str, prefixes: List[str], time_limits: List[int]):
     res = []
@@ -858,8 +880,19 @@ def convert_matrix_to_vector(matrix):
     vector = [row[i + 1:] for i, row in enumerate(matrix)]
     return th.hstack(vector)
 
-def write_result2(obj, running_duration, num_nodes, alg_name, filename: str):
-    add_tail = '_' + str(int(running_duration)) if 'data' in filename else None
+# the bound of maxcut written with the results of a data file (see bounds.py), None if not calculated or failed
+def calc_obj_bound_for_result(filename: str) -> Optional[float]:
+    if OBJ_BOUND_METHOD is None or PROBLEM != Problem.maxcut or 'data' not in filename:
+        return None
+    return calc_obj_bound_of_file(filename, OBJ_BOUND_METHOD)
+
+# the bound is written if OBJ_BOUND_METHOD is not None. obj_bound is the precomputed bound, e.g., by AnytimeRecorder,
+# and it is computed here (once per file) if None. 'obj_bound: None' is written if the computation fails.
+# If time_limit is given, the result file is named by time_limit instead of running_duration, and a run that ends
+# before time_limit is written with reached: False.
+def write_result2(obj, running_duration, num_nodes, alg_name, filename: str, obj_bound: Optional[float] = None,
+                  time_limit: Optional[int] = None):
+    add_tail = '_' + str(int(running_duration if time_limit is None else time_limit)) if 'data' in filename else None
     new_filename = calc_result_file_name(filename, add_tail)
     with open(new_filename, 'w', encoding="UTF-8") as new_file:
         prefix = '// '
@@ -867,6 +900,71 @@ def write_result2(obj, running_duration, num_nodes, alg_name, filename: str):
         new_file.write(f"{prefix}running_duration: {running_duration}\n")
         new_file.write(f"// num_nodes: {num_nodes}\n")
         new_file.write(f"{prefix}alg_name: {alg_name}\n")
+        if time_limit is not None:
+            new_file.write(f"{prefix}time_limit: {time_limit}\n")
+            new_file.write(f"{prefix}reached: {running_duration >= time_limit}\n")
+        if OBJ_BOUND_METHOD is not None and PROBLEM == Problem.maxcut and 'data' in filename:
+            obj_bound = calc_obj_bound_for_result(filename) if obj_bound is None else obj_bound
+            new_file.write(f"{prefix}obj_bound: {obj_bound}\n")
+            if obj_bound is not None:
+                new_file.write(f"{prefix}gap_to_bound: {calc_gap(obj, obj_bound)}\n")
+
+# Anytime recording of a solver loop. The loop reports its incumbents (the higher obj, the better) by report(),
+# and a result file in the format of write_result2 is written at each running duration in running_durations, e.g.,
+# syn_10_21_300.txt, syn_10_21_600.txt, ..., with the best obj found before that duration.
+# report() and is_over() return True after the last duration, so the loop can stop, e.g.,
+#     recorder = AnytimeRecorder(filename, alg_name, num_nodes)
+#     for step in range(num_steps):
+#         ...
+#         if recorder.report(score, solution):
+#             break
+#     recorder.finish()
+# finish() writes the remaining durations with the final incumbent if the loop ends before the last duration, where
+# running_duration is the actual elapsed time and the rows are marked by reached: False.
+class AnytimeRecorder:
+    def __init__(self, filename: str, alg_name: str, num_nodes: int, running_durations: List[int] = None,
+                 start_time: float = None):
+        self.filename = filename
+        self.alg_name = alg_name
+        self.num_nodes = num_nodes
+        self.running_durations = sorted(RUNNING_DURATIONS if running_durations is None else running_durations)
+        # the bound is computed before the clock of the solver, and the time is excluded if start_time is given
+        bound_start_time = time.time()
+        self.obj_bound = calc_obj_bound_for_result(filename)
+        bound_duration = time.time() - bound_start_time
+        self.start_time = time.time() if start_time is None else start_time + bound_duration
+        self.num_written = 0  # the running_durations[:num_written] are written
+        self.obj = None
+        self.solution = None
+
+    def write_reached_durations(self, running_duration: float):
+        while self.num_written < len(self.running_durations) \
+                and self.running_durations[self.num_written] <= running_duration:
+            if self.obj is not None:
+                write_result2(self.obj, self.running_durations[self.num_written], self.num_nodes, self.alg_name, self.filename,
+                              obj_bound=self.obj_bound)
+            self.num_written += 1
+
+    def is_over(self) -> bool:
+        self.write_reached_durations(time.time() - self.start_time)
+        return self.num_written == len(self.running_durations)
+
+    def report(self, obj, solution=None) -> bool:
+        # the durations passed before this report are written with the previous incumbent
+        over = self.is_over()
+        if not over and (self.obj is None or obj > self.obj):
+            self.obj = obj
+            self.solution = copy.deepcopy(solution)
+        return over
+
+    def finish(self):
+        running_duration = time.time() - self.start_time
+        self.write_reached_durations(running_duration)
+        while self.num_written < len(self.running_durations):
+            if self.obj is not None:
+                write_result2(self.obj, running_duration, self.num_nodes, self.alg_name, self.filename,
+                              obj_bound=self.obj_bound, time_limit=self.running_durations[self.num_written])
+            self.num_written += 1
 
 def write_result_set_cover(obj, running_duration, num_items: int, num_sets: int, alg_name, filename: str):
     add_tail = '_' + str(int(running_duration)) if 'data' in filename else None
@@ -899,7 +997,7 @@ def run_greedy_over_multiple_files(alg, alg_name, num_steps, directory_data: str
                 alg_name = 'greedy'
                 write_result_set_cover(score, running_duration, num_items, num_sets, alg_name, filename)
             else:
-                graph = read_nxgraph(filename)
+                graph = read_graph(filename)
                 score, solution, scores = alg(num_steps, graph)
                 scoress.append(scores)
                 running_duration = time.time() - start_time
@@ -920,7 +1018,7 @@ def run_sdp_over_multiple_files(alg, alg_name, directory_data: str, prefixes: Li
             scores.append(score)
             print(f"score: {score}")
             running_duration = time.time() - start_time
-            graph = read_nxgraph(filename)
+            graph = read_graph_csr(filename)
             num_nodes = int(graph.number_of_nodes())
             write_result2(score, running_duration, num_nodes, alg_name, filename)
     return scores
@@ -0,0 +1,67 @@
+import numpy as np
+import networkx as nx
+from typing import List, Union
+
+from methods.config import INF
+from methods.graph_csr import GraphCSR
+
+
+# Incremental counters of a node selection (solution[i] = 1 if node i is selected) for minimum_vertex_cover and
+# maximum_independent_set. selected_neighbor_counts[i] is the number of selected neighbors of node i, so that
+# - node i can leave a vertex cover iff it has no unselected neighbor, i.e., degree(i) - selected_neighbor_counts[i] == 0,
+# - node i can join an independent set iff selected_neighbor_counts[i] == 0.
+# The numbers of uncovered edges (both ends unselected) and conflicting edges (both ends selected) are kept as well,
+# so flipping a node costs O(deg) and the objectives are read in O(1), instead of scanning all the edges.
+class VertexSelectionCounter:
+    def __init__(self, graph: Union[nx.Graph, GraphCSR], solution: Union[List[int], np.array]):
+        self.graph = graph if isinstance(graph, GraphCSR) else GraphCSR.from_nxgraph(graph)
+        self.solution = np.array(solution, dtype=np.int8)
+        assert self.solution.shape == (self.graph.num_nodes,)
+
+        edge_n0s, edge_n1s = self.graph.edge_n0s, self.graph.edge_n1s
+        selected0, selected1 = self.solution[edge_n0s], self.solution[edge_n1s]
+        self.selected_neighbor_counts = np.bincount(edge_n0s, weights=selected1, minlength=self.graph.num_nodes) \
+            + np.bincount(edge_n1s, weights=selected0, minlength=self.graph.num_nodes)
+        self.selected_neighbor_counts = self.selected_neighbor_counts.astype(np.int64)
+        self.num_uncovered_edges = int(np.count_nonzero((selected0 == 0) & (selected1 == 0)))
+        self.num_conflict_edges = int(np.count_nonzero((selected0 == 1) & (selected1 == 1)))
+        self.num_selected = int(self.solution.sum())
+
+    def num_unselected_neighbors(self, i: int) -> int:
+        return int(self.graph.degrees[i] - self.selected_neighbor_counts[i])
+
+    def flip(self, i: int):
+        num_selected_neighbors = int(self.selected_neighbor_counts[i])
+        num_unselected_neighbors = int(self.graph.degrees[i]) - num_selected_neighbors
+        if self.solution[i] == 0:
+            self.num_conflict_edges += num_selected_neighbors
+            self.num_uncovered_edges -= num_unselected_neighbors
+            delta = 1
+        else:
+            self.num_conflict_edges -= num_selected_neighbors
+            self.num_uncovered_edges += num_unselected_neighbors
+            delta = -1
+        np.add.at(self.selected_neighbor_counts, self.graph.neighbors(i), delta)
+        self.num_selected += delta
+        self.solution[i] ^= 1
+
+    # the same as obj_minimum_vertex_cover
+    def obj_minimum_vertex_cover(self, need_check_cover_all_edges=True) -> float:
+        if need_check_cover_all_edges and self.num_uncovered_edges > 0:
+            return -INF
+        return -self.num_selected
+
+    # the same as obj_maximum_independent_set, for the solutions with both 0 and 1
+    def obj_maximum_independent_set(self) -> float:
+        if self.num_conflict_edges > 0:
+            return -INF
+        return self.num_selected
+
+    # the objective of maximum_independent_set after flipping the nodes, and the counter is restored. O(sum of deg)
+    def obj_maximum_independent_set_after_flips(self, nodes: List[int]) -> float:
+        for node in nodes:
+            self.flip(node)
+        obj = self.obj_maximum_independent_set()
+        for node in reversed(nodes):
+            self.flip(node)
+        return obj
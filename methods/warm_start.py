@@ -0,0 +1,63 @@
+import sys
+sys.path.append('../')
+import time
+from typing import List, Union
+import numpy as np
+import networkx as nx
+
+from methods.config import *
+from methods.graph_csr import GraphCSR
+
+
+# The heuristic solutions used as the MIP starts of gurobi.py and scip.py. solution[i] is the value of x[i], i.e.,
+# the part of node i for maxcut and graph_partitioning, and 1 if node i is selected for minimum_vertex_cover and
+# maximum_independent_set, the same as the x vars of the models.
+# - 'greedy': the greedy algorithm of the problem in greedy.py
+# - 'simulated_annealing': simulated_annealing in simulated_annealing.py, which starts from the greedy solution
+# - 'local_search': the local search of L2A (SolverLocalSearch), only for maxcut
+WARM_START_ALGS = ['greedy', 'simulated_annealing', 'local_search']
+
+
+# return (score, solution, running_duration)
+def calc_warm_start_solution(alg_name: str, graph: Union[nx.Graph, GraphCSR],
+                             num_sims: int = 64, num_searches: int = 16) -> (float, List[int], float):
+    assert alg_name in WARM_START_ALGS
+    start_time = time.time()
+    num_nodes = int(graph.number_of_nodes())
+    if alg_name == 'greedy':
+        from greedy import (greedy_maxcut,
+                            greedy_graph_partitioning,
+                            greedy_minimum_vertex_cover,
+                            greedy_maximum_independent_set)
+        if PROBLEM == Problem.maxcut:
+            score, solution, _ = greedy_maxcut(None, graph)
+        elif PROBLEM == Problem.graph_partitioning:
+            score, solution, _ = greedy_graph_partitioning(num_nodes, graph)
+        elif PROBLEM == Problem.minimum_vertex_cover:
+            score, solution, _ = greedy_minimum_vertex_cover(None, graph)
+        elif PROBLEM == Problem.maximum_independent_set:
+            score, solution, _ = greedy_maximum_independent_set(100 * num_nodes, graph)
+        else:
+            raise ValueError(f'the warm start of {PROBLEM} is not supported')
+    elif alg_name == 'simulated_annealing':
+        from simulated_annealing import simulated_annealing
+        assert PROBLEM in [Problem.maxcut, Problem.graph_partitioning,
+                           Problem.minimum_vertex_cover, Problem.maximum_independent_set]
+        score, solution, _ = simulated_annealing(init_temperature=4, num_steps=None, graph=graph)
+    else:
+        assert PROBLEM == Problem.maxcut
+        from methods.L2A.maxcut_simulator import SimulatorMaxcut
+        from methods.L2A.maxcut_local_search import SolverLocalSearch
+        graph_csr = graph if isinstance(graph, GraphCSR) else GraphCSR.from_nxgraph(graph)
+        sim = SimulatorMaxcut(graph_list=graph_csr)
+        solver = SolverLocalSearch(simulator=sim, num_nodes=num_nodes)
+        solver.reset(sim.generate_xs_randomly(num_sims=num_sims).bool())
+        for _ in range(num_searches):
+            solver.random_search(num_iters=8)
+        best_id = int(solver.good_vs.argmax())
+        score = float(solver.good_vs[best_id])
+        solution = solver.good_xs[best_id].int().tolist()
+    solution = np.asarray(solution, dtype=np.int64).tolist()
+    running_duration = time.time() - start_time
+    print(f'warm start, alg: {alg_name}, score: {score}, running_duration: {running_duration}')
+    return score, solution, running_duration